@@ -0,0 +1,356 @@
+"""In-process fake of the parts of the kubernetes API server used for secrets"""
+
+import copy
+import http
+import itertools
+import json
+import queue
+import threading
+import time
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+
+def make_secret(
+    name: str,
+    namespace: str,
+    data: dict[str, str] | None = None,
+    labels: dict[str, str] | None = None,
+    type: str = "Opaque",
+) -> dict:
+    return {
+        "apiVersion": "v1",
+        "kind": "Secret",
+        "metadata": {"name": name, "namespace": namespace, "labels": labels or {}},
+        "type": type,
+        "data": data or {},
+    }
+
+
+def matches_selector(values: dict, selector: str) -> bool:
+    """Equality based selectors only, e.g. `owner=me,type=Opaque`"""
+    for requirement in filter(None, selector.split(",")):
+        key, _, value = requirement.partition("=")
+        if values.get(key) != value:
+            return False
+    return True
+
+
+def unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+class PatchFailed(Exception):
+    pass
+
+
+def apply_json_patch(document: dict, operations: list[dict]) -> dict:
+    document = copy.deepcopy(document)
+    for operation in operations:
+        *parents, last = map(unescape, operation["path"].split("/")[1:])
+        target = document
+        for token in parents:
+            if target.get(token) is None:
+                target[token] = {}
+            target = target[token]
+        if operation["op"] == "test":
+            if target.get(last) != operation["value"]:
+                raise PatchFailed(f"test of {operation['path']} failed")
+        elif operation["op"] in ("add", "replace"):
+            target[last] = operation["value"]
+        elif operation["op"] == "remove":
+            if last not in target:
+                raise PatchFailed(f"{operation['path']} does not exist")
+            del target[last]
+    return document
+
+
+def merge_patch(document: dict, patch: dict) -> dict:
+    document = copy.deepcopy(document)
+    for key, value in patch.items():
+        if value is None:
+            document.pop(key, None)
+        elif isinstance(value, dict) and isinstance(document.get(key), dict):
+            document[key] = merge_patch(document[key], value)
+        else:
+            document[key] = value
+    return document
+
+
+# as returned by /version, which the app calls to check the connection
+VERSION_INFO = {
+    "major": "1",
+    "minor": "30",
+    "gitVersion": "v1.30.0-fake",
+    "gitCommit": "fake",
+    "gitTreeState": "clean",
+    "buildDate": "2024-01-01T00:00:00Z",
+    "goVersion": "go1.22.0",
+    "compiler": "gc",
+    "platform": "linux/amd64",
+}
+
+
+class FakeApiServer:
+    """Serves the version, and list, watch, read, create, patch and delete of secrets.
+
+    Every request except watches is delayed by `latency` seconds, to simulate
+    the round trip to a real API server.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+        self._secrets: dict[tuple[str, str], dict] = {}
+        self._resource_versions = itertools.count(1)
+        self._watchers: list[queue.Queue] = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host!s}:{port}"
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def write_kubeconfig(self, path: str):
+        # json is valid yaml
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "apiVersion": "v1",
+                    "kind": "Config",
+                    "clusters": [{"name": "fake", "cluster": {"server": self.url}}],
+                    "users": [{"name": "fake", "user": {"token": "fake"}}],
+                    "contexts": [
+                        {"name": "fake", "context": {"cluster": "fake", "user": "fake"}}
+                    ],
+                    "current-context": "fake",
+                },
+                f,
+            )
+
+    def put(self, secret: dict) -> dict:
+        """Create or replace a secret, notifying the watchers"""
+        metadata = secret["metadata"]
+        key = (metadata["namespace"], metadata["name"])
+        with self._lock:
+            event_type = "MODIFIED" if key in self._secrets else "ADDED"
+            metadata.setdefault("uid", str(uuid.uuid4()))
+            metadata["resourceVersion"] = str(next(self._resource_versions))
+            self._secrets[key] = secret
+            self._notify(event_type, secret)
+        return secret
+
+    def remove(self, namespace: str, name: str) -> dict:
+        with self._lock:
+            secret = self._secrets.pop((namespace, name))
+            secret = copy.deepcopy(secret)
+            secret["metadata"]["resourceVersion"] = str(next(self._resource_versions))
+            self._notify("DELETED", secret)
+        return secret
+
+    def get(self, namespace: str, name: str) -> dict | None:
+        with self._lock:
+            return self._secrets.get((namespace, name))
+
+    def list(self, namespace: str) -> list[dict]:
+        with self._lock:
+            return [
+                secret
+                for (secret_namespace, name), secret in sorted(self._secrets.items())
+                if secret_namespace == namespace
+            ]
+
+    def _notify(self, event_type: str, secret: dict):
+        for watcher in self._watchers:
+            watcher.put({"type": event_type, "object": copy.deepcopy(secret)})
+
+    def _handler_class(self) -> type[BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(_Handler):
+            fake = server
+
+        return Handler
+
+
+class _Handler(BaseHTTPRequestHandler):
+    fake: FakeApiServer
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, don't wait for delayed acks
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+    def _handle(self, method: str):
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        parts = url.path.strip("/").split("/")
+        length = int(self.headers.get("Content-Length") or 0)
+        body: Any = json.loads(self.rfile.read(length)) if length else None
+
+        if method == "GET" and parts == ["version"]:
+            return self._send_json(VERSION_INFO)
+        if parts[:3] != ["api", "v1", "namespaces"] or parts[4:5] != ["secrets"]:
+            return self._send_status(http.HTTPStatus.NOT_FOUND, "not found")
+        namespace = parts[3]
+        name = parts[5] if len(parts) > 5 else None
+
+        if method == "GET" and name is None and query.get("watch", "").lower() == "true":
+            return self._watch(namespace, query)
+
+        self.fake.requests += 1
+        if self.fake.latency:
+            time.sleep(self.fake.latency)
+
+        if name is None and method == "GET":
+            self._list(namespace, query)
+        elif name is None and method == "POST":
+            self._create(namespace, body)
+        elif name is None:
+            self._send_status(http.HTTPStatus.METHOD_NOT_ALLOWED, "not allowed")
+        elif (secret := self.fake.get(namespace, name)) is None:
+            self._send_status(http.HTTPStatus.NOT_FOUND, f'secrets "{name}" not found')
+        elif method == "GET":
+            self._send_json(secret)
+        elif method == "PATCH":
+            self._patch(secret, body)
+        elif method == "DELETE":
+            self._delete(secret, body)
+
+    def _list(self, namespace: str, query: dict):
+        secrets = [
+            secret
+            for secret in self.fake.list(namespace)
+            if matches_selector(
+                secret["metadata"].get("labels") or {}, query.get("labelSelector", "")
+            )
+            and matches_selector(
+                {"type": secret["type"]}, query.get("fieldSelector", "")
+            )
+        ]
+        offset = int(query.get("continue") or 0)
+        limit = int(query.get("limit") or 0) or len(secrets)
+        page = secrets[offset:offset + limit]
+        more = offset + limit < len(secrets)
+        self._send_json(
+            {
+                "apiVersion": "v1",
+                "kind": "SecretList",
+                "metadata": {
+                    "resourceVersion": str(next(self.fake._resource_versions)),
+                    "continue": str(offset + limit) if more else None,
+                },
+                "items": page,
+            }
+        )
+
+    def _create(self, namespace: str, body: dict):
+        name = body["metadata"]["name"]
+        if self.fake.get(namespace, name) is not None:
+            return self._send_status(
+                http.HTTPStatus.CONFLICT, f'secrets "{name}" already exists'
+            )
+        body["metadata"]["namespace"] = namespace
+        self._send_json(self.fake.put(body), http.HTTPStatus.CREATED)
+
+    def _patch(self, secret: dict, body: Any):
+        if self.headers.get("Content-Type") == "application/json-patch+json":
+            try:
+                patched = apply_json_patch(secret, body)
+            except PatchFailed as e:
+                return self._send_status(http.HTTPStatus.UNPROCESSABLE_ENTITY, str(e))
+        else:
+            patched = merge_patch(secret, body)
+        # a resourceVersion in the patch is a precondition
+        expected = patched["metadata"].get("resourceVersion")
+        if expected != secret["metadata"]["resourceVersion"]:
+            return self._send_status(http.HTTPStatus.CONFLICT, "object has been modified")
+        self._send_json(self.fake.put(patched))
+
+    def _delete(self, secret: dict, body: dict | None):
+        expected = ((body or {}).get("preconditions") or {}).get("resourceVersion")
+        if expected and expected != secret["metadata"]["resourceVersion"]:
+            return self._send_status(http.HTTPStatus.CONFLICT, "object has been modified")
+        metadata = secret["metadata"]
+        self.fake.remove(metadata["namespace"], metadata["name"])
+        self._send_status(http.HTTPStatus.OK, "deleted", status="Success")
+
+    def _watch(self, namespace: str, query: dict):
+        events: queue.Queue = queue.Queue()
+        self.fake._watchers.append(events)
+        deadline = time.monotonic() + float(query.get("timeoutSeconds") or 300)
+        self.send_response(http.HTTPStatus.OK)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            while not self.fake._stopped.is_set() and time.monotonic() < deadline:
+                try:
+                    event = events.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                metadata = event["object"]["metadata"]
+                if metadata["namespace"] == namespace and matches_selector(
+                    metadata.get("labels") or {}, query.get("labelSelector", "")
+                ):
+                    self._write_chunk(json.dumps(event).encode() + b"\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.fake._watchers.remove(events)
+            self.close_connection = True
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_status(
+        self, code: http.HTTPStatus, message: str, status: str = "Failure"
+    ):
+        self._send_json(
+            {
+                "apiVersion": "v1",
+                "kind": "Status",
+                "status": status,
+                "message": message,
+                "reason": code.phrase,
+                "code": code.value,
+            },
+            code,
+        )
+
+    def _send_json(self, body: dict, code: http.HTTPStatus = http.HTTPStatus.OK):
+        content = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
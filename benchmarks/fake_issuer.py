@@ -0,0 +1,77 @@
+"""In-process fake OIDC issuer serving a JWKS and issuing tokens signed with it"""
+
+import http
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cryptography.hazmat.primitives.asymmetric import rsa
+import jwt
+
+KEY_ID = "benchmark"
+
+
+class FakeIssuer:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+        self._private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host!s}:{port}"
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def token(self, subject: str, expires_in: float = 3600) -> str:
+        return jwt.encode(
+            {"sub": subject, "aud": "account", "exp": time.time() + expires_in},
+            self._private_key,
+            algorithm="RS256",
+            headers={"kid": KEY_ID},
+        )
+
+    def jwks(self) -> dict:
+        jwk = jwt.algorithms.RSAAlgorithm.to_jwk(
+            self._private_key.public_key(), as_dict=True
+        )
+        return {"keys": [{**jwk, "kid": KEY_ID, "use": "sig", "alg": "RS256"}]}
+
+    def _handler_class(self) -> type[BaseHTTPRequestHandler]:
+        issuer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                issuer.requests += 1
+                if issuer.latency:
+                    time.sleep(issuer.latency)
+                if self.path == "/.well-known/openid-configuration":
+                    body = {"issuer": issuer.url, "jwks_uri": f"{issuer.url}/certs"}
+                elif self.path == "/certs":
+                    body = issuer.jwks()
+                else:
+                    self.send_error(http.HTTPStatus.NOT_FOUND)
+                    return
+                content = json.dumps(body).encode()
+                self.send_response(http.HTTPStatus.OK)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+        return Handler
@@ -0,0 +1,67 @@
+"""Import time of the app per top-level package, from `python -X importtime`.
+
+Run from the repository root, e.g.:
+
+    python -m benchmarks.import_report --top 15
+    python -m benchmarks.import_report --budget-ms 1500
+"""
+
+import argparse
+import collections
+import re
+import subprocess
+import sys
+
+# e.g. "import time:       412 |      20107 |   kubernetes"
+IMPORT_TIME_LINE = re.compile(
+    r"import time:\s+(?P<self>\d+) \|\s+(?P<cumulative>\d+)"
+    r" \|(?P<indent>\s+)(?P<name>\S+)"
+)
+
+
+def import_times(module: str) -> tuple[dict[str, float], float]:
+    """Self time in ms per top-level package, and the total"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    per_package: dict[str, float] = collections.defaultdict(float)
+    total = 0.0
+    for line in result.stderr.splitlines():
+        if not (match := IMPORT_TIME_LINE.match(line)):
+            continue
+        per_package[match["name"].split(".")[0]] += int(match["self"]) / 1000
+        # top-level imports are indented by a single space
+        if len(match["indent"]) == 1:
+            total += int(match["cumulative"]) / 1000
+    return per_package, total
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="my_credentials")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        help="exit with 1 if importing takes longer than this",
+    )
+    args = parser.parse_args(argv)
+
+    per_package, total = import_times(args.module)
+    ranked = sorted(per_package.items(), key=lambda item: item[1], reverse=True)
+    print(f"{'package':<30} {'ms':>9}")
+    for package, took in ranked[: args.top]:
+        print(f"{package:<30} {took:>9.1f}")
+    print(f"{'total':<30} {total:>9.1f}")
+
+    if args.budget_ms is not None and total > args.budget_ms:
+        print(f"Importing {args.module} took longer than {args.budget_ms:.0f}ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,341 @@
+"""Endpoint latency benchmark against a fake API server and OIDC issuer.
+
+Run from the repository root, e.g.:
+
+    python -m benchmarks.run --secrets 200 --latency 0.005 --concurrency 1,8,32
+    python -m benchmarks.run --save-baseline
+    python -m benchmarks.run --baseline benchmarks/baseline.json
+
+Settings of the app (e.g. `SECRET_CACHE_ENABLED`) are taken from the environment.
+"""
+
+import argparse
+import asyncio
+import base64
+import dataclasses
+import itertools
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from benchmarks.fake_apiserver import FakeApiServer, make_secret
+from benchmarks.fake_issuer import FakeIssuer
+
+NAMESPACE = "benchmark"
+USER = "benchmark-user"
+DEFAULT_BASELINE = Path(__file__).parent / "baseline.json"
+
+
+@dataclasses.dataclass
+class Result:
+    scenario: str
+    concurrency: int
+    requests: int
+    errors: int
+    p50_ms: float
+    p99_ms: float
+    throughput: float
+
+    @property
+    def key(self) -> str:
+        return f"{self.scenario}@{self.concurrency}"
+
+
+def percentile(latencies: list[float], p: float) -> float:
+    if len(latencies) < 2:
+        return latencies[0] if latencies else 0.0
+    return statistics.quantiles(latencies, n=100, method="inclusive")[int(p) - 1]
+
+
+def b64(value: str) -> str:
+    return base64.b64encode(value.encode()).decode()
+
+
+def seed_secret(api_server: FakeApiServer, name: str, label: str):
+    owner_key, _, owner_value = label.partition("=")
+    api_server.put(
+        make_secret(
+            name,
+            NAMESPACE,
+            data={"username": b64(name), "password": b64("secret" * 4)},
+            labels={owner_key: owner_value},
+        )
+    )
+
+
+def scenarios(
+    client, api_server: FakeApiServer, headers: dict, secrets: int, label: str
+) -> dict[str, tuple[Callable[[int], Awaitable], Callable[[int], None]]]:
+    """Request per scenario for the i-th call, and setup before the i-th call"""
+    form = {**headers, "Content-Type": "application/x-www-form-urlencoded"}
+    run = itertools.count()
+
+    def existing(i: int) -> str:
+        return f"secret-{i % secrets}"
+
+    def no_setup(i: int):
+        pass
+
+    def create(i: int) -> Awaitable:
+        return client.post(
+            "/create/",
+            data=f"credentials_name=new-{next(run)}&create=true&type=Opaque"
+            "&secret_key=key&secret_value=value",
+            headers=form,
+            allow_redirects=False,
+        )
+
+    def delete_setup(i: int):
+        seed_secret(api_server, f"to-delete-{i}", label)
+
+    return {
+        "list": (lambda i: client.get("/", headers=headers), no_setup),
+        "get-credentials": (
+            lambda i: client.get("/get-credentials", headers=headers),
+            no_setup,
+        ),
+        "detail": (
+            lambda i: client.get(f"/credentials-detail/{existing(i)}", headers=headers),
+            no_setup,
+        ),
+        "create": (create, no_setup),
+        "update": (
+            lambda i: client.post(
+                f"/credentials-detail/{existing(i)}",
+                data=f"secret_key=username&secret_value=value-{i}",
+                headers=form,
+                allow_redirects=False,
+            ),
+            no_setup,
+        ),
+        "delete": (
+            lambda i: client.delete(
+                f"/credentials-detail/to-delete-{i}", headers=headers
+            ),
+            delete_setup,
+        ),
+    }
+
+
+async def measure(
+    scenario: str,
+    request: Callable[[int], Awaitable],
+    setup: Callable[[int], None],
+    concurrency: int,
+    total: int,
+    warmup: int,
+    first: int,
+) -> Result:
+    """Send `total` requests from `concurrency` concurrent workers.
+
+    The calls are numbered from `first`, so that each one can use its own secret.
+    """
+    for i in range(first, first + warmup):
+        setup(i)
+        await request(i)
+
+    measured = range(first + warmup, first + warmup + total)
+    for i in measured:
+        setup(i)
+    calls = iter(measured)
+    latencies: list[float] = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        for i in calls:
+            start = time.perf_counter()
+            response = await request(i)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - start
+
+    return Result(
+        scenario=scenario,
+        concurrency=concurrency,
+        requests=total,
+        errors=errors,
+        p50_ms=percentile(latencies, 50) * 1000,
+        p99_ms=percentile(latencies, 99) * 1000,
+        throughput=total / duration,
+    )
+
+
+def regressions(
+    results: list[Result], baseline: dict[str, dict], tolerance: float
+) -> list[str]:
+    found = []
+    for result in results:
+        if (previous := baseline.get(result.key)) is None:
+            continue
+        if result.p99_ms > previous["p99_ms"] * (1 + tolerance):
+            found.append(
+                f"{result.key}: p99 {result.p99_ms:.1f}ms > {previous['p99_ms']:.1f}ms"
+            )
+        if result.throughput < previous["throughput"] * (1 - tolerance):
+            found.append(
+                f"{result.key}: throughput {result.throughput:.0f}/s "
+                f"< {previous['throughput']:.0f}/s"
+            )
+        if result.errors > previous.get("errors", 0):
+            found.append(f"{result.key}: {result.errors} errors")
+    return found
+
+
+def print_table(results: list[Result]):
+    print(
+        f"{'scenario':<16} {'conc':>5} {'reqs':>6} {'errors':>6} "
+        f"{'p50 ms':>9} {'p99 ms':>9} {'req/s':>9}"
+    )
+    for r in results:
+        print(
+            f"{r.scenario:<16} {r.concurrency:>5} {r.requests:>6} {r.errors:>6} "
+            f"{r.p50_ms:>9.2f} {r.p99_ms:>9.2f} {r.throughput:>9.1f}"
+        )
+
+
+async def run(args: argparse.Namespace) -> list[Result]:
+    api_server = FakeApiServer(latency=args.latency)
+    issuer = FakeIssuer(latency=args.latency)
+    api_server.start()
+    issuer.start()
+
+    kubeconfig = tempfile.NamedTemporaryFile(suffix=".yaml", delete=False)
+    api_server.write_kubeconfig(kubeconfig.name)
+    os.environ.update(
+        {
+            "KUBECONFIG": kubeconfig.name,
+            "CREDENTIALS_NAMESPACE": NAMESPACE,
+            "oidc-issuer-url": issuer.url,
+        }
+    )
+    os.environ.pop("CRED_ENV", None)
+
+    # the settings are read on import
+    from async_asgi_testclient import TestClient
+
+    from my_credentials import app
+    from my_credentials.views import MY_SECRETS_LABEL_SELECTOR
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+        logging.getLogger("app.access").setLevel(logging.WARNING)
+
+    for i in range(args.secrets):
+        seed_secret(api_server, f"secret-{i}", MY_SECRETS_LABEL_SELECTOR)
+
+    headers = {
+        "Authorization": f"Bearer {issuer.token(USER)}",
+        "X-Auth-Request-User": USER,
+    }
+    results: list[Result] = []
+    try:
+        async with TestClient(app) as client:
+            # wait until the caches are warm, as the readiness probe of a pod would
+            deadline = time.monotonic() + args.sync_wait
+            while (ready := await client.get("/ready")).status_code != 200:
+                if time.monotonic() > deadline:
+                    print(f"App is not ready: {ready.json()}", file=sys.stderr)
+                    break
+                await asyncio.sleep(0.05)
+            requests = scenarios(
+                client, api_server, headers, args.secrets, MY_SECRETS_LABEL_SELECTOR
+            )
+            for name in args.scenarios:
+                request, setup = requests[name]
+                for concurrency in args.concurrency:
+                    results.append(
+                        await measure(
+                            name,
+                            request,
+                            setup,
+                            concurrency,
+                            args.requests,
+                            args.warmup,
+                            first=len(results) * (args.warmup + args.requests),
+                        )
+                    )
+    finally:
+        api_server.stop()
+        issuer.stop()
+        os.unlink(kubeconfig.name)
+    return results
+
+
+def comma_separated(value: str) -> list[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--secrets", type=int, default=100)
+    parser.add_argument(
+        "--latency", type=float, default=0.002, help="fake backend latency in seconds"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=lambda v: [int(c) for c in comma_separated(v)],
+        default=[1, 8, 32],
+    )
+    parser.add_argument("--requests", type=int, default=200, help="per measurement")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument(
+        "--sync-wait", type=float, default=5.0, help="seconds to wait for /ready"
+    )
+    parser.add_argument(
+        "--scenarios",
+        type=comma_separated,
+        default=["list", "get-credentials", "detail", "create", "update", "delete"],
+    )
+    parser.add_argument("--verbose", action="store_true", help="show the app logs")
+    parser.add_argument("--output", type=Path, help="write the results as json")
+    parser.add_argument(
+        "--baseline", type=Path, help=f"default: {DEFAULT_BASELINE.name} if it exists"
+    )
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="allowed relative p99/throughput regression",
+    )
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print_table(results)
+
+    serialized = {r.key: dataclasses.asdict(r) for r in results}
+    if args.output:
+        args.output.write_text(json.dumps(serialized, indent=2))
+    baseline_path = args.baseline or DEFAULT_BASELINE
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(serialized, indent=2))
+        print(f"Saved baseline to {baseline_path}")
+        return 0
+    if not baseline_path.exists():
+        # baselines depend on the machine, so none is committed
+        print(
+            f"No baseline at {baseline_path}, not checking for regressions. "
+            "Save one with --save-baseline first.",
+            file=sys.stderr,
+        )
+        return 2 if args.baseline else 0
+    baseline = json.loads(baseline_path.read_text())
+    found = regressions(results, baseline, args.tolerance)
+    for regression in found:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
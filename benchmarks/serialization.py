@@ -0,0 +1,86 @@
+"""Encoding of the /get-credentials response, FastAPI's encoder vs. JSON fragments.
+
+Run from the repository root, e.g.:
+
+    python -m benchmarks.serialization --secrets 1000 --keys 5
+"""
+
+import argparse
+import base64
+import os
+import statistics
+import sys
+import time
+from typing import Callable
+
+NAMESPACE = "benchmark"
+
+
+def measure(encode: Callable[[], bytes | memoryview], repeat: int) -> tuple[float, int]:
+    """Median milliseconds of an encoding and the size of its result"""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = encode()
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations), len(body)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--secrets", type=int, default=1000)
+    parser.add_argument("--keys", type=int, default=5, help="data keys per secret")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ["CREDENTIALS_NAMESPACE"] = NAMESPACE
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    from my_credentials import views
+    from my_credentials.records import CredentialRecord
+
+    records = [
+        CredentialRecord(
+            name=f"secret-{i}",
+            resource_version=str(i),
+            type="Opaque",
+            annotations={"eoxhub-env-jupyterlab": "true"},
+            data={
+                f"key-{k}": base64.b64encode(f"value-{i}-{k}".encode()).decode()
+                for k in range(args.keys)
+            },
+        )
+        for i in range(args.secrets)
+    ]
+
+    def encoder() -> bytes | memoryview:
+        # what FastAPI does with the list of dicts returned before
+        return JSONResponse(
+            jsonable_encoder([views.serialize_secret(r) for r in records])
+        ).body
+
+    def fragments() -> bytes | memoryview:
+        return views.JSONArrayResponse(
+            views.secret_json(r, "all") for r in records
+        ).body
+
+    def cold_fragments() -> bytes | memoryview:
+        views.json_cache.clear()
+        return fragments()
+
+    print(f"{'path':<20} {'ms':>9} {'bytes':>10}")
+    baseline = None
+    for name, encode in [
+        ("jsonable_encoder", encoder),
+        ("fragments (cold)", cold_fragments),
+        ("fragments (cached)", fragments),
+    ]:
+        took, size = measure(encode, args.repeat)
+        baseline = baseline or took
+        print(f"{name:<20} {took:>9.2f} {size:>10} {baseline / took:>6.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
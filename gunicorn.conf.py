@@ -1,5 +1,67 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
 from prometheus_client import multiprocess
 
+# the publisher is restarted after this delay, doubled while it keeps failing
+PUBLISHER_MIN_RESTART_DELAY = 1
+PUBLISHER_MAX_RESTART_DELAY = 60
+
+
+def when_ready(server):
+    # one process watches the secrets for all workers
+    if os.getenv("SHARED_SECRET_CACHE_DIR"):
+        server.secret_cache_publisher_lock = threading.Lock()
+        server.secret_cache_publisher_stopped = False
+        start_publisher(server)
+        threading.Thread(target=supervise_publisher, args=(server,), daemon=True).start()
+
+
+def start_publisher(server):
+    server.log.info("Starting shared secret cache publisher")
+    server.secret_cache_publisher = subprocess.Popen(
+        [sys.executable, "-m", "my_credentials.snapshot_publisher"]
+    )
+
+
+def supervise_publisher(server):
+    # the workers read from the API server while the publisher is down
+    delay = PUBLISHER_MIN_RESTART_DELAY
+    while True:
+        publisher = server.secret_cache_publisher
+        started = time.monotonic()
+        returncode = publisher.wait()
+        if time.monotonic() - started > PUBLISHER_MAX_RESTART_DELAY:
+            delay = PUBLISHER_MIN_RESTART_DELAY
+        with server.secret_cache_publisher_lock:
+            if server.secret_cache_publisher_stopped:
+                return
+            multiprocess.mark_process_dead(publisher.pid)
+            server.log.error(
+                f"Shared secret cache publisher exited with {returncode}, "
+                f"restarting in {delay}s"
+            )
+        time.sleep(delay)
+        with server.secret_cache_publisher_lock:
+            if server.secret_cache_publisher_stopped:
+                return
+            start_publisher(server)
+        delay = min(delay * 2, PUBLISHER_MAX_RESTART_DELAY)
+
 
 def child_exit(server, worker):
     multiprocess.mark_process_dead(worker.pid)
+
+
+def on_exit(server):
+    lock = getattr(server, "secret_cache_publisher_lock", None)
+    if lock:
+        with lock:
+            server.secret_cache_publisher_stopped = True
+            publisher = server.secret_cache_publisher
+        publisher.terminate()
+        publisher.wait(timeout=10)
+        multiprocess.mark_process_dead(publisher.pid)
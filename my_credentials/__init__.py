@@ -2,8 +2,11 @@ import logging
 import time
 from logging.config import dictConfig
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from starlette_exporter import PrometheusMiddleware, handle_metrics
 
+from my_credentials import admission, config, timing, tracing
+
 
 LOGGING_CONFIG = {
     "version": 1,
@@ -44,7 +47,32 @@ app.add_middleware(PrometheusMiddleware)
 app.add_route("/metrics", handle_metrics)
 
 access_logger = logging.getLogger("app.access")
-INFRASTRUCTURE_VIEWS = ["/probe", "/metrics"]
+INFRASTRUCTURE_VIEWS = ["/probe", "/ready", "/metrics"]
+# long-lived streams, which would hold a slot of the concurrency limit
+STREAMING_VIEWS = ["/events"]
+
+
+# added first, so rejected requests are still logged and traced
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    if (
+        not config.ADMISSION_MAX_CONCURRENCY
+        or request.url.path in INFRASTRUCTURE_VIEWS
+        or request.url.path in STREAMING_VIEWS
+    ):
+        return await call_next(request)
+
+    try:
+        async with admission.controller.admit(
+            request.headers.get(config.TENANT_HEADER, "")
+        ):
+            return await call_next(request)
+    except admission.Overloaded:
+        return JSONResponse(
+            {"detail": "Too many requests in progress, please retry later."},
+            status_code=503,
+            headers={"Retry-After": str(config.ADMISSION_RETRY_AFTER)},
+        )
 
 
 @app.middleware("http")
@@ -54,14 +82,47 @@ async def log_middle(request: Request, call_next):
 
     if request.url.path not in INFRASTRUCTURE_VIEWS:
         duration = (time.time() - start_time) * 1000
+        span = tracing.current_span()
         access_logger.info(
             f"{request.method} {request.url.path} "
             f"duration:{duration:.2f}ms "
             f"status:{response.status_code}"
+            + (f" trace:{span.trace_id}" if span else "")
         )
     return response
 
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    if request.url.path in INFRASTRUCTURE_VIEWS:
+        return await call_next(request)
+
+    with tracing.request_span(
+        f"{request.method} {request.url.path}",
+        request.headers.get("traceparent"),
+        **{"http.method": request.method, "http.target": request.url.path},
+    ) as span:
+        response = await call_next(request)
+        if span:
+            span.attributes["http.status_code"] = response.status_code
+            response.headers["traceparent"] = span.traceparent
+    return response
+
+
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    if not config.SERVER_TIMING_ENABLED:
+        return await call_next(request)
+
+    start_time = time.perf_counter()
+    stages = timing.start_request()
+    response = await call_next(request)
+    response.headers["Server-Timing"] = timing.server_timing_header(
+        stages, time.perf_counter() - start_time
+    )
+    return response
+
+
 @app.get("/probe")
 def probe():
     return {}
@@ -0,0 +1,104 @@
+"""Admission control, bounding the requests handled concurrently.
+
+Without a bound, requests pile up behind a slow API server and their latency
+grows without limit. At most `ADMISSION_MAX_CONCURRENCY` requests are handled
+at once, further ones wait in a bounded queue. Waiting requests are admitted
+round-robin by user, so a single user can't starve the others, and rejected
+with `Overloaded` once a queue is full or they waited too long.
+"""
+
+import asyncio
+import collections
+import contextlib
+from typing import AsyncIterator
+
+from my_credentials import config, metrics
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class AdmissionController:
+    def __init__(self):
+        self.in_flight = 0
+        self.queued = 0
+        # waiting requests by user, the next user to admit first
+        self._waiting: collections.OrderedDict[
+            str, collections.deque[asyncio.Future]
+        ] = collections.OrderedDict()
+
+    @contextlib.asynccontextmanager
+    async def admit(self, user: str) -> AsyncIterator[None]:
+        await self._acquire(user)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, user: str):
+        if self.in_flight < config.ADMISSION_MAX_CONCURRENCY and not self.queued:
+            self.in_flight += 1
+            self._update_metrics()
+            return
+
+        queue = self._waiting.get(user, ())
+        if len(queue) >= config.ADMISSION_MAX_QUEUED_PER_USER:
+            self._shed("user_queue_full")
+        if self.queued >= config.ADMISSION_MAX_QUEUED:
+            self._shed("queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(user, collections.deque()).append(future)
+        self.queued += 1
+        self._update_metrics()
+        try:
+            await asyncio.wait_for(future, config.ADMISSION_QUEUE_TIMEOUT)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # the slot was handed over meanwhile
+                self._release()
+            else:
+                self._remove(user, future)
+            if isinstance(e, asyncio.TimeoutError):
+                self._shed("timeout")
+            raise
+
+    def _release(self):
+        while self._waiting:
+            user, queue = next(iter(self._waiting.items()))
+            future = queue.popleft()
+            self.queued -= 1
+            if queue:
+                self._waiting.move_to_end(user)
+            else:
+                del self._waiting[user]
+            if not future.done():
+                # the slot is handed over, so in_flight stays the same
+                future.set_result(None)
+                self._update_metrics()
+                return
+        self.in_flight -= 1
+        self._update_metrics()
+
+    def _remove(self, user: str, future: asyncio.Future):
+        queue = self._waiting.get(user)
+        if queue is not None and future in queue:
+            queue.remove(future)
+            self.queued -= 1
+            if not queue:
+                del self._waiting[user]
+        self._update_metrics()
+
+    def _shed(self, reason: str):
+        metrics.ADMISSION_SHED.labels(reason=reason).inc()
+        raise Overloaded(reason)
+
+    def _update_metrics(self):
+        metrics.ADMISSION_IN_FLIGHT.set(self.in_flight)
+        metrics.ADMISSION_QUEUE_DEPTH.set(self.queued)
+
+
+controller = AdmissionController()
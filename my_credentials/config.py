@@ -1 +1,113 @@
-# no config for now
+import os
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+
+# serve secret reads from a watch-backed in-memory cache
+SECRET_CACHE_ENABLED = _env_flag("SECRET_CACHE_ENABLED", "true")
+# while the cache is still warming up, list directly instead of waiting for it
+SECRET_CACHE_FALLBACK_TO_LIST = _env_flag("SECRET_CACHE_FALLBACK_TO_LIST", "true")
+# how long a read waits for the initial sync if falling back is disabled
+SECRET_CACHE_SYNC_TIMEOUT = float(os.getenv("SECRET_CACHE_SYNC_TIMEOUT", "10"))
+# server side timeout of a single watch request, the watch is resumed afterwards
+SECRET_CACHE_WATCH_TIMEOUT = int(os.getenv("SECRET_CACHE_WATCH_TIMEOUT", "300"))
+# directory on a memory backed file system (e.g. /dev/shm/credential-manager) to
+# share one secret cache between the gunicorn workers, off if empty
+SHARED_SECRET_CACHE_DIR = os.getenv("SHARED_SECRET_CACHE_DIR", "")
+# the shared cache isn't used if its publisher didn't update it for this long
+SHARED_SECRET_CACHE_MAX_AGE = float(os.getenv("SHARED_SECRET_CACHE_MAX_AGE", "30"))
+# seconds between checks of the workers whether the snapshot changed
+SHARED_SECRET_CACHE_POLL_INTERVAL = float(
+    os.getenv("SHARED_SECRET_CACHE_POLL_INTERVAL", "0.1")
+)
+
+# least recently used namespaces are evicted from the cache above these limits
+SECRET_CACHE_MAX_NAMESPACES = int(os.getenv("SECRET_CACHE_MAX_NAMESPACES", "256"))
+SECRET_CACHE_MEMORY_BUDGET_MB = float(os.getenv("SECRET_CACHE_MEMORY_BUDGET_MB", "256"))
+
+# serve the namespaces of all users instead of the own namespace only
+MULTI_TENANT = _env_flag("MULTI_TENANT", "false")
+# the namespace is the prefixed value of this claim of the verified token, the
+# header set by the auth proxy has to match it (and is used as is if CRED_ENV=LOCAL)
+TENANT_HEADER = os.getenv("TENANT_HEADER", "X-Auth-Request-User")
+TENANT_CLAIM = os.getenv("TENANT_CLAIM", "preferred_username")
+TENANT_NAMESPACE_PREFIX = os.getenv("TENANT_NAMESPACE_PREFIX", "")
+# comma separated namespaces users may be served from, any if empty
+TENANT_NAMESPACES = [
+    namespace.strip()
+    for namespace in os.getenv("TENANT_NAMESPACES", "").split(",")
+    if namespace.strip()
+]
+
+# maximum number of kubernetes api calls running concurrently in the thread pool
+K8S_THREADPOOL_SIZE = int(os.getenv("K8S_THREADPOOL_SIZE", "16"))
+# connections kept open to the API server by the shared api client
+K8S_CONNECTION_POOL_SIZE = int(os.getenv("K8S_CONNECTION_POOL_SIZE", "16"))
+K8S_CONNECT_TIMEOUT = float(os.getenv("K8S_CONNECT_TIMEOUT", "5"))
+K8S_READ_TIMEOUT = float(os.getenv("K8S_READ_TIMEOUT", "30"))
+# idle seconds before tcp keepalive probes are sent on pooled connections
+K8S_TCP_KEEPALIVE_IDLE = int(os.getenv("K8S_TCP_KEEPALIVE_IDLE", "60"))
+
+# compiled templates are stored here, so that they aren't compiled on each start
+TEMPLATE_BYTECODE_CACHE_DIR = os.getenv(
+    "TEMPLATE_BYTECODE_CACHE_DIR", "/tmp/credential-manager-templates"
+)
+# rendered credential cards of the list page, by name and resourceVersion
+FRAGMENT_CACHE_SIZE = int(os.getenv("FRAGMENT_CACHE_SIZE", "4096"))
+
+# add a Server-Timing header with the time spent per stage to each response
+SERVER_TIMING_ENABLED = _env_flag("SERVER_TIMING_ENABLED", "false")
+
+# "memory" or "file" to record request traces, off if empty
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "")
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+# share of requests without incoming trace context which are traced
+TRACING_SAMPLE_RATIO = float(os.getenv("TRACING_SAMPLE_RATIO", "1"))
+
+# verified tokens are cached until they expire, but at most for this many seconds
+TOKEN_CACHE_MAX_TTL = float(os.getenv("TOKEN_CACHE_MAX_TTL", "300"))
+# rejected tokens are cached for a short time only
+TOKEN_CACHE_NEGATIVE_TTL = float(os.getenv("TOKEN_CACHE_NEGATIVE_TTL", "10"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "1024"))
+
+OIDC_ISSUER_URL = os.getenv("oidc-issuer-url", "")
+# the signing keys are refetched in the background in this interval
+JWKS_REFRESH_INTERVAL = float(os.getenv("JWKS_REFRESH_INTERVAL", "900"))
+# retry interval if the issuer was unreachable, the previous keys are kept meanwhile
+JWKS_RETRY_INTERVAL = float(os.getenv("JWKS_RETRY_INTERVAL", "30"))
+# minimum seconds between refetches caused by tokens with an unknown key id
+JWKS_KID_MISS_MIN_INTERVAL = float(os.getenv("JWKS_KID_MISS_MIN_INTERVAL", "30"))
+JWKS_FETCH_TIMEOUT = float(os.getenv("JWKS_FETCH_TIMEOUT", "10"))
+
+# requests handled concurrently per process, 0 to disable the limit
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "64"))
+# requests waiting for a slot, in total and per user, more are rejected with 503
+ADMISSION_MAX_QUEUED = int(os.getenv("ADMISSION_MAX_QUEUED", "256"))
+ADMISSION_MAX_QUEUED_PER_USER = int(os.getenv("ADMISSION_MAX_QUEUED_PER_USER", "16"))
+# seconds a request waits for a slot before it's rejected
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+# Retry-After of rejected requests in seconds
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "2"))
+
+# changes of the cached secrets kept per namespace for /events clients to resume
+EVENTS_BUFFER_SIZE = int(os.getenv("EVENTS_BUFFER_SIZE", "1000"))
+# seconds between checks for new changes, and between keepalive comments
+EVENTS_POLL_INTERVAL = float(os.getenv("EVENTS_POLL_INTERVAL", "1"))
+EVENTS_KEEPALIVE_INTERVAL = float(os.getenv("EVENTS_KEEPALIVE_INTERVAL", "15"))
+
+# form bodies are rejected as soon as they exceed these sizes in bytes,
+# the API server doesn't accept secrets larger than 1MiB anyway
+FORM_MAX_BODY_SIZE = int(os.getenv("FORM_MAX_BODY_SIZE", str(1024 * 1024)))
+FORM_MAX_FIELD_SIZE = int(os.getenv("FORM_MAX_FIELD_SIZE", str(512 * 1024)))
+
+# secrets per API server list call when streaming /get-credentials as NDJSON
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "100"))
+
+# operations of one bulk request running concurrently, and allowed per request
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", "8"))
+BULK_MAX_OPERATIONS = int(os.getenv("BULK_MAX_OPERATIONS", "200"))
+
+# attempts of a write which failed because the secret was changed concurrently
+K8S_CONFLICT_RETRIES = int(os.getenv("K8S_CONFLICT_RETRIES", "5"))
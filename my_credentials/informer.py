@@ -0,0 +1,447 @@
+import collections
+import dataclasses
+import http
+import logging
+import threading
+import uuid
+from typing import Callable
+
+from kubernetes import client as k8s_client
+from kubernetes import watch as k8s_watch
+from kubernetes.client.exceptions import ApiException
+
+from my_credentials import config, k8s, metrics, timing
+from my_credentials.records import SecretLike
+
+logger = logging.getLogger(__name__)
+
+ERROR_BACKOFF_SECONDS = 5
+# without the permission to list and watch the secrets, this is retried rarely
+FORBIDDEN_BACKOFF_SECONDS = 300
+
+# secrets annotated with this prefix and the app name are injected into the app
+APP_ENV_ANNOTATION_PREFIX = "eoxhub-env-"
+
+# rough per-secret memory of the client model objects, on top of keys and values
+SECRET_OVERHEAD_BYTES = 2048
+
+
+def env_apps(secret: SecretLike) -> set[str]:
+    """Apps the secret is injected into as environment variables"""
+    if secret.type != "Opaque":
+        return set()
+    return {
+        key.removeprefix(APP_ENV_ANNOTATION_PREFIX)
+        for key, value in (secret.metadata.annotations or {}).items()
+        if key.startswith(APP_ENV_ANNOTATION_PREFIX) and value
+    }
+
+
+def display_type(secret_type: str | None) -> str | None:
+    """The secret type as shown to clients"""
+    return "key-value (Opaque)" if secret_type == "Opaque" else secret_type
+
+
+def estimated_size(secret: SecretLike) -> int:
+    """Rough number of bytes a secret takes in the cache"""
+    metadata = secret.metadata
+    return SECRET_OVERHEAD_BYTES + sum(
+        len(key) + len(value or "")
+        for mapping in (secret.data, metadata.annotations, metadata.labels)
+        for key, value in (mapping or {}).items()
+    )
+
+
+def is_newer(resource_version: str | None, than: str | None) -> bool:
+    """Whether a resourceVersion is newer than another one.
+
+    resourceVersions are opaque to clients, but etcd revisions in practice. If
+    they can't be compared, neither is newer.
+    """
+    if not (resource_version or "").isdigit() or not (than or "").isdigit():
+        return False
+    return int(resource_version or 0) > int(than or 0)
+
+
+@dataclasses.dataclass(frozen=True)
+class ChangeEvent:
+    """A change of a cached secret, without its values"""
+
+    seq: int
+    type: str  # ADDED, MODIFIED or DELETED
+    name: str
+    secret_type: str | None
+    annotations: dict[str, str]
+    keys: list[str]
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "type": display_type(self.secret_type),
+            "annotations": self.annotations,
+            "keys": self.keys,
+        }
+
+
+class SecretInformer:
+    """Keeps an in-memory copy of the labelled secrets of one namespace.
+
+    The secrets are listed once and then kept up to date by a long-lived watch
+    which resumes from the last seen resourceVersion (including bookmarks).
+    If the watch has expired (410 Gone), the secrets are listed again.
+
+    Additionally, an index from app name to the secrets injected into that app
+    is kept up to date with every change, and the latest changes are kept as
+    `ChangeEvent`s for clients to follow.
+    """
+
+    def __init__(self, namespace: str, label_selector: str):
+        self.namespace = namespace
+        self.label_selector = label_selector
+        self.resource_version: str | None = None
+        self.size = 0
+        self._secrets: dict[str, SecretLike] = {}
+        self._app_index: dict[str, set[str]] = {}
+        self._lock = threading.Lock()
+        self._synced = threading.Event()
+        self._stopped = threading.Event()
+        self._watch: k8s_watch.Watch | None = None
+        self._thread: threading.Thread | None = None
+        # called from the informer thread after the secrets changed
+        self.on_change: Callable[[], None] | None = None
+        # the sequence numbers of the events only count within one epoch
+        self.epoch = uuid.uuid4().hex[:8]
+        self.events: collections.deque[ChangeEvent] = collections.deque(
+            maxlen=config.EVENTS_BUFFER_SIZE
+        )
+        self._last_seq = 0
+        # changes are only recorded once the secrets were listed
+        self._listed = False
+        # the service account may not list or watch the secrets, reads go to the
+        # API server meanwhile
+        self.forbidden = False
+
+    @property
+    def synced(self) -> bool:
+        return self._synced.is_set()
+
+    def wait_until_synced(self, timeout: float | None = None) -> bool:
+        return self._synced.wait(timeout)
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f"secret-informer-{self.namespace}",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._watch:
+            self._watch.stop()
+
+    def list_all(self) -> list[SecretLike]:
+        with self._lock:
+            return [self._secrets[name] for name in sorted(self._secrets)]
+
+    def snapshot(self) -> tuple[str | None, list[SecretLike]]:
+        """The resourceVersion and the secrets at exactly that version"""
+        with self._lock:
+            return (
+                self.resource_version,
+                [self._secrets[name] for name in sorted(self._secrets)],
+            )
+
+    def get(self, name: str) -> SecretLike | None:
+        with self._lock:
+            return self._secrets.get(name)
+
+    def list_for_app(self, app: str) -> list[SecretLike]:
+        with self._lock:
+            names = sorted(self._app_index.get(app, ()))
+            return [self._secrets[name] for name in names]
+
+    @property
+    def last_event_id(self) -> str:
+        return f"{self.epoch}-{self._last_seq}"
+
+    def events_after(self, event_id: str) -> list[ChangeEvent] | None:
+        """The events after the given one, None if they aren't all kept anymore"""
+        epoch, _, seq = event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        with self._lock:
+            oldest = self.events[0].seq if self.events else self._last_seq + 1
+            if not oldest - 1 <= int(seq) <= self._last_seq:
+                return None
+            return [event for event in self.events if event.seq > int(seq)]
+
+    def apply(
+        self,
+        event_type: str,
+        secret: SecretLike,
+        record: bool = True,
+        resource_version: str | None = None,
+    ):
+        """Apply a change from the watch to the cache, and advance to its version"""
+        with self._lock:
+            if resource_version is not None:
+                self.resource_version = resource_version
+            self._apply(event_type, secret, record)
+
+    def apply_own_write(self, event_type: str, secret: SecretLike) -> bool:
+        """Apply the result of our own write, unless the cache is already past it.
+
+        Returns whether it was applied.
+        """
+        with self._lock:
+            if self._is_outdated(event_type, secret):
+                return False
+            self._apply(event_type, secret, record=True)
+            return True
+
+    def _is_outdated(self, event_type: str, secret: SecretLike) -> bool:
+        """Whether the cache has seen a write and the changes after it"""
+        version = secret.metadata.resource_version
+        cached = self._secrets.get(secret.metadata.name)
+        if event_type == "DELETED":
+            # deletes carry the deleted version, the secret might be created again
+            return cached is None or cached.metadata.resource_version != version
+        # the watch advances its resourceVersion together with applying an event
+        return any(
+            seen is not None and (seen == version or is_newer(seen, version))
+            for seen in (
+                self.resource_version,
+                cached.metadata.resource_version if cached else None,
+            )
+        )
+
+    def _apply(self, event_type: str, secret: SecretLike, record: bool):
+        name = secret.metadata.name
+        previous = self._secrets.pop(name, None)
+        if previous is not None:
+            self._unindex(name, previous)
+            self.size -= estimated_size(previous)
+        if event_type != "DELETED":
+            self._secrets[name] = secret
+            self._index(name, secret)
+            self.size += estimated_size(secret)
+        if record and self._listed:
+            self._record(name, previous, self._secrets.get(name))
+
+    def _replace_all(
+        self,
+        secrets: list[SecretLike],
+        record: bool = True,
+        resource_version: str | None = None,
+    ):
+        with self._lock:
+            if resource_version is not None:
+                self.resource_version = resource_version
+            self._replace(secrets, record)
+
+    def _replace(self, secrets: list[SecretLike], record: bool):
+        previous = self._secrets
+        self._secrets = {secret.metadata.name: secret for secret in secrets}
+        self._app_index = {}
+        for name, secret in self._secrets.items():
+            self._index(name, secret)
+        self.size = sum(map(estimated_size, self._secrets.values()))
+        if record and self._listed:
+            # e.g. changes missed while the watch was expired
+            self._record_diff(previous)
+        self._listed = True
+
+    def _record_diff(self, previous: dict[str, SecretLike]):
+        for name in sorted(previous.keys() | self._secrets.keys()):
+            self._record(name, previous.get(name), self._secrets.get(name))
+
+    def _record(
+        self,
+        name: str,
+        previous: SecretLike | None,
+        current: SecretLike | None,
+    ):
+        if current is None:
+            if previous is None:
+                return
+            type, secret = "DELETED", previous
+        elif previous is None:
+            type, secret = "ADDED", current
+        elif previous.metadata.resource_version != current.metadata.resource_version:
+            type, secret = "MODIFIED", current
+        else:
+            # e.g. the watch event of our own write
+            return
+        self._last_seq += 1
+        self.events.append(
+            ChangeEvent(
+                seq=self._last_seq,
+                type=type,
+                name=name,
+                secret_type=secret.type,
+                annotations=dict(secret.metadata.annotations or {}),
+                keys=[key for key, value in (secret.data or {}).items() if value],
+            )
+        )
+
+    def _index(self, name: str, secret: SecretLike):
+        for app in env_apps(secret):
+            self._app_index.setdefault(app, set()).add(name)
+
+    def _unindex(self, name: str, secret: SecretLike):
+        for app in env_apps(secret):
+            names = self._app_index.get(app, set())
+            names.discard(name)
+            if not names:
+                self._app_index.pop(app, None)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                if self.resource_version is None:
+                    self._relist()
+                self._watch_once()
+            except ApiException as e:
+                if e.status == http.HTTPStatus.GONE:
+                    logger.info(f"Watch in '{self.namespace}' expired, relisting.")
+                    self.resource_version = None
+                elif e.status == http.HTTPStatus.FORBIDDEN:
+                    self._forbid()
+                    self._stopped.wait(FORBIDDEN_BACKOFF_SECONDS)
+                else:
+                    logger.warning(f"Watch in '{self.namespace}' failed: {e}")
+                    self._stopped.wait(ERROR_BACKOFF_SECONDS)
+            except Exception:
+                logger.exception(f"Watch in '{self.namespace}' failed")
+                self._stopped.wait(ERROR_BACKOFF_SECONDS)
+
+    def _forbid(self):
+        if not self.forbidden:
+            logger.error(
+                f"Listing and watching the secrets in '{self.namespace}' is "
+                "forbidden, reading from the API server instead. The service account "
+                "needs the list and watch verbs on secrets for the secret cache."
+            )
+        self.forbidden = True
+        # not kept up to date anymore, and listed again once allowed
+        self._synced.clear()
+        self.resource_version = None
+        if self.on_change:
+            self.on_change()
+
+    def _relist(self):
+        with timing.timed(
+            metrics.K8S_CALL_DURATION, "k8s", operation="list_namespaced_secret"
+        ):
+            secret_list: k8s_client.V1SecretList = (
+                k8s.core_v1().list_namespaced_secret(
+                    namespace=self.namespace,
+                    label_selector=self.label_selector,
+                )
+            )
+        self._replace_all(
+            secret_list.items, resource_version=secret_list.metadata.resource_version
+        )
+        self.forbidden = False
+        self._synced.set()
+        if self.on_change:
+            self.on_change()
+        logger.info(
+            f"Listed {len(secret_list.items)} secrets in '{self.namespace}' "
+            f"at resourceVersion {self.resource_version}."
+        )
+
+    def _watch_once(self):
+        self._watch = k8s_watch.Watch()
+        for event in self._watch.stream(
+            k8s.core_v1().list_namespaced_secret,
+            namespace=self.namespace,
+            label_selector=self.label_selector,
+            resource_version=self.resource_version,
+            allow_watch_bookmarks=True,
+            timeout_seconds=config.SECRET_CACHE_WATCH_TIMEOUT,
+            # leave some time for the api server to close the watch itself
+            _request_timeout=(
+                config.K8S_CONNECT_TIMEOUT,
+                config.SECRET_CACHE_WATCH_TIMEOUT + config.K8S_READ_TIMEOUT,
+            ),
+        ):
+            self._handle_event(event)
+            if self._stopped.is_set():
+                self._watch.stop()
+
+    def _handle_event(self, event: dict):
+        # advanced at once with applying the event, so that neither our own writes
+        # nor snapshots see the new resourceVersion with the old state
+        resource_version = event["raw_object"]["metadata"]["resourceVersion"]
+        if event["type"] == "BOOKMARK":
+            # bookmarks only carry the resourceVersion
+            with self._lock:
+                self.resource_version = resource_version
+        else:
+            self.apply(event["type"], event["object"], resource_version=resource_version)
+        if event["type"] != "BOOKMARK" and self.on_change:
+            self.on_change()
+
+
+# ordered from least to most recently used
+_informers: collections.OrderedDict[str, SecretInformer] = collections.OrderedDict()
+_informers_lock = threading.Lock()
+
+
+def start_informer(
+    namespace: str,
+    label_selector: str,
+    factory: Callable[[str, str], SecretInformer] = SecretInformer,
+) -> SecretInformer:
+    with _informers_lock:
+        if namespace not in _informers:
+            informer = factory(namespace, label_selector)
+            informer.start()
+            _informers[namespace] = informer
+        _informers.move_to_end(namespace)
+        _evict()
+        return _informers[namespace]
+
+
+def get_informer(namespace: str) -> SecretInformer | None:
+    with _informers_lock:
+        if namespace not in _informers:
+            return None
+        _informers.move_to_end(namespace)
+        _evict()
+        return _informers[namespace]
+
+
+def is_cached(informer: SecretInformer) -> bool:
+    """Whether the informer is still cached, without counting as a use of it"""
+    with _informers_lock:
+        return _informers.get(informer.namespace) is informer
+
+
+def _evict():
+    """Stop the least recently used informers until the cache fits into its limits.
+
+    The most recently used informer is always kept.
+    """
+    budget = config.SECRET_CACHE_MEMORY_BUDGET_MB * 1024 * 1024
+    size = sum(informer.size for informer in _informers.values())
+    while len(_informers) > 1 and (
+        len(_informers) > config.SECRET_CACHE_MAX_NAMESPACES or size > budget
+    ):
+        namespace, informer = _informers.popitem(last=False)
+        informer.stop()
+        size -= informer.size
+        metrics.SECRET_CACHE_EVICTIONS.inc()
+        logger.info(f"Evicted secrets of '{namespace}' from the cache.")
+    metrics.SECRET_CACHE_NAMESPACES.set(len(_informers))
+    metrics.SECRET_CACHE_BYTES.set(size)
+
+
+def stop_informers():
+    with _informers_lock:
+        for informer in _informers.values():
+            informer.stop()
+        _informers.clear()
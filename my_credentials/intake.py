@@ -0,0 +1,255 @@
+"""Streaming intake of the credential forms with byte limits.
+
+The body is parsed while it is received instead of being read and spooled
+completely first, so requests are rejected as soon as they exceed
+`FORM_MAX_BODY_SIZE` or a field exceeds `FORM_MAX_FIELD_SIZE`.
+
+Key material (the `ssh_file` upload and the `privatekey` field) is decoded as
+UTF-8 chunk by chunk. Once it is too large or not valid UTF-8, the rest of it
+is dropped and the error is kept for the form to show.
+"""
+
+import codecs
+import dataclasses
+import http
+from urllib.parse import unquote_plus, unquote_to_bytes
+
+import python_multipart
+from fastapi import HTTPException, Request
+from python_multipart.exceptions import FormParserError
+from python_multipart.multipart import parse_options_header
+from starlette.datastructures import FormData, UploadFile
+
+from my_credentials import config
+
+KEY_FIELDS = {"ssh_file", "privatekey"}
+MAX_KEY_SIZE = 10 * 1024  # 10KB
+
+
+def payload_too_large(detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=http.HTTPStatus.REQUEST_ENTITY_TOO_LARGE, detail=detail
+    )
+
+
+@dataclasses.dataclass
+class KeyUpload:
+    """Key material of one field, decoded while it was received"""
+
+    field: str
+    filename: str | None = None
+    size: int = 0
+    error: str | None = None
+    content: str = ""
+    _parts: list[str] = dataclasses.field(default_factory=list)
+    _decoder: codecs.IncrementalDecoder = dataclasses.field(
+        default_factory=codecs.getincrementaldecoder("utf-8")
+    )
+
+    def feed(self, data: bytes, final: bool = False):
+        if self.error:
+            return
+        self.size += len(data)
+        if self.size > MAX_KEY_SIZE:
+            self.error = "Content exceeds the 10KB size limit."
+        else:
+            try:
+                self._parts.append(self._decoder.decode(data, final))
+            except UnicodeDecodeError:
+                self.error = "Content is not valid UTF-8 text."
+        if self.error:
+            self._parts.clear()
+
+    def finish(self):
+        self.feed(b"", final=True)
+        # the decoded chunks are only joined once
+        self.content = "" if self.error else "".join(self._parts)
+        self._parts.clear()
+
+    @classmethod
+    def from_bytes(cls, field: str, data: bytes) -> "KeyUpload":
+        key = cls(field)
+        key.feed(data)
+        key.finish()
+        return key
+
+
+@dataclasses.dataclass
+class Intake:
+    form: FormData
+    keys: dict[str, KeyUpload]
+
+
+class _Parser:
+    def __init__(self):
+        # as expected by FormData, though uploads are never spooled into files
+        self.items: list[tuple[str, str | UploadFile]] = []
+        self.keys: dict[str, KeyUpload] = {}
+        self._name = ""
+        self._value = bytearray()
+        self._key: KeyUpload | None = None
+
+    def _add_value(self, data: bytes):
+        if len(self._value) + len(data) > config.FORM_MAX_FIELD_SIZE:
+            raise payload_too_large(
+                f"Field '{self._name}' exceeds {config.FORM_MAX_FIELD_SIZE} bytes."
+            )
+        self._value.extend(data)
+
+
+class _MultipartParser(_Parser):
+    def __init__(self):
+        super().__init__()
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+
+    def on_part_begin(self):
+        self._name = ""
+        self._value = bytearray()
+        self._key = None
+        self._disposition = b""
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        if b"name" not in options:
+            raise HTTPException(
+                status_code=http.HTTPStatus.BAD_REQUEST,
+                detail='The Content-Disposition header field "name" must be provided.',
+            )
+        self._name = options[b"name"].decode(errors="replace")
+        filename = options.get(b"filename")
+        if filename is not None and self._name != "ssh_file":
+            raise HTTPException(
+                status_code=http.HTTPStatus.BAD_REQUEST,
+                detail=f"Unexpected file upload '{self._name}'.",
+            )
+        if self._name in KEY_FIELDS:
+            self._key = KeyUpload(
+                self._name,
+                filename=filename.decode(errors="replace") if filename else None,
+            )
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._key:
+            self._key.feed(data[start:end])
+        else:
+            self._add_value(data[start:end])
+
+    def on_part_end(self):
+        if self._key:
+            self._key.finish()
+            self.keys[self._name] = self._key
+        else:
+            self.items.append((self._name, self._value.decode(errors="replace")))
+
+    def make(self, boundary: bytes) -> python_multipart.MultipartParser:
+        return python_multipart.MultipartParser(
+            boundary,
+            {
+                "on_part_begin": self.on_part_begin,
+                "on_part_data": self.on_part_data,
+                "on_part_end": self.on_part_end,
+                "on_header_field": self.on_header_field,
+                "on_header_value": self.on_header_value,
+                "on_header_end": self.on_header_end,
+                "on_headers_finished": self.on_headers_finished,
+            },
+        )
+
+
+class _UrlencodedParser(_Parser):
+    # percent-encoded values can only be decoded once complete
+
+    def on_field_start(self):
+        self._name = ""
+        self._value = bytearray()
+
+    def on_field_name(self, data: bytes, start: int, end: int):
+        self._name += data[start:end].decode("latin-1")
+
+    def on_field_data(self, data: bytes, start: int, end: int):
+        self._add_value(data[start:end])
+
+    def on_field_end(self):
+        name = unquote_plus(self._name)
+        if name in KEY_FIELDS:
+            self.keys[name] = KeyUpload.from_bytes(
+                name, unquote_to_bytes(bytes(self._value).replace(b"+", b" "))
+            )
+        else:
+            self.items.append((name, unquote_plus(self._value.decode("latin-1"))))
+
+    def make(self) -> python_multipart.QuerystringParser:
+        return python_multipart.QuerystringParser(
+            {
+                "on_field_start": self.on_field_start,
+                "on_field_name": self.on_field_name,
+                "on_field_data": self.on_field_data,
+                "on_field_end": self.on_field_end,
+            }
+        )
+
+
+async def read_form(request: Request) -> Intake:
+    """The form of the request, parsed once while it is received"""
+    if intake := getattr(request.state, "intake", None):
+        return intake
+
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > config.FORM_MAX_BODY_SIZE:
+        raise payload_too_large(f"Body exceeds {config.FORM_MAX_BODY_SIZE} bytes.")
+
+    content_type, options = parse_options_header(request.headers.get("content-type"))
+    parser: _Parser
+    stream_parser: python_multipart.MultipartParser | python_multipart.QuerystringParser
+    if content_type == b"multipart/form-data":
+        if b"boundary" not in options:
+            raise HTTPException(
+                status_code=http.HTTPStatus.BAD_REQUEST,
+                detail="Missing boundary in multipart.",
+            )
+        multipart_parser = _MultipartParser()
+        parser, stream_parser = (
+            multipart_parser, multipart_parser.make(options[b"boundary"])
+        )
+    elif content_type == b"application/x-www-form-urlencoded":
+        urlencoded_parser = _UrlencodedParser()
+        parser, stream_parser = urlencoded_parser, urlencoded_parser.make()
+    else:
+        intake = Intake(form=FormData(), keys={})
+        request.state.intake = intake
+        return intake
+
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            # the content-length header might be missing or wrong
+            if received > config.FORM_MAX_BODY_SIZE:
+                raise payload_too_large(
+                    f"Body exceeds {config.FORM_MAX_BODY_SIZE} bytes."
+                )
+            if chunk:
+                stream_parser.write(chunk)
+        stream_parser.finalize()
+    except FormParserError as e:
+        raise HTTPException(
+            status_code=http.HTTPStatus.BAD_REQUEST, detail=f"Invalid form: {e}"
+        )
+
+    intake = Intake(form=FormData(parser.items), keys=parser.keys)
+    request.state.intake = intake
+    return intake
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import math
+import time
+
+import jwt
+import requests
+
+from my_credentials import config, metrics, timing
+
+logger = logging.getLogger(__name__)
+
+
+class JWKSClient:
+    """Keeps the signing keys of the OIDC issuer in memory.
+
+    The discovery document and the JWKS are fetched at startup and refreshed in
+    the background, so verifying a token never waits for the issuer. A token with
+    an unknown key id triggers at most one refetch per
+    `JWKS_KID_MISS_MIN_INTERVAL`, which is shared by all waiting requests.
+    If the issuer is unreachable, the previously fetched keys are kept.
+    """
+
+    def __init__(self, issuer_url: str):
+        self.issuer_url = issuer_url
+        self._keys: dict[str, jwt.PyJWK] = {}
+        self._session = requests.Session()
+        self._refreshing: asyncio.Future | None = None
+        self._background_task: asyncio.Task | None = None
+        self._last_kid_miss_refresh = -math.inf
+
+    @property
+    def ready(self) -> bool:
+        return bool(self._keys)
+
+    async def start(self):
+        try:
+            await self.refresh()
+        except Exception:
+            logger.exception("Initial JWKS fetch failed")
+        self._background_task = asyncio.create_task(self._refresh_periodically())
+
+    async def stop(self):
+        if self._background_task:
+            self._background_task.cancel()
+            self._background_task = None
+
+    async def refresh(self):
+        """Fetch the keys, concurrent callers share one fetch"""
+        if self._refreshing is None:
+            self._refreshing = asyncio.ensure_future(self._refresh())
+        await asyncio.shield(self._refreshing)
+
+    async def get_signing_key(self, token: str) -> jwt.PyJWK:
+        kid = jwt.get_unverified_header(token).get("kid", "")
+        key = self._keys.get(kid)
+
+        if key is None and (
+            self._refreshing is not None
+            or time.monotonic() - self._last_kid_miss_refresh
+            >= config.JWKS_KID_MISS_MIN_INTERVAL
+        ):
+            logger.info(f"Unknown key id '{kid}', refetching JWKS.")
+            self._last_kid_miss_refresh = time.monotonic()
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"JWKS fetch failed: {e}")
+            key = self._keys.get(kid)
+
+        if key is None:
+            raise jwt.InvalidTokenError(f"Unable to find a signing key for '{kid}'")
+        return key
+
+    async def _refresh(self):
+        try:
+            with timing.timed(metrics.JWKS_FETCH_DURATION, "jwks"):
+                jwks = await asyncio.to_thread(self._download)
+            self._keys = {
+                key.key_id: key
+                for key in jwt.PyJWKSet.from_dict(jwks).keys
+                if key.key_id is not None
+            }
+            logger.info(f"Fetched {len(self._keys)} signing keys.")
+        finally:
+            self._refreshing = None
+
+    def _download(self) -> dict:
+        well_known_url = f"{self.issuer_url}/.well-known/openid-configuration"
+        logger.info(f"{well_known_url=}")
+        discovery = self._session.get(well_known_url, timeout=config.JWKS_FETCH_TIMEOUT)
+        discovery.raise_for_status()
+        response = self._session.get(
+            discovery.json()["jwks_uri"], timeout=config.JWKS_FETCH_TIMEOUT
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def _refresh_periodically(self):
+        delay = config.JWKS_REFRESH_INTERVAL if self.ready else config.JWKS_RETRY_INTERVAL
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self.refresh()
+                delay = config.JWKS_REFRESH_INTERVAL
+            except Exception as e:
+                logger.warning(f"JWKS refresh failed, keeping previous keys: {e}")
+                delay = config.JWKS_RETRY_INTERVAL
@@ -0,0 +1,181 @@
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import socket
+from typing import Awaitable, Callable, TypeVar
+
+from kubernetes import client as k8s_client
+from urllib3.connection import HTTPConnection
+
+from my_credentials import config, metrics, timing, tracing
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# the kubernetes client is synchronous, so its calls are run in a bounded thread
+# pool instead of blocking the event loop
+_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=config.K8S_THREADPOOL_SIZE,
+    thread_name_prefix="k8s",
+)
+
+
+class PooledApiClient(k8s_client.ApiClient):
+    """Api client applying the configured timeouts to calls which don't set one"""
+
+    def request(self, *args, _request_timeout=None, **kwargs):
+        return super().request(
+            *args,
+            _request_timeout=_request_timeout
+            or (config.K8S_CONNECT_TIMEOUT, config.K8S_READ_TIMEOUT),
+            **kwargs,
+        )
+
+
+_api_client: PooledApiClient | None = None
+_in_flight = 0
+# reads by key, see `coalesced`
+_in_flight_reads: dict[tuple, asyncio.Future] = {}
+_connected = False
+
+
+def _keepalive_socket_options() -> list[tuple[int, int, int]]:
+    options = HTTPConnection.default_socket_options + [
+        (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    ]
+    # not available on all platforms
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        options.append(
+            (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, config.K8S_TCP_KEEPALIVE_IDLE)
+        )
+    return options
+
+
+def connect():
+    """Create the process-wide api client, needs to be called after loading the
+    kube config"""
+    global _api_client
+    configuration = k8s_client.Configuration.get_default_copy()
+    configuration.connection_pool_maxsize = config.K8S_CONNECTION_POOL_SIZE
+    _api_client = PooledApiClient(configuration)
+    # applies to all connection pools created by the pool manager from now on
+    _api_client.rest_client.pool_manager.connection_pool_kw["socket_options"] = (
+        _keepalive_socket_options()
+    )
+    metrics.K8S_POOL_SIZE.set(config.K8S_CONNECTION_POOL_SIZE)
+    logger.info(
+        f"Connecting to {configuration.host} with a pool of "
+        f"{config.K8S_CONNECTION_POOL_SIZE} connections."
+    )
+
+
+def api_client() -> PooledApiClient:
+    global _api_client
+    if _api_client is None:
+        # only happens if the startup hook didn't run, e.g. in tests
+        _api_client = PooledApiClient()
+    return _api_client
+
+
+def core_v1() -> k8s_client.CoreV1Api:
+    return k8s_client.CoreV1Api(api_client())
+
+
+def operation_of(func: Callable) -> str:
+    return getattr(func, "__name__", "unknown")
+
+
+async def call(func: Callable[..., T], *args, **kwargs) -> T:
+    """Run a kubernetes client call without blocking the event loop.
+
+    If the calling task is cancelled (e.g. the client disconnected) before the
+    call was picked up by a worker thread, it is never sent to the API server.
+    """
+    global _in_flight
+    loop = asyncio.get_running_loop()
+
+    if _in_flight >= config.K8S_CONNECTION_POOL_SIZE:
+        metrics.K8S_POOL_SATURATED.inc()
+    _in_flight += 1
+    metrics.K8S_REQUESTS_IN_FLIGHT.inc()
+    try:
+        operation = operation_of(func)
+        with timing.timed(
+            metrics.K8S_CALL_DURATION, "k8s", operation=operation
+        ), tracing.span(f"k8s {operation}", **{"k8s.operation": operation}):
+            return await loop.run_in_executor(
+                _executor, functools.partial(func, *args, **kwargs)
+            )
+    finally:
+        _in_flight -= 1
+        metrics.K8S_REQUESTS_IN_FLIGHT.dec()
+
+
+async def call_raw(func: Callable, *args, **kwargs) -> bytes:
+    """Like `call`, but returns the response body instead of deserialized models"""
+
+    def read_body(*args, **kwargs) -> bytes:
+        response = func(*args, _preload_content=False, **kwargs)
+        try:
+            return response.data
+        finally:
+            response.release_conn()
+
+    read_body.__name__ = operation_of(func)
+    return await call(read_body, *args, **kwargs)
+
+
+async def coalesced(key: tuple, read: Callable[[], Awaitable[T]]) -> T:
+    """Concurrent reads with the same key share one call and its result.
+
+    The key starts with the operation, e.g. `("read_namespaced_secret", namespace,
+    name)`. As the result is shared, callers must not modify it. The read is
+    finished even if the caller which started it is cancelled, others might wait.
+    """
+    future = _in_flight_reads.get(key)
+    if future is None:
+        future = asyncio.ensure_future(read())
+        _in_flight_reads[key] = future
+        future.add_done_callback(functools.partial(_read_done, key))
+    else:
+        metrics.K8S_COALESCED_CALLS.labels(operation=key[0]).inc()
+    return await asyncio.shield(future)
+
+
+def _read_done(key: tuple, future: asyncio.Future):
+    if _in_flight_reads.get(key) is future:
+        del _in_flight_reads[key]
+    # retrieved, in case all callers were cancelled meanwhile
+    if not future.cancelled():
+        future.exception()
+
+
+def connected() -> bool:
+    return _connected
+
+
+async def check_connection() -> bool:
+    """Open a pooled connection to the API server with a cheap call"""
+    global _connected
+    try:
+        await call(
+            k8s_client.VersionApi(api_client()).get_code,
+            _request_timeout=config.K8S_CONNECT_TIMEOUT,
+        )
+    except Exception as e:
+        logger.warning(f"Kubernetes API server is not reachable: {e}")
+    else:
+        _connected = True
+    return _connected
+
+
+def shutdown():
+    global _api_client, _connected
+    _executor.shutdown(wait=False, cancel_futures=True)
+    if _api_client is not None:
+        _api_client.rest_client.pool_manager.clear()
+        _api_client.close()
+        _api_client = None
+    _connected = False
@@ -0,0 +1,100 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# NOTE: gauges need a multiprocess_mode, they are aggregated over the gunicorn
+#       workers if PROMETHEUS_MULTIPROC_DIR is set
+
+K8S_POOL_SIZE = Gauge(
+    "credential_manager_k8s_connection_pool_size",
+    "Maximum number of pooled connections to the kubernetes API server",
+    multiprocess_mode="livemax",
+)
+K8S_REQUESTS_IN_FLIGHT = Gauge(
+    "credential_manager_k8s_requests_in_flight",
+    "Kubernetes API calls currently running",
+    multiprocess_mode="livesum",
+)
+K8S_POOL_SATURATED = Counter(
+    "credential_manager_k8s_pool_saturated",
+    "Kubernetes API calls started while all pooled connections were in use",
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    "credential_manager_admission_in_flight",
+    "Requests currently admitted by the concurrency limit",
+    multiprocess_mode="livesum",
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "credential_manager_admission_queue_depth",
+    "Requests waiting to be admitted",
+    multiprocess_mode="livesum",
+)
+ADMISSION_SHED = Counter(
+    "credential_manager_admission_shed",
+    "Requests rejected with 503 by the concurrency limit",
+    ["reason"],
+)
+
+K8S_COALESCED_CALLS = Counter(
+    "credential_manager_k8s_coalesced_calls",
+    "Kubernetes API reads which waited for an identical read in flight instead",
+    ["operation"],
+)
+K8S_CALL_DURATION = Histogram(
+    "credential_manager_k8s_call_duration_seconds",
+    "Duration of kubernetes API calls, including the wait for a worker thread",
+    ["operation", "outcome"],
+)
+
+JWKS_FETCH_DURATION = Histogram(
+    "credential_manager_jwks_fetch_duration_seconds",
+    "Duration of fetching the signing keys from the OIDC issuer",
+    ["outcome"],
+)
+TOKEN_CHECK_DURATION = Histogram(
+    "credential_manager_token_check_duration_seconds",
+    "Duration of token checks, including cache lookups",
+    ["outcome"],
+)
+
+TEMPLATE_RENDER_DURATION = Histogram(
+    "credential_manager_template_render_duration_seconds",
+    "Duration of rendering a template",
+    ["template", "outcome"],
+)
+
+SECRET_CACHE_NAMESPACES = Gauge(
+    "credential_manager_secret_cache_namespaces",
+    "Namespaces currently held in the secret cache",
+    multiprocess_mode="livesum",
+)
+SECRET_CACHE_BYTES = Gauge(
+    "credential_manager_secret_cache_bytes",
+    "Estimated memory used by the secret cache",
+    multiprocess_mode="livesum",
+)
+SECRET_CACHE_EVICTIONS = Counter(
+    "credential_manager_secret_cache_evictions",
+    "Namespaces evicted from the secret cache",
+)
+EVENT_STREAMS = Gauge(
+    "credential_manager_event_streams",
+    "Open /events streams",
+    multiprocess_mode="livesum",
+)
+
+FRAGMENT_CACHE_LOOKUPS = Counter(
+    "credential_manager_fragment_cache_lookups",
+    "Lookups of rendered credential cards and encoded secrets, misses are rendered",
+    ["fragment", "result"],
+)
+
+TOKEN_CACHE_LOOKUPS = Counter(
+    "credential_manager_token_cache_lookups",
+    "Token verification cache lookups, misses need an RSA signature verification",
+    ["result"],
+)
+
+SUPPRESSED_WRITES = Counter(
+    "credential_manager_suppressed_writes",
+    "Writes which were skipped because they would not have changed the secret",
+    ["operation"],
+)
@@ -0,0 +1,75 @@
+"""Compact read-only secrets, parsed straight from the API server's JSON.
+
+The kubernetes client builds `V1Secret` and `V1ObjectMeta` models for every
+listed item with its reflective deserializer, which dominates listing large
+namespaces. Lists on the request path fetch the raw response body instead
+(`k8s.call_raw`) and map the items into `CredentialRecord`s.
+"""
+
+import json
+from typing import NamedTuple
+
+from kubernetes import client as k8s_client
+
+
+class CredentialRecord:
+    """The fields of a secret that are read by the views.
+
+    Has the attribute paths of `V1Secret` (e.g. `record.metadata.name`), so
+    records and models can be passed to the same functions.
+    """
+
+    __slots__ = ("name", "resource_version", "type", "annotations", "labels", "data")
+
+    def __init__(
+        self,
+        name: str,
+        resource_version: str | None = None,
+        type: str | None = None,
+        annotations: dict[str, str] | None = None,
+        labels: dict[str, str] | None = None,
+        data: dict[str, str] | None = None,
+    ):
+        self.name = name
+        self.resource_version = resource_version
+        self.type = type
+        self.annotations = annotations
+        self.labels = labels
+        self.data = data
+
+    @property
+    def metadata(self) -> "CredentialRecord":
+        return self
+
+    @classmethod
+    def from_dict(cls, item: dict) -> "CredentialRecord":
+        metadata = item["metadata"]
+        return cls(
+            name=metadata["name"],
+            resource_version=metadata.get("resourceVersion"),
+            type=item.get("type"),
+            annotations=metadata.get("annotations"),
+            labels=metadata.get("labels"),
+            data=item.get("data"),
+        )
+
+    def __repr__(self) -> str:
+        return f"CredentialRecord({self.name!r}@{self.resource_version})"
+
+
+SecretLike = k8s_client.V1Secret | CredentialRecord
+
+
+class RecordPage(NamedTuple):
+    items: list[CredentialRecord]
+    # set if there are more items, to be passed as `_continue` of the next call
+    continue_token: str | None
+
+
+def parse_secret_list(body: bytes) -> RecordPage:
+    """Records of a raw `SecretList` response"""
+    secret_list = json.loads(body)
+    return RecordPage(
+        items=[CredentialRecord.from_dict(item) for item in secret_list["items"] or ()],
+        continue_token=(secret_list.get("metadata") or {}).get("continue") or None,
+    )
@@ -0,0 +1,121 @@
+"""Secret cache shared by all gunicorn workers.
+
+A single publisher process watches the secrets and publishes a snapshot of them
+into a file on a memory backed file system (e.g. `/dev/shm`) on every change.
+The snapshot is replaced atomically, so readers always see a consistent view.
+The workers read the snapshot with `SharedSecretCache`, which has the interface
+of the in-process `SecretInformer` and reloads the snapshot once it changed.
+
+A snapshot is one JSON document per line: a header with the resourceVersion of
+the published secrets, then one line per secret. If the publisher may not list
+or watch the secrets, the header is marked as `forbidden` instead.
+
+The publisher is in `my_credentials/snapshot_publisher.py`.
+"""
+
+import json
+import logging
+import os
+import time
+
+from my_credentials import config
+from my_credentials.informer import ERROR_BACKOFF_SECONDS, SecretInformer
+from my_credentials.records import CredentialRecord, SecretLike
+
+logger = logging.getLogger(__name__)
+
+# own writes are shown until the snapshot contains them, but at most this long
+PENDING_WRITE_TTL = 30
+
+
+def snapshot_path(namespace: str) -> str:
+    return os.path.join(config.SHARED_SECRET_CACHE_DIR, f"{namespace}.json")
+
+
+class SharedSecretCache(SecretInformer):
+    """Serves the secrets from the snapshot published by the publisher process.
+
+    The snapshot is polled and reloaded by a thread, so reads never wait for it.
+    Secrets are kept as compact `CredentialRecord`s, though still once per worker.
+    The snapshot only counts as synced while the publisher keeps it fresh, so the
+    reads fall back to the API server if the publisher is gone.
+    """
+
+    def __init__(self, namespace: str, label_selector: str):
+        super().__init__(namespace, label_selector)
+        self.path = snapshot_path(namespace)
+        # the stat of the loaded snapshot, which is only read again once it changed
+        self._loaded: tuple[int, int] | None = None
+        # own writes by name, which might not be in the snapshot yet
+        self._pending: dict[str, tuple[str, SecretLike, float]] = {}
+
+    def apply_own_write(self, event_type: str, secret: SecretLike) -> bool:
+        if not super().apply_own_write(event_type, secret):
+            return False
+        with self._lock:
+            self._pending[secret.metadata.name] = (
+                event_type,
+                secret,
+                time.monotonic() + PENDING_WRITE_TTL,
+            )
+        return True
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self._reload()
+            except Exception:
+                logger.exception(f"Reloading snapshot '{self.path}' failed")
+                self._stopped.wait(ERROR_BACKOFF_SECONDS)
+            self._stopped.wait(config.SHARED_SECRET_CACHE_POLL_INTERVAL)
+
+    def _reload(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._synced.clear()
+            return
+        if time.time() - stat.st_mtime > config.SHARED_SECRET_CACHE_MAX_AGE:
+            if self._synced.is_set():
+                logger.warning(f"Snapshot '{self.path}' is stale, not using it.")
+            self._synced.clear()
+            return
+        if (stat.st_ino, stat.st_mtime_ns) == self._loaded:
+            if not self.forbidden:
+                self._synced.set()
+            return
+
+        with open(self.path, "rb") as f:
+            header = json.loads(f.readline())
+            self.forbidden = header.get("forbidden", False)
+            # the publisher touches the snapshot regularly without changing it
+            if not self.forbidden and not (
+                self._listed and header["resourceVersion"] == self.resource_version
+            ):
+                self._load(header["resourceVersion"], f)
+        self._loaded = (stat.st_ino, stat.st_mtime_ns)
+        if self.forbidden:
+            self._synced.clear()
+        else:
+            self._synced.set()
+
+    def _load(self, resource_version: str, lines):
+        secrets = [CredentialRecord.from_dict(json.loads(line)) for line in lines]
+        with self._lock:
+            previous = self._secrets
+            # recorded at once, own writes which aren't published yet would flap otherwise
+            listed = self._listed
+            self.resource_version = resource_version
+            self._replace(secrets, record=False)
+            self._apply_pending()
+            if listed:
+                self._record_diff(previous)
+
+    def _apply_pending(self):
+        now = time.monotonic()
+        for name, (event_type, secret, deadline) in list(self._pending.items()):
+            # published, or superseded by a newer change
+            if self._is_outdated(event_type, secret) or deadline < now:
+                del self._pending[name]
+            else:
+                self._apply(event_type, secret, record=False)
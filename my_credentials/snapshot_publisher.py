@@ -0,0 +1,102 @@
+"""Publishes the secrets for the workers' `SharedSecretCache`.
+
+Run with `python -m my_credentials.snapshot_publisher`, `gunicorn.conf.py` does so
+if `SHARED_SECRET_CACHE_DIR` is set.
+"""
+
+import contextlib
+import json
+import logging
+import os
+import signal
+import threading
+
+from my_credentials import config, k8s
+from my_credentials.informer import ERROR_BACKOFF_SECONDS, SecretInformer
+from my_credentials.shared_cache import snapshot_path
+
+logger = logging.getLogger(__name__)
+
+# at most one snapshot is published in this interval
+PUBLISH_MIN_INTERVAL = 0.05
+
+
+class SnapshotPublisher:
+    """Publishes the secrets of an informer on every change, and touches the
+    snapshot regularly to show that it is still up to date"""
+
+    def __init__(self, informer: SecretInformer):
+        self.informer = informer
+        self.path = snapshot_path(informer.namespace)
+        self._changed = threading.Event()
+        self._stopped = threading.Event()
+
+    def run(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.informer.on_change = self._changed.set
+        self.informer.start()
+        while not self._stopped.is_set():
+            try:
+                if self._changed.wait(config.SHARED_SECRET_CACHE_MAX_AGE / 3):
+                    self._changed.clear()
+                    self.publish()
+                    self._stopped.wait(PUBLISH_MIN_INTERVAL)
+                elif self.informer.synced or self.informer.forbidden:
+                    os.utime(self.path)
+            except Exception:
+                # e.g. the file system is full or the snapshot was removed
+                logger.exception(f"Publishing '{self.path}' failed, retrying.")
+                self._changed.set()
+                self._stopped.wait(ERROR_BACKOFF_SECONDS)
+        self.informer.stop()
+
+    def stop(self):
+        self._stopped.set()
+        self._changed.set()
+
+    def publish(self):
+        api_client = k8s.api_client()
+        resource_version, secrets = self.informer.snapshot()
+        forbidden = self.informer.forbidden
+        if forbidden:
+            # tells the workers to read from the API server
+            resource_version, secrets = None, []
+        temporary_path = f"{self.path}.{os.getpid()}.tmp"
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(temporary_path)
+        try:
+            # the snapshot holds the values of all secrets
+            fd = os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with open(fd, "w") as f:
+                header = {"resourceVersion": resource_version, "forbidden": forbidden}
+                f.write(json.dumps(header) + "\n")
+                for secret in secrets:
+                    serialized = api_client.sanitize_for_serialization(secret)
+                    f.write(json.dumps(serialized) + "\n")
+            os.replace(temporary_path, self.path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(temporary_path)
+            raise
+        logger.info(
+            f"Published {len(secrets)} secrets at resourceVersion {resource_version}."
+        )
+
+
+def main():
+    from my_credentials import views
+
+    if config.MULTI_TENANT:
+        raise SystemExit("The shared secret cache doesn't support multi-tenant mode.")
+
+    views.load_k8s_config()
+    publisher = SnapshotPublisher(
+        SecretInformer(views.current_namespace(), views.MY_SECRETS_LABEL_SELECTOR)
+    )
+    signal.signal(signal.SIGTERM, lambda *args: publisher.stop())
+    signal.signal(signal.SIGINT, lambda *args: publisher.stop())
+    publisher.run()
+
+
+if __name__ == "__main__":
+    main()
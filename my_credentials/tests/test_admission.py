@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+from my_credentials import admission, config, metrics
+
+
+@pytest.fixture()
+def controller(monkeypatch):
+    monkeypatch.setattr(config, "ADMISSION_MAX_CONCURRENCY", 1)
+    monkeypatch.setattr(config, "ADMISSION_MAX_QUEUED", 4)
+    monkeypatch.setattr(config, "ADMISSION_MAX_QUEUED_PER_USER", 2)
+    monkeypatch.setattr(config, "ADMISSION_QUEUE_TIMEOUT", 5)
+    controller = admission.AdmissionController()
+    monkeypatch.setattr(admission, "controller", controller)
+    return controller
+
+
+def shed(reason: str) -> float:
+    return metrics.ADMISSION_SHED.labels(reason=reason)._value.get()
+
+
+async def hold(controller, user: str, admitted: list, release: asyncio.Event):
+    async with controller.admit(user):
+        admitted.append(user)
+        await release.wait()
+
+
+@pytest.mark.asyncio
+async def test_waiting_users_are_admitted_round_robin(controller):
+    admitted: list[str] = []
+    releases = []
+    for user in ["a", "a", "a", "b", "c"]:
+        releases.append(asyncio.Event())
+        asyncio.ensure_future(hold(controller, user, admitted, releases[-1]))
+        await asyncio.sleep(0)
+
+    assert admitted == ["a"]
+    assert controller.queued == 4
+
+    for release in releases:
+        release.set()
+        await asyncio.sleep(0.01)
+
+    # b and c don't wait behind all the requests of a
+    assert admitted == ["a", "a", "b", "c", "a"]
+    assert controller.in_flight == controller.queued == 0
+
+
+@pytest.mark.asyncio
+async def test_full_queues_are_shed(controller, monkeypatch):
+    monkeypatch.setattr(config, "ADMISSION_MAX_QUEUED", 3)
+    release = asyncio.Event()
+    admitted: list[str] = []
+    before_user, before_total = shed("user_queue_full"), shed("queue_full")
+
+    for user in ["a", "a", "a", "b"]:
+        asyncio.ensure_future(hold(controller, user, admitted, release))
+    await asyncio.sleep(0)
+
+    with pytest.raises(admission.Overloaded, match="user_queue_full"):
+        await hold(controller, "a", admitted, release)
+    with pytest.raises(admission.Overloaded, match="queue_full"):
+        await hold(controller, "c", admitted, release)
+    assert shed("user_queue_full") == before_user + 1
+    assert shed("queue_full") == before_total + 1
+    assert metrics.ADMISSION_QUEUE_DEPTH._value.get() == 3
+
+    release.set()
+    await asyncio.sleep(0.01)
+    assert admitted == ["a", "a", "b", "a"]
+
+
+@pytest.mark.asyncio
+async def test_requests_waiting_too_long_are_shed(controller, monkeypatch):
+    monkeypatch.setattr(config, "ADMISSION_QUEUE_TIMEOUT", 0.01)
+    release = asyncio.Event()
+    admitted: list[str] = []
+    before = shed("timeout")
+    asyncio.ensure_future(hold(controller, "a", admitted, release))
+    await asyncio.sleep(0)
+
+    with pytest.raises(admission.Overloaded, match="timeout"):
+        await hold(controller, "b", admitted, release)
+
+    assert shed("timeout") == before + 1
+    assert controller.queued == 0
+    release.set()
+    await asyncio.sleep(0)
+    assert controller.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiters_leave_the_queue(controller):
+    release = asyncio.Event()
+    admitted: list[str] = []
+    asyncio.ensure_future(hold(controller, "a", admitted, release))
+    waiting = asyncio.ensure_future(hold(controller, "b", admitted, release))
+    await asyncio.sleep(0)
+
+    waiting.cancel()
+    await asyncio.sleep(0.01)
+    assert controller.queued == 0
+
+    release.set()
+    await asyncio.sleep(0)
+    assert admitted == ["a"]
+    assert controller.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_overloaded_requests_get_503_with_retry_after(
+    client, controller, monkeypatch
+):
+    monkeypatch.setattr(config, "ADMISSION_MAX_QUEUED", 0)
+    release = asyncio.Event()
+    holder = asyncio.ensure_future(hold(controller, "other", [], release))
+    await asyncio.sleep(0)
+
+    response = await client.get("/")
+    probe = await client.get("/probe")
+    release.set()
+    await holder
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(config.ADMISSION_RETRY_AFTER)
+    # infrastructure views are never queued
+    assert probe.status_code == 200
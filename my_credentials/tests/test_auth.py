@@ -0,0 +1,121 @@
+import time
+from unittest import mock
+
+import cachetools
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+import jwt
+import pytest
+
+from my_credentials import config, metrics, views
+
+
+@pytest.fixture(scope="module")
+def private_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+@pytest.fixture(autouse=True)
+def mock_signing_key(private_key):
+    with mock.patch(
+        "my_credentials.views.jwks_client.get_signing_key",
+        return_value=mock.Mock(key=private_key.public_key()),
+    ) as mocker:
+        yield mocker
+
+
+@pytest.fixture(autouse=True)
+def empty_token_cache():
+    views.token_cache.clear()
+    yield
+    views.token_cache.clear()
+
+
+def make_token(private_key, expires_in: float = 600, **claims) -> str:
+    return jwt.encode(
+        {"aud": "account", "exp": time.time() + expires_in, **claims},
+        private_key,
+        algorithm="RS256",
+    )
+
+
+def lookups(result: str) -> float:
+    return metrics.TOKEN_CACHE_LOOKUPS.labels(result=result)._value.get()
+
+
+@pytest.mark.asyncio
+async def test_valid_token_is_verified_once(private_key):
+    token = make_token(private_key, sub="foo")
+    hits, misses = lookups("hit"), lookups("miss")
+
+    with mock.patch("my_credentials.views.jwt.decode", wraps=jwt.decode) as decode:
+        assert (await views.check_token_content(token))["sub"] == "foo"
+        assert (await views.check_token_content(token))["sub"] == "foo"
+
+    assert decode.call_count == 1
+    assert lookups("hit") == hits + 1
+    assert lookups("miss") == misses + 1
+
+
+@pytest.mark.asyncio
+async def test_tokens_of_different_users_are_cached_separately(private_key):
+    tokens = [make_token(private_key, sub=f"user-{i}") for i in range(3)]
+
+    for token in tokens:
+        await views.check_token_content(token)
+
+    with mock.patch("my_credentials.views.jwt.decode") as decode:
+        for token in tokens:
+            await views.check_token_content(token)
+
+    decode.assert_not_called()
+
+
+@pytest.fixture()
+def clock(monkeypatch):
+    clock = mock.Mock(return_value=time.time())
+    monkeypatch.setattr(
+        views,
+        "token_cache",
+        cachetools.TLRUCache(maxsize=10, ttu=views._token_cache_ttu, timer=clock),
+    )
+    return clock
+
+
+def is_cached(token: str) -> bool:
+    return views.hashlib.sha256(token.encode()).hexdigest() in views.token_cache
+
+
+@pytest.mark.asyncio
+async def test_cached_token_is_not_valid_after_it_expired(private_key, clock):
+    token = make_token(private_key, expires_in=60)
+    await views.check_token_content(token)
+    assert is_cached(token)
+
+    clock.return_value += 61
+
+    assert not is_cached(token)
+
+
+@pytest.mark.asyncio
+async def test_cache_lifetime_is_capped(private_key, clock):
+    token = make_token(private_key, expires_in=10 * config.TOKEN_CACHE_MAX_TTL)
+    await views.check_token_content(token)
+
+    clock.return_value += config.TOKEN_CACHE_MAX_TTL + 1
+
+    assert not is_cached(token)
+
+
+@pytest.mark.asyncio
+async def test_invalid_token_is_cached_briefly(private_key):
+    other_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    token = make_token(other_key)
+
+    with mock.patch("my_credentials.views.jwt.decode", wraps=jwt.decode) as decode:
+        for _ in range(2):
+            with pytest.raises(HTTPException) as e:
+                await views.check_token_content(token)
+            assert e.value.status_code == 401
+
+    assert decode.call_count == 1
@@ -0,0 +1,339 @@
+import threading
+from unittest import mock
+
+from kubernetes import client as k8s_client
+from kubernetes.client.exceptions import ApiException
+import pytest
+
+from my_credentials import config
+from my_credentials import informer as informer_module
+from my_credentials.informer import SecretInformer
+
+
+def make_secret(
+    name: str, resource_version: str = "1", annotations: dict | None = None
+) -> k8s_client.V1Secret:
+    return k8s_client.V1Secret(
+        metadata=k8s_client.V1ObjectMeta(
+            name=name,
+            resource_version=resource_version,
+            annotations=annotations,
+        ),
+        data={},
+        type="Opaque",
+    )
+
+
+def make_event(type: str, secret: k8s_client.V1Secret) -> dict:
+    return {
+        "type": type,
+        "object": secret,
+        "raw_object": {
+            "metadata": {
+                "name": secret.metadata.name,
+                "resourceVersion": secret.metadata.resource_version,
+            }
+        },
+    }
+
+
+@pytest.fixture()
+def informer():
+    return SecretInformer(namespace="foo", label_selector="owner=me")
+
+
+@pytest.fixture()
+def mock_list():
+    with mock.patch(
+        "my_credentials.informer.k8s_client.CoreV1Api.list_namespaced_secret",
+        return_value=k8s_client.V1SecretList(
+            metadata=k8s_client.V1ListMeta(resource_version="10"),
+            items=[make_secret("b"), make_secret("a")],
+        ),
+    ) as mocker:
+        yield mocker
+
+
+def mock_watch(events=(), error=None):
+    def stream(*args, **kwargs):
+        yield from events
+        if error:
+            raise error
+
+    return mock.patch(
+        "my_credentials.informer.k8s_watch.Watch.stream",
+        side_effect=stream,
+    )
+
+
+def test_relist_fills_cache_and_marks_synced(informer, mock_list):
+    assert not informer.synced
+
+    informer._relist()
+
+    assert informer.synced
+    assert informer.resource_version == "10"
+    assert [s.metadata.name for s in informer.list_all()] == ["a", "b"]
+    assert mock_list.mock_calls[0].kwargs["label_selector"] == "owner=me"
+
+
+def test_watch_applies_events_and_tracks_resource_version(informer, mock_list):
+    informer._relist()
+    events = [
+        make_event("ADDED", make_secret("c", "11")),
+        make_event("MODIFIED", make_secret("a", "12")),
+        make_event("DELETED", make_secret("b", "13")),
+    ]
+    with mock_watch(events) as stream:
+        informer._watch_once()
+
+    assert stream.mock_calls[0].kwargs["resource_version"] == "10"
+    assert stream.mock_calls[0].kwargs["allow_watch_bookmarks"]
+    assert [s.metadata.name for s in informer.list_all()] == ["a", "c"]
+    assert informer.get("a").metadata.resource_version == "12"
+    assert informer.resource_version == "13"
+
+
+def test_changes_are_recorded_after_initial_list(informer, mock_list):
+    informer._relist()
+    start = informer.last_event_id
+    events = [
+        make_event("ADDED", make_secret("c", "11")),
+        make_event("MODIFIED", make_secret("a", "12", {"eoxhub-env-app": "true"})),
+        make_event("DELETED", make_secret("b", "13")),
+    ]
+    with mock_watch(events):
+        informer._watch_once()
+    # relisting after the watch expired records what was missed
+    mock_list.return_value = k8s_client.V1SecretList(
+        metadata=k8s_client.V1ListMeta(resource_version="20"),
+        items=[make_secret("a", "12"), make_secret("d", "14")],
+    )
+    informer._relist()
+
+    changes = [(e.type, e.name) for e in informer.events_after(start)]
+    assert changes == [
+        ("ADDED", "c"),
+        ("MODIFIED", "a"),
+        ("DELETED", "b"),
+        ("DELETED", "c"),
+        ("ADDED", "d"),
+    ]
+    assert informer.events_after(informer.last_event_id) == []
+
+
+def test_events_can_only_be_resumed_while_buffered(monkeypatch):
+    monkeypatch.setattr(config, "EVENTS_BUFFER_SIZE", 2)
+    informer = SecretInformer(namespace="foo", label_selector="owner=me")
+    informer._replace_all([])
+    start = informer.last_event_id
+    informer.apply("ADDED", make_secret("a", "1"))
+    after_first = informer.last_event_id
+    informer.apply("ADDED", make_secret("b", "2"))
+    informer.apply("ADDED", make_secret("c", "3"))
+
+    assert informer.events_after(start) is None
+    assert [e.name for e in informer.events_after(after_first)] == ["b", "c"]
+    assert informer.events_after("other-epoch-1") is None
+
+
+def test_bookmark_only_advances_resource_version(informer, mock_list):
+    informer._relist()
+    bookmark = {
+        "type": "BOOKMARK",
+        "object": {"metadata": {"resourceVersion": "42"}},
+        "raw_object": {"metadata": {"resourceVersion": "42"}},
+    }
+    with mock_watch([bookmark]):
+        informer._watch_once()
+
+    assert informer.resource_version == "42"
+    assert len(informer.list_all()) == 2
+
+
+def test_snapshot_has_the_secrets_of_its_resource_version(informer, mock_list):
+    informer._relist()
+    event = make_event("ADDED", make_secret("c", "11"))
+
+    # the watch applies an event while a snapshot is taken
+    with informer._lock:
+        watch = threading.Thread(target=informer._handle_event, args=(event,))
+        watch.start()
+        watch.join(timeout=0.1)
+        assert informer.resource_version == "10"
+    watch.join()
+
+    resource_version, secrets = informer.snapshot()
+    assert resource_version == "11"
+    assert [s.metadata.name for s in secrets] == ["a", "b", "c"]
+
+
+def test_gone_triggers_relist(informer, mock_list):
+    informer._relist()
+
+    def stream(*args, **kwargs):
+        # stop after the relist to end the loop
+        if mock_list.call_count > 1:
+            informer.stop()
+            return
+        raise ApiException(status=410, reason="Gone")
+        yield
+
+    with mock.patch(
+        "my_credentials.informer.k8s_watch.Watch.stream",
+        side_effect=stream,
+    ):
+        informer._run()
+
+    assert mock_list.call_count == 2
+    assert informer.resource_version == "10"
+
+
+def test_forbidden_watch_falls_back_to_the_api_server(informer, mock_list):
+    def stream(*args, **kwargs):
+        # missing the watch verb, stopped to end the loop
+        informer.stop()
+        raise ApiException(status=403, reason="Forbidden")
+        yield
+
+    with mock.patch(
+        "my_credentials.informer.k8s_watch.Watch.stream",
+        side_effect=stream,
+    ):
+        informer._run()
+
+    assert informer.forbidden
+    assert not informer.synced
+    assert informer.resource_version is None
+
+    informer._relist()
+    assert not informer.forbidden
+    assert informer.synced
+
+
+def test_app_index_follows_annotation_changes(informer):
+    def injected_into_jupyterlab():
+        return [s.metadata.name for s in informer.list_for_app("jupyterlab")]
+
+    informer.apply("ADDED", make_secret("a"))
+    assert injected_into_jupyterlab() == []
+
+    informer.apply(
+        "MODIFIED", make_secret("a", annotations={"eoxhub-env-jupyterlab": "True"})
+    )
+    informer.apply(
+        "ADDED", make_secret("b", annotations={"eoxhub-env-jupyterlab": "True"})
+    )
+    assert injected_into_jupyterlab() == ["a", "b"]
+
+    # toggled off
+    informer.apply(
+        "MODIFIED", make_secret("a", annotations={"eoxhub-env-jupyterlab": None})
+    )
+    informer.apply("DELETED", make_secret("b"))
+    assert injected_into_jupyterlab() == []
+
+
+@pytest.fixture()
+def registry(monkeypatch):
+    monkeypatch.setattr(informer_module.SecretInformer, "start", mock.Mock())
+    yield informer_module
+    informer_module.stop_informers()
+
+
+def cached_namespaces() -> list[str]:
+    return list(informer_module._informers)
+
+
+def test_least_recently_used_namespace_is_evicted(registry, monkeypatch):
+    monkeypatch.setattr(config, "SECRET_CACHE_MAX_NAMESPACES", 2)
+
+    a = registry.start_informer("a", "owner=me")
+    registry.start_informer("b", "owner=me")
+    registry.get_informer("a")
+    registry.start_informer("c", "owner=me")
+
+    assert cached_namespaces() == ["a", "c"]
+    assert registry.get_informer("b") is None
+    assert registry.get_informer("a") is a
+
+
+def test_checking_if_cached_does_not_count_as_use(registry, monkeypatch):
+    monkeypatch.setattr(config, "SECRET_CACHE_MAX_NAMESPACES", 2)
+
+    a = registry.start_informer("a", "owner=me")
+    registry.start_informer("b", "owner=me")
+    # e.g. by an open event stream of a
+    assert registry.is_cached(a)
+    registry.start_informer("c", "owner=me")
+
+    assert cached_namespaces() == ["b", "c"]
+    assert not registry.is_cached(a)
+
+
+def test_namespaces_are_evicted_above_memory_budget(registry, monkeypatch):
+    monkeypatch.setattr(config, "SECRET_CACHE_MEMORY_BUDGET_MB", 1)
+    big_secret = make_secret("big")
+    big_secret.data = {"key": "x" * 600 * 1024}
+
+    a = registry.start_informer("a", "owner=me")
+    a.apply("ADDED", big_secret)
+    b = registry.start_informer("b", "owner=me")
+    assert cached_namespaces() == ["a", "b"]
+
+    b.apply("ADDED", big_secret)
+    registry.get_informer("b")
+
+    assert cached_namespaces() == ["b"]
+    assert a._stopped.is_set()
+    # the most recently used namespace is kept even if it exceeds the budget alone
+    b.apply("MODIFIED", copy_with_data(big_secret, "y" * 2 * 1024 * 1024))
+    assert registry.get_informer("b") is b
+
+
+def copy_with_data(secret: k8s_client.V1Secret, value: str) -> k8s_client.V1Secret:
+    return k8s_client.V1Secret(
+        metadata=secret.metadata, data={"key": value}, type=secret.type
+    )
+
+
+def test_size_follows_changes(informer):
+    informer.apply("ADDED", make_secret("a"))
+    informer.apply("ADDED", copy_with_data(make_secret("b"), "x" * 100))
+    size = informer.size
+
+    informer.apply("MODIFIED", copy_with_data(make_secret("b"), "x" * 300))
+    assert informer.size == size + 200
+
+    informer.apply("DELETED", make_secret("b"))
+    informer.apply("DELETED", make_secret("a"))
+    assert informer.size == 0
+
+
+def test_own_writes_do_not_overwrite_newer_changes(informer):
+    informer.apply("ADDED", make_secret("a", "5"))
+    informer.resource_version = "5"
+
+    # the watch already applied a newer change than our write
+    assert not informer.apply_own_write("MODIFIED", make_secret("a", "4"))
+    assert informer.get("a").metadata.resource_version == "5"
+
+    assert informer.apply_own_write("MODIFIED", make_secret("a", "6"))
+    assert informer.get("a").metadata.resource_version == "6"
+
+    # the watch already saw the secret deleted after our write
+    informer.apply("DELETED", make_secret("a", "8"))
+    informer.resource_version = "8"
+    assert not informer.apply_own_write("MODIFIED", make_secret("a", "7"))
+    assert informer.get("a") is None
+
+
+def test_own_deletes_only_remove_the_deleted_version(informer):
+    # created again by someone else after our delete
+    informer.apply("ADDED", make_secret("a", "5"))
+
+    assert not informer.apply_own_write("DELETED", make_secret("a", "3"))
+    assert informer.get("a").metadata.resource_version == "5"
+
+    assert informer.apply_own_write("DELETED", make_secret("a", "5"))
+    assert informer.get("a") is None
@@ -0,0 +1,147 @@
+import http
+
+from fastapi import HTTPException, Request
+import pytest
+
+from my_credentials import config
+from my_credentials.intake import MAX_KEY_SIZE, read_form
+from my_credentials.tests.conftest import (
+    BOUNDARY,
+    KEY,
+    multipart_body,
+    multipart_part,
+)
+
+
+def streamed_request(chunks: list[bytes], content_type: str) -> tuple[Request, list]:
+    """Request receiving the body in chunks, without a content-length header"""
+    received: list[bytes] = []
+    pending = list(chunks)
+
+    async def receive():
+        chunk = pending.pop(0)
+        received.append(chunk)
+        return {"type": "http.request", "body": chunk, "more_body": bool(pending)}
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "headers": [(b"content-type", content_type.encode())],
+    }
+    return Request(scope, receive), received
+
+
+def chunked(body: bytes, size: int) -> list[bytes]:
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+@pytest.mark.asyncio
+async def test_multipart_fields_and_key_file_are_parsed():
+    body = multipart_body(
+        multipart_part("credentials_name", b"my-key"),
+        multipart_part("ssh_file", KEY.encode(), filename="id_ed25519"),
+    )
+    request, _ = streamed_request(
+        chunked(body, 7), f"multipart/form-data; boundary={BOUNDARY}"
+    )
+
+    intake = await read_form(request)
+
+    assert intake.form["credentials_name"] == "my-key"
+    ssh_file = intake.keys["ssh_file"]
+    assert ssh_file.filename == "id_ed25519"
+    assert ssh_file.content == KEY
+    assert ssh_file.error is None
+    # parsed once per request
+    assert await read_form(request) is intake
+
+
+@pytest.mark.asyncio
+async def test_key_split_within_utf8_character_is_decoded():
+    key = KEY.replace("abc", "äöü")
+    body = multipart_body(multipart_part("privatekey", key.encode()))
+    # every other chunk ends within a two-byte character
+    request, _ = streamed_request(
+        chunked(body, 3), f"multipart/form-data; boundary={BOUNDARY}"
+    )
+
+    intake = await read_form(request)
+
+    assert intake.keys["privatekey"].content == key
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "key, error",
+    [
+        (b"a" * (MAX_KEY_SIZE + 1), "Content exceeds the 10KB size limit."),
+        (b"\xff\xfe" + KEY.encode(), "Content is not valid UTF-8 text."),
+    ],
+)
+async def test_invalid_key_material_is_dropped(key, error):
+    body = multipart_body(
+        multipart_part("ssh_file", key, filename="id_rsa"),
+        multipart_part("type", b"kubernetes.io/ssh-auth"),
+    )
+    request, _ = streamed_request(
+        chunked(body, 1024), f"multipart/form-data; boundary={BOUNDARY}"
+    )
+
+    intake = await read_form(request)
+
+    assert intake.keys["ssh_file"].error == error
+    assert intake.keys["ssh_file"].content == ""
+    assert intake.form["type"] == "kubernetes.io/ssh-auth"
+
+
+@pytest.mark.asyncio
+async def test_oversized_body_is_rejected_while_received(monkeypatch):
+    monkeypatch.setattr(config, "FORM_MAX_BODY_SIZE", 4096)
+    body = multipart_body(multipart_part("secret_value", b"a" * 100_000))
+    request, received = streamed_request(
+        chunked(body, 1024), f"multipart/form-data; boundary={BOUNDARY}"
+    )
+
+    with pytest.raises(HTTPException) as e:
+        await read_form(request)
+
+    assert e.value.status_code == http.HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+    assert len(received) == 5
+
+
+@pytest.mark.asyncio
+async def test_oversized_field_is_rejected(monkeypatch):
+    monkeypatch.setattr(config, "FORM_MAX_FIELD_SIZE", 10)
+    request, _ = streamed_request(
+        [b"secret_key=user&secret_value=" + b"a" * 11],
+        "application/x-www-form-urlencoded",
+    )
+
+    with pytest.raises(HTTPException) as e:
+        await read_form(request)
+
+    assert e.value.status_code == http.HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+
+
+@pytest.mark.asyncio
+async def test_unexpected_file_upload_is_rejected():
+    body = multipart_body(multipart_part("other", b"data", filename="data.bin"))
+    request, _ = streamed_request([body], f"multipart/form-data; boundary={BOUNDARY}")
+
+    with pytest.raises(HTTPException) as e:
+        await read_form(request)
+
+    assert e.value.status_code == http.HTTPStatus.BAD_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_urlencoded_privatekey_is_decoded():
+    request, _ = streamed_request(
+        [b"type=kubernetes.io%2Fssh-auth&privatekey=-----BEGIN+RSA", b"+KEY-----"],
+        "application/x-www-form-urlencoded",
+    )
+
+    intake = await read_form(request)
+
+    assert intake.form["type"] == "kubernetes.io/ssh-auth"
+    assert intake.keys["privatekey"].content == "-----BEGIN RSA KEY-----"
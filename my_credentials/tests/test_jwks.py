@@ -0,0 +1,92 @@
+import asyncio
+import threading
+from unittest import mock
+
+from cryptography.hazmat.primitives.asymmetric import rsa
+import jwt
+import pytest
+import requests
+
+from my_credentials.jwks import JWKSClient
+
+
+@pytest.fixture(scope="module")
+def private_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def make_jwks(private_key, kid: str) -> dict:
+    jwk = jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key(), as_dict=True)
+    return {"keys": [{**jwk, "kid": kid, "use": "sig", "alg": "RS256"}]}
+
+
+def make_token(private_key, kid: str) -> str:
+    return jwt.encode({}, private_key, algorithm="RS256", headers={"kid": kid})
+
+
+@pytest.fixture()
+def client():
+    return JWKSClient("https://issuer")
+
+
+@pytest.mark.asyncio
+async def test_known_key_is_served_from_memory(client, private_key):
+    with mock.patch.object(
+        client, "_download", return_value=make_jwks(private_key, "a")
+    ) as download:
+        await client.refresh()
+        key = await client.get_signing_key(make_token(private_key, "a"))
+
+    assert key.key_id == "a"
+    assert download.call_count == 1
+    assert client.ready
+
+
+@pytest.mark.asyncio
+async def test_unknown_kid_refetches_once_for_all_waiters(client, private_key):
+    release = threading.Event()
+
+    def download():
+        release.wait(5)
+        return make_jwks(private_key, "new")
+
+    with mock.patch.object(client, "_download", side_effect=download) as mocker:
+        waiters = [
+            asyncio.ensure_future(client.get_signing_key(make_token(private_key, "new")))
+            for _ in range(5)
+        ]
+        await asyncio.sleep(0.01)
+        release.set()
+        keys = await asyncio.gather(*waiters)
+
+    assert mocker.call_count == 1
+    assert all(key.key_id == "new" for key in keys)
+
+
+@pytest.mark.asyncio
+async def test_unknown_kid_refetch_is_rate_limited(client, private_key):
+    with mock.patch.object(
+        client, "_download", return_value=make_jwks(private_key, "a")
+    ) as download:
+        for _ in range(3):
+            with pytest.raises(jwt.InvalidTokenError):
+                await client.get_signing_key(make_token(private_key, "unknown"))
+
+    assert download.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_keys_are_kept_if_issuer_is_unreachable(client, private_key):
+    with mock.patch.object(
+        client, "_download", return_value=make_jwks(private_key, "a")
+    ):
+        await client.refresh()
+
+    with mock.patch.object(
+        client, "_download", side_effect=requests.ConnectionError
+    ):
+        with pytest.raises(requests.ConnectionError):
+            await client.refresh()
+
+    key = await client.get_signing_key(make_token(private_key, "a"))
+    assert key.key_id == "a"
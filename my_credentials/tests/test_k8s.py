@@ -0,0 +1,181 @@
+import asyncio
+import socket
+import threading
+from unittest import mock
+
+from kubernetes.client.exceptions import ApiException
+from prometheus_client import REGISTRY
+import pytest
+
+from my_credentials import config, k8s, metrics
+
+
+@pytest.mark.asyncio
+async def test_call_does_not_block_event_loop():
+    release = threading.Event()
+    slow_call = asyncio.ensure_future(k8s.call(release.wait, 5))
+
+    # the loop is still free to run other coroutines
+    await asyncio.sleep(0.01)
+    assert not slow_call.done()
+
+    release.set()
+    assert await slow_call is True
+
+
+@pytest.mark.asyncio
+async def test_cancelled_call_is_not_executed_if_not_started(monkeypatch):
+    blocker = threading.Event()
+    monkeypatch.setattr(
+        k8s,
+        "_executor",
+        k8s.concurrent.futures.ThreadPoolExecutor(max_workers=1),
+    )
+    calls = []
+
+    first = asyncio.ensure_future(k8s.call(blocker.wait, 5))
+    queued = asyncio.ensure_future(k8s.call(calls.append, "executed"))
+    await asyncio.sleep(0.01)
+
+    queued.cancel()
+    # cancellation is propagated to the thread pool on the next loop iteration
+    await asyncio.sleep(0)
+    blocker.set()
+    await first
+    k8s._executor.shutdown(wait=True)
+
+    assert queued.cancelled()
+    assert calls == []
+
+
+def test_pooled_api_client_applies_default_timeouts():
+    client = k8s.PooledApiClient()
+    with mock.patch(
+        "my_credentials.k8s.k8s_client.ApiClient.request"
+    ) as request:
+        client.request("GET", "http://localhost")
+        client.request("GET", "http://localhost", _request_timeout=(1, 2))
+
+    assert request.mock_calls[0].kwargs["_request_timeout"] == (
+        config.K8S_CONNECT_TIMEOUT,
+        config.K8S_READ_TIMEOUT,
+    )
+    assert request.mock_calls[1].kwargs["_request_timeout"] == (1, 2)
+
+
+def test_connect_configures_pool_and_keepalive():
+    with mock.patch.object(k8s, "_api_client", None):
+        k8s.connect()
+        pool_manager = k8s.api_client().rest_client.pool_manager
+
+    assert pool_manager.connection_pool_kw["maxsize"] == config.K8S_CONNECTION_POOL_SIZE
+    assert (
+        socket.SOL_SOCKET,
+        socket.SO_KEEPALIVE,
+        1,
+    ) in pool_manager.connection_pool_kw["socket_options"]
+
+
+@pytest.mark.asyncio
+async def test_saturated_pool_is_counted(monkeypatch):
+    monkeypatch.setattr(config, "K8S_CONNECTION_POOL_SIZE", 0)
+    before = metrics.K8S_POOL_SATURATED._value.get()
+
+    await k8s.call(lambda: None)
+
+    assert metrics.K8S_POOL_SATURATED._value.get() == before + 1
+
+
+def call_count(operation: str, outcome: str) -> float:
+    return REGISTRY.get_sample_value(
+        "credential_manager_k8s_call_duration_seconds_count",
+        {"operation": operation, "outcome": outcome},
+    ) or 0
+
+
+@pytest.mark.asyncio
+async def test_calls_are_timed_per_operation_and_outcome():
+    def read_namespaced_secret():
+        raise ApiException(status=404)
+
+    def list_namespaced_secret():
+        return []
+
+    not_found = call_count("read_namespaced_secret", "404")
+    success = call_count("list_namespaced_secret", "success")
+
+    await k8s.call(list_namespaced_secret)
+    with pytest.raises(ApiException):
+        await k8s.call(read_namespaced_secret)
+
+    assert call_count("read_namespaced_secret", "404") == not_found + 1
+    assert call_count("list_namespaced_secret", "success") == success + 1
+
+
+@pytest.mark.asyncio
+async def test_raw_call_returns_body_and_releases_connection():
+    response = mock.Mock(data=b'{"items": []}')
+    list_namespaced_secret = mock.Mock(return_value=response)
+    list_namespaced_secret.__name__ = "list_namespaced_secret"
+    success = call_count("list_namespaced_secret", "success")
+
+    body = await k8s.call_raw(list_namespaced_secret, namespace="foo")
+
+    assert body == b'{"items": []}'
+    list_namespaced_secret.assert_called_once_with(
+        namespace="foo", _preload_content=False
+    )
+    response.release_conn.assert_called_once()
+    assert call_count("list_namespaced_secret", "success") == success + 1
+
+
+def coalesced_count(operation: str) -> float:
+    return REGISTRY.get_sample_value(
+        "credential_manager_k8s_coalesced_calls_total", {"operation": operation}
+    ) or 0
+
+
+@pytest.mark.asyncio
+async def test_concurrent_reads_share_one_call():
+    release = asyncio.Event()
+    calls = 0
+
+    async def read():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return {"name": "a"}
+
+    key = ("read_namespaced_secret", "namespace", "a")
+    coalesced = coalesced_count("read_namespaced_secret")
+
+    readers = [asyncio.ensure_future(k8s.coalesced(key, read)) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(*readers) == [{"name": "a"}] * 3
+    assert calls == 1
+    assert coalesced_count("read_namespaced_secret") == coalesced + 2
+    # the next read isn't shared anymore
+    await k8s.coalesced(key, read)
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_shared_read_survives_cancelled_caller():
+    release = asyncio.Event()
+
+    async def read():
+        await release.wait()
+        raise ApiException(status=404)
+
+    key = ("read_namespaced_secret", "namespace", "missing")
+    first = asyncio.ensure_future(k8s.coalesced(key, read))
+    second = asyncio.ensure_future(k8s.coalesced(key, read))
+    await asyncio.sleep(0)
+    first.cancel()
+    release.set()
+
+    with pytest.raises(ApiException):
+        await second
+    assert first.cancelled()
@@ -0,0 +1,47 @@
+from my_credentials.records import CredentialRecord, parse_secret_list
+from my_credentials.views import serialize_secret
+
+
+def test_secret_list_is_parsed_into_records():
+    page = parse_secret_list(
+        b"""{
+            "kind": "SecretList",
+            "metadata": {"resourceVersion": "10", "continue": "next-token"},
+            "items": [{
+                "metadata": {
+                    "name": "credentials-a",
+                    "resourceVersion": "7",
+                    "labels": {"owner": "me"},
+                    "annotations": {"eoxhub-env-jupyterlab": "true"},
+                    "managedFields": [{"manager": "kubectl"}]
+                },
+                "type": "Opaque",
+                "data": {"user": "Zm9v"}
+            }]
+        }"""
+    )
+
+    assert page.continue_token == "next-token"
+    [record] = page.items
+    assert record.metadata.name == "credentials-a"
+    assert record.metadata.resource_version == "7"
+    assert record.metadata.labels == {"owner": "me"}
+    assert not hasattr(record, "__dict__")
+    assert serialize_secret(record) == {
+        "name": "credentials-a",
+        "annotations": {"eoxhub-env-jupyterlab": "true"},
+        "type": "key-value (Opaque)",
+        "data": {"user": "foo"},
+    }
+
+
+def test_empty_list_has_no_continue_token():
+    page = parse_secret_list(b'{"metadata": {"continue": ""}, "items": null}')
+
+    assert page == ([], None)
+
+
+def test_record_without_data_serializes_like_model():
+    record = CredentialRecord(name="empty", type="Opaque")
+
+    assert serialize_secret(record, fields="keys")["keys"] == []
@@ -0,0 +1,198 @@
+import errno
+import os
+import stat
+import time
+
+from kubernetes import client as k8s_client
+import pytest
+
+from my_credentials import config, snapshot_publisher
+from my_credentials.informer import SecretInformer
+from my_credentials.records import CredentialRecord
+from my_credentials.shared_cache import SharedSecretCache
+from my_credentials.snapshot_publisher import SnapshotPublisher
+
+
+def make_secret(name: str, resource_version: str) -> k8s_client.V1Secret:
+    return k8s_client.V1Secret(
+        metadata=k8s_client.V1ObjectMeta(
+            name=name,
+            resource_version=resource_version,
+            annotations={"eoxhub-env-jupyterlab": "True"},
+        ),
+        data={"key": "dmFsdWU="},
+        type="Opaque",
+    )
+
+
+@pytest.fixture(autouse=True)
+def shared_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "SHARED_SECRET_CACHE_DIR", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture()
+def informer():
+    informer = SecretInformer(namespace="foo", label_selector="owner=me")
+    informer.apply("ADDED", make_secret("a", "1"))
+    informer.resource_version = "1"
+    return informer
+
+
+@pytest.fixture()
+def publisher(informer):
+    return SnapshotPublisher(informer)
+
+
+def test_workers_read_published_snapshot(publisher, informer):
+    cache = SharedSecretCache(namespace="foo", label_selector="owner=me")
+    cache._reload()
+    assert not cache.synced
+
+    publisher.publish()
+    cache._reload()
+    assert cache.synced
+    assert isinstance(cache.get("a"), CredentialRecord)
+    assert cache.get("a").data == {"key": "dmFsdWU="}
+    assert [s.metadata.name for s in cache.list_for_app("jupyterlab")] == ["a"]
+
+    informer.apply("ADDED", make_secret("b", "2"))
+    informer.resource_version = "2"
+    publisher.publish()
+    cache._reload()
+    assert [s.metadata.name for s in cache.list_all()] == ["a", "b"]
+    assert cache.get("b").metadata.resource_version == "2"
+
+
+def test_own_writes_are_shown_until_published(publisher, informer):
+    cache = SharedSecretCache(namespace="foo", label_selector="owner=me")
+    publisher.publish()
+    cache._reload()
+
+    cache.apply_own_write("MODIFIED", make_secret("a", "5"))
+    cache.apply_own_write("DELETED", make_secret("gone", "6"))
+    # another worker's write is published first
+    informer.apply("ADDED", make_secret("c", "3"))
+    informer.resource_version = "3"
+    publisher.publish()
+    cache._reload()
+
+    assert cache.get("a").metadata.resource_version == "5"
+    assert [s.metadata.name for s in cache.list_all()] == ["a", "c"]
+
+    informer.apply("MODIFIED", make_secret("a", "5"))
+    informer.resource_version = "5"
+    publisher.publish()
+    cache._reload()
+    assert not cache._pending
+
+
+def test_changes_between_snapshots_are_recorded_once(publisher, informer):
+    cache = SharedSecretCache(namespace="foo", label_selector="owner=me")
+    publisher.publish()
+    cache._reload()
+    assert cache.synced
+
+    cache.apply_own_write("MODIFIED", make_secret("a", "5"))
+    informer.apply("ADDED", make_secret("c", "3"))
+    informer.resource_version = "3"
+    publisher.publish()
+    cache._reload()
+    informer.apply("MODIFIED", make_secret("a", "5"))
+    informer.resource_version = "5"
+    publisher.publish()
+    cache._reload()
+
+    # the own write isn't recorded again with every snapshot
+    assert [(e.type, e.name) for e in cache.events] == [
+        ("MODIFIED", "a"),
+        ("ADDED", "c"),
+    ]
+
+
+def test_forbidden_publisher_is_not_used(publisher, informer):
+    cache = SharedSecretCache(namespace="foo", label_selector="owner=me")
+    publisher.publish()
+    cache._reload()
+    assert cache.synced
+
+    informer._forbid()
+    publisher.publish()
+    cache._reload()
+
+    assert cache.forbidden
+    assert not cache.synced
+
+
+def test_stale_snapshot_is_not_used(publisher, monkeypatch):
+    cache = SharedSecretCache(namespace="foo", label_selector="owner=me")
+    publisher.publish()
+    cache._reload()
+    assert cache.synced
+
+    too_old = time.time() - config.SHARED_SECRET_CACHE_MAX_AGE - 1
+    os.utime(publisher.path, (too_old, too_old))
+    cache._reload()
+
+    assert not cache.synced
+
+
+def test_touched_snapshot_is_not_parsed_again(publisher):
+    cache = SharedSecretCache(namespace="foo", label_selector="owner=me")
+    publisher.publish()
+    cache._reload()
+    loaded = cache.get("a")
+
+    # the publisher shows that the snapshot is still up to date
+    os.utime(publisher.path, ns=(time.time_ns() + 10**9,) * 2)
+    cache._reload()
+
+    assert cache.synced
+    assert cache.get("a") is loaded
+
+
+def test_snapshot_is_reloaded_in_the_background(publisher, informer, monkeypatch):
+    monkeypatch.setattr(config, "SHARED_SECRET_CACHE_POLL_INTERVAL", 0.01)
+    cache = SharedSecretCache(namespace="foo", label_selector="owner=me")
+    publisher.publish()
+    cache.start()
+    try:
+        assert cache.wait_until_synced(timeout=5)
+        informer.apply("ADDED", make_secret("b", "2"))
+        informer.resource_version = "2"
+        publisher.publish()
+        deadline = time.monotonic() + 5
+        while cache.get("b") is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert cache.get("b") is not None
+    finally:
+        cache.stop()
+
+
+def test_snapshot_is_only_readable_by_its_owner(publisher, shared_dir):
+    publisher.publish()
+
+    assert stat.S_IMODE(os.stat(publisher.path).st_mode) == 0o600
+    assert os.listdir(shared_dir) == ["foo.json"]
+
+
+def test_publisher_retries_failed_publishes(publisher, informer, monkeypatch):
+    monkeypatch.setattr(snapshot_publisher, "ERROR_BACKOFF_SECONDS", 0)
+    monkeypatch.setattr(informer, "start", lambda: None)
+    monkeypatch.setattr(informer, "stop", lambda: None)
+    attempts = []
+    publish = publisher.publish
+
+    def flaky_publish():
+        attempts.append(publisher.path)
+        if len(attempts) == 1:
+            raise OSError(errno.ENOSPC, "No space left on device")
+        publish()
+        publisher.stop()
+
+    monkeypatch.setattr(publisher, "publish", flaky_publish)
+    publisher._changed.set()
+    publisher.run()
+
+    assert len(attempts) == 2
+    assert os.path.exists(publisher.path)
@@ -0,0 +1,104 @@
+import json
+from unittest import mock
+
+import pytest
+
+from my_credentials import tracing
+from my_credentials.tests.conftest import raw_secret_list
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_SPAN_ID = "00f067aa0ba902b7"
+
+
+@pytest.fixture()
+def exporter(monkeypatch):
+    exporter = tracing.InMemoryExporter()
+    monkeypatch.setattr(tracing, "exporter", exporter)
+    return exporter
+
+
+@pytest.fixture()
+def mock_list(secret):
+    with mock.patch(
+        "my_credentials.views.k8s_client.CoreV1Api.list_namespaced_secret",
+        return_value=raw_secret_list([secret]),
+    ) as mocker, mock.patch("my_credentials.views.check_token", return_value=True):
+        mocker.__name__ = "list_namespaced_secret"
+        yield
+
+
+@pytest.mark.asyncio
+async def test_request_continues_incoming_trace(client, exporter, mock_list):
+    response = await client.get(
+        "/", headers={"traceparent": f"00-{TRACE_ID}-{PARENT_SPAN_ID}-01"}
+    )
+
+    spans = {span.name: span for span in exporter.spans}
+    assert set(spans) == {"GET /", "k8s list_namespaced_secret", "render"}
+    root = spans["GET /"]
+    assert root.trace_id == TRACE_ID
+    assert root.parent_span_id == PARENT_SPAN_ID
+    assert root.attributes["http.status_code"] == 200
+    assert spans["render"].parent_span_id == root.span_id
+    assert spans["k8s list_namespaced_secret"].parent_span_id == root.span_id
+    assert response.headers["traceparent"] == root.traceparent
+
+
+@pytest.mark.asyncio
+async def test_unsampled_trace_is_not_exported(client, exporter, mock_list):
+    await client.get("/", headers={"traceparent": f"00-{TRACE_ID}-{PARENT_SPAN_ID}-00"})
+
+    assert not exporter.spans
+
+
+@pytest.mark.asyncio
+async def test_tracing_is_off_without_exporter(client, mock_list):
+    response = await client.get("/")
+
+    assert "traceparent" not in response.headers
+
+
+def test_file_exporter_writes_otlp_json_lines(tmp_path, monkeypatch):
+    path = tmp_path / "traces.jsonl"
+    exporter = tracing.FileExporter(str(path))
+    monkeypatch.setattr(tracing, "exporter", exporter)
+
+    with tracing.request_span("GET /"):
+        with pytest.raises(ValueError), tracing.span("child", key="value"):
+            raise ValueError
+    exporter.close()
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    child, root = [
+        line["resourceSpans"][0]["scopeSpans"][0]["spans"][0] for line in lines
+    ]
+    assert child["name"] == "child"
+    assert child["parentSpanId"] == root["spanId"]
+    assert child["status"] == {"code": tracing.STATUS_ERROR}
+    assert {"key": "key", "value": {"stringValue": "value"}} in child["attributes"]
+    assert root["status"] == {"code": tracing.STATUS_OK}
+
+
+def test_file_exporter_writes_in_the_background(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    exporter = tracing.FileExporter(str(path))
+
+    with mock.patch("builtins.open", wraps=open) as opened:
+        for i in range(3):
+            exporter.export(tracing.Span(name=f"span-{i}", trace_id="t", span_id="s"))
+            exporter.flush()
+        exporter.close()
+
+    # the file is kept open in between
+    opened.assert_called_once()
+    assert len(path.read_text().splitlines()) == 3
+
+
+def test_file_exporter_drops_spans_if_the_file_cannot_be_opened(tmp_path):
+    exporter = tracing.FileExporter(str(tmp_path / "missing" / "traces.jsonl"))
+
+    exporter.export(tracing.Span(name="span", trace_id="t", span_id="s"))
+    exporter.flush()
+    exporter.close()
+
+    assert not (tmp_path / "missing").exists()
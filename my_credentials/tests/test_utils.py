@@ -1,4 +1,4 @@
-from my_credentials.utils import mask_private_key
+from my_credentials.utils import etag_matches, make_etag, mask_private_key
 
 
 beginning = "QyNTUxOQAAACA90hws0gjiiAQiSIot"
@@ -34,3 +34,18 @@ def test_mask_key_multi_line():
         content=f"{beginning}\n{middle}\n{end}",
         masked=f"{m_beginning}\n{m_middle}\n{m_end}",
     )
+
+
+def test_etag_changes_with_parts():
+    assert make_etag("a@1") == make_etag("a@1")
+    assert make_etag("a@1") != make_etag("a@2")
+    assert make_etag("a", "b") != make_etag("ab")
+
+
+def test_etag_matches():
+    etag = make_etag("a@1")
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches(make_etag("a@2"), etag)
@@ -1,19 +1,39 @@
+import asyncio
 import base64
 from contextlib import contextmanager
+import copy
 import http
+import json
+import time
 from unittest import mock
 
 from kubernetes import client as k8s_client
+from kubernetes.client.exceptions import ApiException
 import pytest
 
-from my_credentials.views import B64DecodedAccessDict, MY_SECRETS_LABEL_KEY
+from my_credentials import config, metrics, views
+from my_credentials.informer import SecretInformer
+from my_credentials.tests.conftest import (
+    BOUNDARY,
+    KEY,
+    USER,
+    multipart_body,
+    multipart_part,
+    raw_secret_list,
+)
+from my_credentials.views import (
+    B64DecodedAccessDict,
+    MY_SECRETS_LABEL_KEY,
+    MY_SECRETS_LABEL_VALUE,
+    current_namespace,
+)
 
 
 @contextmanager
 def do_mock_secret_list(secrets: list[k8s_client.V1Secret]):
     with mock.patch(
         "my_credentials.views.k8s_client.CoreV1Api.list_namespaced_secret",
-        return_value=k8s_client.V1SecretList(items=secrets),
+        return_value=raw_secret_list(secrets),
     ) as mocker:
         yield mocker
 
@@ -124,9 +144,26 @@ def create_form_data(is_update: bool, with_spaces: bool = False):
     )
 
 
+def synced_informer(*secrets: k8s_client.V1Secret) -> SecretInformer:
+    informer = SecretInformer(namespace=USER, label_selector="")
+    informer._replace_all(list(secrets))
+    informer._synced.set()
+    return informer
+
+
+def b64(value: str) -> str:
+    return base64.b64encode(value.encode()).decode()
+
+
 @pytest.mark.asyncio
 async def test_edit_credentials_updates_secrets(client, mock_secret_patch, secret):
-    with do_mock_secret_read(secret):
+    secret.metadata.name = "existing-secret"
+    secret.metadata.resource_version = "1"
+    secret.data = {"user": b64("testington"), "pw": b64("old"), "existing-key": "foo"}
+
+    with mock.patch(
+        "my_credentials.views.get_informer", return_value=synced_informer(secret)
+    ), do_mock_secret_read(secret) as mock_read:
         response = await client.post(
             "/credentials-detail/existing-secret",
             # NOTE: can't just pass form because async_asgi_testclient doesn't support
@@ -136,14 +173,129 @@ async def test_edit_credentials_updates_secrets(client, mock_secret_patch, secre
             allow_redirects=False,
         )
 
-    body = mock_secret_patch.mock_calls[0].kwargs["body"]
-    # update
-    assert body.data["user"] == base64.b64encode("testington".encode()).decode()
-    # delete old keys
-    assert body.data["existing-key"] is None
-    assert body.metadata.name == "existing-secret"
+    # single round trip, the ownership is checked by the patch itself
+    mock_read.assert_not_called()
+    kwargs = mock_secret_patch.mock_calls[0].kwargs
+    assert kwargs["name"] == "existing-secret"
+    assert kwargs["body"] == [
+        {
+            "op": "test",
+            "path": f"/metadata/labels/{MY_SECRETS_LABEL_KEY}",
+            "value": MY_SECRETS_LABEL_VALUE,
+        },
+        {"op": "replace", "path": "/metadata/resourceVersion", "value": "1"},
+        # only the changed and removed keys
+        {"op": "add", "path": "/data/pw", "value": b64("supersecret")},
+        {"op": "remove", "path": "/data/existing-key"},
+    ]
+
+    assert response.headers["location"] == ".."
+
+
+@pytest.mark.asyncio
+async def test_unchanged_credentials_are_not_written(client, mock_secret_patch, secret):
+    secret.data = {"user": b64("testington"), "pw": b64("supersecret")}
+    suppressed = metrics.SUPPRESSED_WRITES.labels(operation="update")._value.get()
+
+    with do_mock_secret_read(secret):
+        response = await client.post(
+            "/credentials-detail/existing-secret",
+            data=create_form_data(is_update=True),
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            allow_redirects=False,
+        )
 
     assert response.headers["location"] == ".."
+    mock_secret_patch.assert_not_called()
+    assert metrics.SUPPRESSED_WRITES.labels(operation="update")._value.get() == (
+        suppressed + 1
+    )
+
+
+@pytest.mark.asyncio
+async def test_unchanged_save_is_confirmed_if_cache_is_behind(
+    client, mock_secret_patch, secret
+):
+    # the cache still has the values of the form, which were changed elsewhere
+    secret.metadata.name = "existing-secret"
+    cached = copy.deepcopy(secret)
+    cached.metadata.resource_version = "1"
+    cached.data = {"user": b64("testington"), "pw": b64("supersecret")}
+    secret.metadata.resource_version = "2"
+    secret.data = {"user": b64("testington"), "pw": b64("changed")}
+
+    with mock.patch(
+        "my_credentials.views.get_informer", return_value=synced_informer(cached)
+    ), do_mock_secret_read(secret) as mock_read:
+        response = await client.post(
+            "/credentials-detail/existing-secret",
+            data=create_form_data(is_update=True),
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            allow_redirects=False,
+        )
+
+    assert response.headers["location"] == ".."
+    mock_read.assert_called_once()
+    _, kwargs = mock_secret_patch.call_args
+    assert kwargs["body"][1:] == [
+        {"op": "replace", "path": "/metadata/resourceVersion", "value": "2"},
+        {"op": "add", "path": "/data/pw", "value": b64("supersecret")},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_edit_credentials_not_allowed_for_other_secrets(
+    client, mock_secret_patch, secret
+):
+    del secret.metadata.labels[MY_SECRETS_LABEL_KEY]
+    mock_secret_patch.side_effect = ApiException(status=422, reason="Invalid")
+
+    with do_mock_secret_read(secret):
+        response = await client.post(
+            "/credentials-detail/existing-secret",
+            data=create_form_data(is_update=True),
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            allow_redirects=False,
+        )
+
+    assert response.status_code == http.HTTPStatus.FORBIDDEN
+
+
+def make_conflict():
+    return ApiException(status=409, reason="Conflict")
+
+
+@pytest.mark.asyncio
+async def test_toggle_app_env_retries_on_conflict(client, mock_secret_patch, secret):
+    secret.metadata.resource_version = "1"
+    changed_secret = copy.deepcopy(secret)
+    changed_secret.metadata.resource_version = "2"
+    changed_secret.metadata.annotations = {"eoxhub-env-jupyterlab": "True"}
+    mock_secret_patch.side_effect = [make_conflict(), changed_secret]
+
+    with mock.patch(
+        "my_credentials.views.k8s_client.CoreV1Api.read_namespaced_secret",
+        side_effect=[secret, changed_secret],
+    ):
+        response = await client.post(
+            "/credentials-detail/credentials-a/jupyterlab",
+        )
+
+    assert response.status_code == http.HTTPStatus.NO_CONTENT
+    first, second = [call.kwargs["body"] for call in mock_secret_patch.mock_calls]
+    assert first[1:] == [
+        {"op": "replace", "path": "/metadata/resourceVersion", "value": "1"},
+        {
+            "op": "add",
+            "path": "/metadata/annotations",
+            "value": {"eoxhub-env-jupyterlab": "True"},
+        },
+    ]
+    # the concurrent toggle already enabled it, so this one disables it again
+    assert second[1:] == [
+        {"op": "replace", "path": "/metadata/resourceVersion", "value": "2"},
+        {"op": "remove", "path": "/metadata/annotations/eoxhub-env-jupyterlab"},
+    ]
 
 
 @pytest.mark.asyncio
@@ -167,6 +319,63 @@ async def test_create_credentials_creates_secrets(client, mock_secret_create, se
     assert response.headers["location"] == ".."
 
 
+@pytest.mark.asyncio
+async def test_create_ssh_credentials_from_uploaded_key(client, mock_secret_create):
+    body = multipart_body(
+        multipart_part("credentials_name", b"my-key"),
+        multipart_part("type", b"kubernetes.io/ssh-auth"),
+        multipart_part("create", b"yes"),
+        multipart_part("ssh_file", KEY.encode(), filename="id_ed25519"),
+        multipart_part("privatekey", b""),
+    )
+    with do_mock_secret_list(secrets=[]):
+        response = await client.post(
+            "/create/",
+            data=body,
+            headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"},
+            allow_redirects=False,
+        )
+
+    assert response.status_code == http.HTTPStatus.FOUND
+    kwargs = mock_secret_create.mock_calls[0].kwargs
+    assert kwargs["body"].metadata.name == "my-key"
+    assert kwargs["body"].data == {"ssh-privatekey": b64(KEY)}
+
+
+@pytest.mark.asyncio
+async def test_create_ssh_credentials_rejects_oversized_key(client, mock_secret_create):
+    body = multipart_body(
+        multipart_part("credentials_name", b"my-key"),
+        multipart_part("type", b"kubernetes.io/ssh-auth"),
+        multipart_part("create", b"yes"),
+        multipart_part("privatekey", b"a" * 20 * 1024),
+    )
+    with do_mock_secret_list(secrets=[]):
+        response = await client.post(
+            "/create/",
+            data=body,
+            headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"},
+        )
+
+    assert response.status_code == http.HTTPStatus.OK
+    assert "Content exceeds the 10KB size limit." in response.text
+    mock_secret_create.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_create_rejects_oversized_body(client, mock_secret_create, monkeypatch):
+    monkeypatch.setattr(config, "FORM_MAX_BODY_SIZE", 1024)
+
+    response = await client.post(
+        "/create/",
+        data="secret_value=" + "a" * 2048,
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+
+    assert response.status_code == http.HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+    mock_secret_create.assert_not_called()
+
+
 @pytest.mark.asyncio
 async def test_delete_credentials_deletes_secrets(client, mock_secret_delete, secret):
     with do_mock_secret_read(secret):
@@ -175,7 +384,21 @@ async def test_delete_credentials_deletes_secrets(client, mock_secret_delete, se
         )
     assert response.status_code == http.HTTPStatus.NO_CONTENT
 
-    assert mock_secret_delete.mock_calls[0].kwargs["name"] == "foo"
+    kwargs = mock_secret_delete.mock_calls[0].kwargs
+    assert kwargs["name"] == "foo"
+    assert kwargs["body"].preconditions.resource_version == (
+        secret.metadata.resource_version
+    )
+
+
+@pytest.mark.asyncio
+async def test_secrets_of_others_are_not_shown(client, secret, mock_token_check):
+    del secret.metadata.labels[MY_SECRETS_LABEL_KEY]
+
+    with do_mock_secret_read(secret):
+        response = await client.get("/credentials-detail/foo")
+
+    assert response.status_code == http.HTTPStatus.FORBIDDEN
 
 
 @pytest.mark.asyncio
@@ -207,3 +430,577 @@ async def test_create_credentials_trims_spaces(client, mock_secret_create):
     kwargs = mock_secret_create.mock_calls[0].kwargs
     assert kwargs["body"].metadata.name == "new-secret"
     assert "user" in kwargs["body"].data
+
+
+@pytest.mark.asyncio
+async def test_credentials_are_listed_from_synced_cache(client, secret, mock_token_check):
+    informer = SecretInformer(namespace=USER, label_selector="")
+    informer.apply("ADDED", secret)
+    informer._synced.set()
+
+    with mock.patch(
+        "my_credentials.views.get_informer", return_value=informer
+    ), do_mock_secret_list(secrets=[]) as mocker:
+        response = await client.get("/")
+
+    mocker.assert_not_called()
+    assert secret.metadata.name in response.text
+
+
+@pytest.mark.asyncio
+async def test_credentials_are_listed_directly_while_cache_warms_up(
+    client, secret, mock_token_check
+):
+    informer = SecretInformer(namespace=USER, label_selector="")
+
+    with mock.patch(
+        "my_credentials.views.get_informer", return_value=informer
+    ), do_mock_secret_list(secrets=[secret]) as mocker:
+        response = await client.get("/")
+
+    mocker.assert_called_once()
+    assert secret.metadata.name in response.text
+
+
+@pytest.mark.asyncio
+async def test_not_ready_while_cache_warms_up(client, monkeypatch):
+    monkeypatch.setattr(views.jwks_client, "_keys", {"kid": "key"})
+    monkeypatch.setattr(views.k8s, "_connected", True)
+    informer = SecretInformer(namespace=USER, label_selector="")
+
+    with mock.patch("my_credentials.views.get_informer", return_value=informer):
+        response = await client.get("/ready")
+
+    assert response.status_code == http.HTTPStatus.SERVICE_UNAVAILABLE
+    assert response.json()["checks"] == {
+        "jwks": True,
+        "k8s": True,
+        "secret_cache": False,
+    }
+
+
+@pytest.mark.asyncio
+async def test_ready_once_caches_are_warm(client, secret, monkeypatch):
+    monkeypatch.setattr(views.jwks_client, "_keys", {"kid": "key"})
+    monkeypatch.setattr(views.k8s, "_connected", True)
+
+    with mock.patch(
+        "my_credentials.views.get_informer", return_value=synced_informer(secret)
+    ):
+        response = await client.get("/ready")
+
+    assert response.status_code == http.HTTPStatus.OK
+    assert response.json()["ready"]
+
+
+@pytest.mark.asyncio
+async def test_ready_if_watching_secrets_is_forbidden(
+    client, secret, mock_token_check, monkeypatch
+):
+    monkeypatch.setattr(views.jwks_client, "_keys", {"kid": "key"})
+    monkeypatch.setattr(views.k8s, "_connected", True)
+    monkeypatch.setattr(config, "SECRET_CACHE_FALLBACK_TO_LIST", False)
+    informer = SecretInformer(namespace=USER, label_selector="")
+    informer._forbid()
+
+    with mock.patch("my_credentials.views.get_informer", return_value=informer):
+        response = await client.get("/ready")
+        with do_mock_secret_list(secrets=[secret]) as mocker:
+            listed = await client.get("/")
+
+    assert response.status_code == http.HTTPStatus.OK
+    assert response.json()["secret_cache_forbidden"]
+    # read from the API server instead of waiting for the cache
+    mocker.assert_called_once()
+    assert secret.metadata.name in listed.text
+
+
+@pytest.mark.asyncio
+async def test_app_env_contains_injected_secrets_only(client, secret, mock_token_check):
+    secret.type = "Opaque"
+    secret.metadata.annotations = {"eoxhub-env-jupyterlab": "True"}
+    other_secret = k8s_client.V1Secret(
+        metadata=k8s_client.V1ObjectMeta(name="other"),
+        data={"foo": base64.b64encode(b"bar").decode()},
+        type="Opaque",
+    )
+
+    with do_mock_secret_list(secrets=[secret, other_secret]):
+        response = await client.get("/get-credentials/env?app=jupyterlab")
+
+    assert response.json() == {
+        "credentials-a_username": "testington",
+        "credentials-a_password": "123",
+        "credentials-a_existing-key": "foo",
+    }
+
+
+@pytest.mark.asyncio
+async def test_unchanged_credentials_are_not_modified(client, secret, mock_token_check):
+    secret.metadata.resource_version = "1"
+    informer = SecretInformer(namespace=USER, label_selector="")
+    informer.apply("ADDED", secret)
+    informer._synced.set()
+
+    with mock.patch("my_credentials.views.get_informer", return_value=informer):
+        response = await client.get("/")
+        etag = response.headers["etag"]
+
+        with do_mock_secret_read(secret) as mocker:
+            detail_response = await client.get(
+                f"/credentials-detail/{secret.metadata.name}"
+            )
+            not_modified_response = await client.get(
+                f"/credentials-detail/{secret.metadata.name}",
+                headers={"If-None-Match": detail_response.headers["etag"]},
+            )
+        mocker.assert_not_called()
+        assert not_modified_response.status_code == http.HTTPStatus.NOT_MODIFIED
+
+        response = await client.get("/", headers={"If-None-Match": etag})
+        assert response.status_code == http.HTTPStatus.NOT_MODIFIED
+
+        secret.metadata.resource_version = "2"
+        informer.apply("MODIFIED", secret)
+        response = await client.get("/", headers={"If-None-Match": etag})
+        assert response.status_code == http.HTTPStatus.OK
+
+
+@pytest.mark.asyncio
+async def test_get_credentials_has_etag(client, secret, mock_token_check):
+    secret.type = "Opaque"
+    with do_mock_secret_list(secrets=[secret]):
+        response = await client.get("/get-credentials")
+        not_modified_response = await client.get(
+            "/get-credentials", headers={"If-None-Match": response.headers["etag"]}
+        )
+
+    assert response.json()[0]["name"] == secret.metadata.name
+    assert not_modified_response.status_code == http.HTTPStatus.NOT_MODIFIED
+
+
+@pytest.mark.asyncio
+async def test_keys_projection_does_not_decode_values(client, secret, mock_token_check):
+    secret.type = "Opaque"
+    secret.data["empty"] = ""
+
+    with do_mock_secret_list(secrets=[secret]), mock.patch(
+        "my_credentials.views.base64.b64decode"
+    ) as b64decode:
+        response = await client.get("/get-credentials?fields=keys")
+        await client.get("/")
+
+    b64decode.assert_not_called()
+    assert response.json()[0]["keys"] == ["username", "password", "existing-key"]
+    assert "data" not in response.json()[0]
+
+
+def test_decoded_values_are_memoized(secret):
+    data = B64DecodedAccessDict(secret.data)
+
+    with mock.patch(
+        "my_credentials.views.base64.b64decode", wraps=base64.b64decode
+    ) as b64decode:
+        assert data["username"] == "testington"
+        assert data["username"] == "testington"
+        data["username"] = base64.b64encode(b"other")
+
+        assert data["username"] == "other"
+
+    assert b64decode.call_count == 2
+
+
+def make_secret_page(names: list[str], continue_token: str | None):
+    return raw_secret_list(
+        [
+            k8s_client.V1Secret(
+                metadata=k8s_client.V1ObjectMeta(name=name),
+                data={"key": base64.b64encode(name.encode()).decode()},
+                type="Opaque",
+            )
+            for name in names
+        ],
+        continue_token,
+    )
+
+
+@pytest.mark.asyncio
+async def test_get_credentials_paginated(client, mock_token_check):
+    with mock.patch(
+        "my_credentials.views.k8s_client.CoreV1Api.list_namespaced_secret",
+        return_value=make_secret_page(["a", "b"], "next-token"),
+    ) as mocker:
+        response = await client.get("/get-credentials?limit=2&continue=token")
+
+    assert [s["name"] for s in response.json()] == ["a", "b"]
+    assert response.headers["x-continue"] == "next-token"
+    kwargs = mocker.mock_calls[0].kwargs
+    assert kwargs["limit"] == 2
+    assert kwargs["_continue"] == "token"
+    assert kwargs["field_selector"] == "type=Opaque"
+
+
+@pytest.mark.asyncio
+async def test_get_credentials_streamed_as_ndjson(client, mock_token_check):
+    with mock.patch(
+        "my_credentials.views.k8s_client.CoreV1Api.list_namespaced_secret",
+        side_effect=[
+            make_secret_page(["a", "b"], "next-token"),
+            make_secret_page(["c"], None),
+        ],
+    ) as mocker:
+        response = await client.get("/get-credentials?format=ndjson")
+
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["name"] for line in lines] == ["a", "b", "c"]
+    assert lines[2]["data"] == {"key": "c"}
+    assert mocker.call_count == 2
+    assert mocker.mock_calls[1].kwargs["_continue"] == "next-token"
+
+
+@pytest.mark.asyncio
+async def test_bulk_runs_all_operations(
+    client, secret, mock_token_check, mock_secret_create, mock_secret_patch,
+    mock_secret_delete,
+):
+    not_my_secret = k8s_client.V1Secret(
+        metadata=k8s_client.V1ObjectMeta(name="not-mine", labels={}),
+    )
+
+    def read(name, namespace, **kwargs):
+        return not_my_secret if name == "not-mine" else secret
+
+    with mock.patch(
+        "my_credentials.views.k8s_client.CoreV1Api.read_namespaced_secret",
+        side_effect=read,
+    ):
+        response = await client.post(
+            "/bulk",
+            json={
+                "operations": [
+                    {"op": "create", "name": "new", "data": {"user": "foo"}},
+                    {"op": "update", "name": "credentials-a", "data": {"pw": "x"}},
+                    {"op": "annotate", "name": "credentials-a", "app": "jupyterlab"},
+                    {"op": "delete", "name": "other"},
+                    {"op": "delete", "name": "not-mine"},
+                    {
+                        "op": "create",
+                        "name": "key",
+                        "type": "kubernetes.io/ssh-auth",
+                        "data": {"ssh-privatekey": "invalid"},
+                    },
+                ]
+            },
+        )
+
+    statuses = [(r["op"], r["name"], r["status"]) for r in response.json()["results"]]
+    assert statuses == [
+        ("create", "new", http.HTTPStatus.OK),
+        ("update", "credentials-a", http.HTTPStatus.OK),
+        ("annotate", "credentials-a", http.HTTPStatus.OK),
+        ("delete", "other", http.HTTPStatus.OK),
+        ("delete", "not-mine", http.HTTPStatus.FORBIDDEN),
+        ("create", "key", http.HTTPStatus.UNPROCESSABLE_ENTITY),
+    ]
+    created = mock_secret_create.mock_calls[0].kwargs["body"]
+    assert created.data == {"user": base64.b64encode(b"foo").decode()}
+    assert mock_secret_patch.call_count == 2
+    assert mock_secret_delete.mock_calls[0].kwargs["name"] == "other"
+
+
+@pytest.mark.asyncio
+async def test_bulk_runs_operations_on_same_secret_in_order(
+    client, secret, mock_token_check, mock_secret_patch
+):
+    with do_mock_secret_read(secret):
+        await client.post(
+            "/bulk",
+            json={
+                "operations": [
+                    {"op": "update", "name": "credentials-a", "data": {"v": str(i)}}
+                    for i in range(5)
+                ]
+            },
+        )
+
+    values = [
+        call.kwargs["body"][2]["value"] for call in mock_secret_patch.mock_calls
+    ]
+    assert values == [b64(str(i)) for i in range(5)]
+
+
+@pytest.fixture()
+def multi_tenant(monkeypatch):
+    monkeypatch.setattr(config, "MULTI_TENANT", True)
+    monkeypatch.setattr(config, "TENANT_NAMESPACE_PREFIX", "ws-")
+    # conftest pins the namespace, resolve it from the request instead
+    monkeypatch.setattr(views, "current_namespace", current_namespace)
+    with mock.patch("my_credentials.views.start_informer", return_value=None) as mocker:
+        yield mocker
+
+
+@contextmanager
+def token_claims(**claims):
+    with mock.patch(
+        "my_credentials.views.check_token_content", return_value=claims
+    ) as mocker:
+        yield mocker
+
+
+@pytest.mark.asyncio
+async def test_multi_tenant_namespace_is_taken_from_token(
+    client, secret, mock_token_check, multi_tenant
+):
+    with token_claims(preferred_username="bar-456"), do_mock_secret_list(
+        secrets=[secret]
+    ) as mocker:
+        response = await client.get("/", headers={"X-Auth-Request-User": "bar-456"})
+
+    assert response.status_code == http.HTTPStatus.OK
+    assert mocker.mock_calls[0].kwargs["namespace"] == "ws-bar-456"
+    assert multi_tenant.mock_calls[0].args[0] == "ws-bar-456"
+
+
+@pytest.mark.asyncio
+async def test_multi_tenant_token_claim_is_configurable(
+    client, secret, mock_token_check, multi_tenant, monkeypatch
+):
+    monkeypatch.setattr(config, "TENANT_CLAIM", "workspace")
+    with token_claims(workspace="from-token"), do_mock_secret_list(
+        secrets=[secret]
+    ) as mocker:
+        await client.get("/", headers={"X-Auth-Request-User": ""})
+
+    assert mocker.mock_calls[0].kwargs["namespace"] == "ws-from-token"
+
+
+@pytest.mark.asyncio
+async def test_multi_tenant_rejects_header_not_matching_token(
+    client, mock_token_check, multi_tenant
+):
+    with token_claims(preferred_username=USER), do_mock_secret_list(
+        secrets=[]
+    ) as mocker:
+        response = await client.get(
+            "/credentials-detail/token", headers={"X-Auth-Request-User": "kube-system"}
+        )
+
+    assert response.status_code == http.HTTPStatus.FORBIDDEN
+    mocker.assert_not_called()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "identity, status",
+    [
+        ("", http.HTTPStatus.UNAUTHORIZED),
+        ("../kube-system", http.HTTPStatus.BAD_REQUEST),
+        ("a" * 64, http.HTTPStatus.BAD_REQUEST),
+    ],
+)
+async def test_multi_tenant_rejects_unknown_or_invalid_users(
+    client, mock_token_check, multi_tenant, identity, status
+):
+    with token_claims(preferred_username=identity), do_mock_secret_list(
+        secrets=[]
+    ) as mocker:
+        response = await client.get("/", headers={"X-Auth-Request-User": identity})
+
+    assert response.status_code == status
+    mocker.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_multi_tenant_only_serves_allowed_namespaces(
+    client, mock_token_check, multi_tenant, monkeypatch
+):
+    monkeypatch.setattr(config, "TENANT_NAMESPACE_PREFIX", "")
+    monkeypatch.setattr(config, "TENANT_NAMESPACES", ["ws-a"])
+    with token_claims(preferred_username="kube-system"), do_mock_secret_list(
+        secrets=[]
+    ) as mocker:
+        response = await client.get("/", headers={"X-Auth-Request-User": ""})
+
+    assert response.status_code == http.HTTPStatus.FORBIDDEN
+    mocker.assert_not_called()
+
+
+def test_multi_tenant_requires_prefix_or_allowed_namespaces(monkeypatch):
+    monkeypatch.setattr(config, "MULTI_TENANT", True)
+    monkeypatch.setattr(config, "TENANT_NAMESPACE_PREFIX", "")
+    with pytest.raises(RuntimeError):
+        views.check_tenant_config()
+
+    monkeypatch.setattr(config, "TENANT_NAMESPACES", ["ws-a"])
+    views.check_tenant_config()
+
+
+@pytest.mark.asyncio
+async def test_multi_tenant_writes_check_the_token(
+    client, mock_secret_delete, mock_token_check, multi_tenant, secret
+):
+    with token_claims(preferred_username=USER), do_mock_secret_read(secret):
+        response = await client.delete("/credentials-detail/foo")
+
+    assert response.status_code == http.HTTPStatus.NO_CONTENT
+    mock_token_check.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_server_timing_header_breaks_down_stages(
+    client, secret, mock_token_check, monkeypatch
+):
+    monkeypatch.setattr(config, "SERVER_TIMING_ENABLED", True)
+
+    with do_mock_secret_list(secrets=[secret]):
+        response = await client.get("/")
+
+    server_timing = response.headers["Server-Timing"]
+    stages = [stage.split(";")[0] for stage in server_timing.split(", ")]
+    assert stages == ["k8s", "render", "total"]
+
+
+@pytest.mark.asyncio
+async def test_server_timing_header_is_opt_in(client, secret, mock_token_check):
+    with do_mock_secret_list(secrets=[secret]):
+        response = await client.get("/")
+
+    assert "Server-Timing" not in response.headers
+
+
+def card_lookups(result: str, fragment: str = "card") -> float:
+    return metrics.FRAGMENT_CACHE_LOOKUPS.labels(
+        fragment=fragment, result=result
+    )._value.get()
+
+
+@pytest.mark.asyncio
+async def test_credential_cards_are_rendered_once_per_version(
+    client, secret, mock_token_check
+):
+    views.card_cache.clear()
+    secret.metadata.resource_version = "1"
+    hits, misses = card_lookups("hit"), card_lookups("miss")
+
+    with do_mock_secret_list(secrets=[secret]):
+        first = await client.get("/")
+        second = await client.get("/")
+    secret.metadata.resource_version = "2"
+    secret.data = {"other-key": b64("foo")}
+    with do_mock_secret_list(secrets=[secret]):
+        third = await client.get("/")
+
+    assert card_lookups("hit") == hits + 1
+    assert card_lookups("miss") == misses + 2
+    assert first.text == second.text
+    assert "existing-key" in second.text
+    assert "existing-key" not in third.text
+    assert "other-key" in third.text
+
+
+@pytest.mark.asyncio
+async def test_get_credentials_splices_cached_json_fragments(
+    client, secret, mock_token_check
+):
+    views.json_cache.clear()
+    secret.type = "Opaque"
+    secret.metadata.resource_version = "1"
+    other = copy.deepcopy(secret)
+    other.metadata.name = "credentials-b"
+    hits = card_lookups("hit", fragment="json")
+
+    with do_mock_secret_list(secrets=[secret, other]):
+        first = await client.get("/get-credentials")
+        second = await client.get("/get-credentials?fields=keys")
+        third = await client.get("/get-credentials")
+
+    assert first.headers["content-type"] == "application/json"
+    assert [s["name"] for s in first.json()] == ["credentials-a", "credentials-b"]
+    assert first.json()[0] == {
+        "name": "credentials-a",
+        "annotations": {},
+        "type": "key-value (Opaque)",
+        "data": {"username": "testington", "password": "123", "existing-key": "foo"},
+    }
+    assert "data" not in second.json()[0]
+    assert third.content == first.content
+    assert card_lookups("hit", fragment="json") == hits + 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_detail_reads_share_one_call(client, secret, mock_token_check):
+    def slow_read(name, namespace, **kwargs):
+        time.sleep(0.1)
+        return secret
+
+    with mock.patch(
+        "my_credentials.views.k8s_client.CoreV1Api.read_namespaced_secret",
+        side_effect=slow_read,
+    ) as mocker:
+        responses = await asyncio.gather(
+            *(client.get("/credentials-detail/credentials-a") for _ in range(5))
+        )
+
+    assert all(r.status_code == http.HTTPStatus.OK for r in responses)
+    mocker.assert_called_once()
+
+
+def parse_sse(text: str) -> list[dict]:
+    return [
+        dict(line.split(": ", 1) for line in message.splitlines())
+        for message in text.strip().split("\n\n")
+    ]
+
+
+@pytest.mark.asyncio
+async def test_events_are_resumed_after_last_event_id(
+    client, secret, mock_token_check, monkeypatch
+):
+    monkeypatch.setattr(config, "EVENTS_POLL_INTERVAL", 0)
+    secret.type = "Opaque"
+    secret.metadata.resource_version = "1"
+    informer = synced_informer(secret)
+    changed = copy.deepcopy(secret)
+    changed.metadata.resource_version = "2"
+    changed.metadata.annotations = {"eoxhub-env-jupyterlab": "true"}
+    informer.apply("MODIFIED", changed)
+    # the watch event of our own write
+    informer.apply("MODIFIED", changed)
+    resume_from = informer.last_event_id
+    informer.apply("DELETED", changed)
+    informer.apply(
+        "ADDED", k8s_client.V1Secret(metadata=k8s_client.V1ObjectMeta(name="new"))
+    )
+
+    # the stream ends once the informer isn't cached anymore
+    with mock.patch(
+        "my_credentials.views.get_informer", return_value=informer
+    ), mock.patch("my_credentials.views.is_cached", side_effect=[True, False]):
+        response = await client.get("/events", headers={"Last-Event-ID": resume_from})
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    retry, deleted, added = parse_sse(response.text)
+    assert retry == {"retry": "3000"}
+    assert deleted["event"] == "deleted"
+    assert json.loads(deleted["data"]) == {
+        "name": "credentials-a",
+        "type": "key-value (Opaque)",
+        "annotations": {"eoxhub-env-jupyterlab": "true"},
+        "keys": ["username", "password", "existing-key"],
+    }
+    assert added["event"] == "added"
+    assert added["id"] == informer.last_event_id
+
+
+@pytest.mark.asyncio
+async def test_events_reset_for_unknown_last_event_id(client, mock_token_check):
+    informer = synced_informer()
+
+    with mock.patch(
+        "my_credentials.views.get_informer", return_value=informer
+    ), mock.patch("my_credentials.views.is_cached", return_value=False):
+        response = await client.get("/events", headers={"Last-Event-ID": "other-3"})
+
+    retry, reset = parse_sse(response.text)
+    assert reset == {"event": "reset", "data": "{}", "id": informer.last_event_id}
@@ -0,0 +1,51 @@
+import asyncio
+import contextlib
+import contextvars
+import time
+from typing import Iterator
+
+from prometheus_client import Histogram
+
+# durations per stage of the current request, only set if Server-Timing is enabled
+_stages: contextvars.ContextVar[dict[str, float] | None] = contextvars.ContextVar(
+    "server_timing_stages", default=None
+)
+
+
+def outcome_of(e: BaseException) -> str:
+    if isinstance(e, asyncio.CancelledError):
+        return "cancelled"
+    # ApiException has a status, HTTPException a status_code
+    status = getattr(e, "status", None) or getattr(e, "status_code", None)
+    return str(status) if status else "error"
+
+
+@contextlib.contextmanager
+def timed(histogram: Histogram, stage: str, **labels: str) -> Iterator[None]:
+    """Observe the duration with the outcome as label, and add it to the stage of
+    the current request's Server-Timing header"""
+    outcome = "success"
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        outcome = outcome_of(e)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        histogram.labels(outcome=outcome, **labels).observe(duration)
+        if (stages := _stages.get()) is not None:
+            stages[stage] = stages.get(stage, 0.0) + duration
+
+
+def start_request() -> dict[str, float]:
+    stages: dict[str, float] = {}
+    _stages.set(stages)
+    return stages
+
+
+def server_timing_header(stages: dict[str, float], total: float) -> str:
+    return ", ".join(
+        f"{stage};dur={duration * 1000:.1f}"
+        for stage, duration in [*stages.items(), ("total", total)]
+    )
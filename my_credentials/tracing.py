@@ -0,0 +1,296 @@
+"""Lightweight request tracing, compatible with OpenTelemetry.
+
+Trace context is taken from incoming W3C `traceparent` headers, and finished
+spans are exported in the OTLP JSON format, either into memory or as one line
+per span into a file (readable e.g. by the collector's `otlpjsonfile` receiver).
+The file is written by a background thread, off the event loop.
+"""
+
+import collections
+import contextlib
+import contextvars
+import dataclasses
+import json
+import logging
+import queue
+import random
+import re
+import threading
+import time
+from typing import Iterator, Protocol
+
+from my_credentials import config
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "credential-manager"
+
+TRACEPARENT_PATTERN = re.compile(
+    r"00-(?P<trace_id>[0-9a-f]{32})-(?P<span_id>[0-9a-f]{16})-(?P<flags>[0-9a-f]{2})"
+)
+
+# spans waiting to be written to the file, further ones are dropped
+FILE_EXPORTER_QUEUE_SIZE = 10000
+# at most this many spans are written at once
+FILE_EXPORTER_BATCH_SIZE = 512
+
+# OTLP span kinds and status codes
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+@dataclasses.dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: str = ""
+    kind: int = KIND_INTERNAL
+    sampled: bool = True
+    start_ns: int = dataclasses.field(default_factory=time.time_ns)
+    end_ns: int = 0
+    status: int = STATUS_OK
+    attributes: dict[str, str | int | float | bool] = dataclasses.field(
+        default_factory=dict
+    )
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_otlp(self) -> dict:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in self.attributes.items()
+            ],
+            "status": {"code": self.status},
+        }
+
+
+def _otlp_value(value: str | int | float | bool) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Exporter(Protocol):
+    def export(self, span: Span) -> None:
+        ...
+
+    def close(self) -> None:
+        ...
+
+
+class InMemoryExporter:
+    """Keeps the most recent spans, e.g. for tests and benchmarks"""
+
+    def __init__(self, max_spans: int = 10000):
+        self.spans: collections.deque[Span] = collections.deque(maxlen=max_spans)
+
+    def export(self, span: Span):
+        self.spans.append(span)
+
+    def close(self):
+        pass
+
+
+class FileExporter:
+    """Appends each span as OTLP JSON line to a file.
+
+    Spans are queued and written in batches by a background thread, which keeps
+    the file open, so requests never wait for the file system.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.dropped = 0
+        self._queue: queue.Queue[Span | None] = queue.Queue(FILE_EXPORTER_QUEUE_SIZE)
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        # started by the first span, so that it runs in the forked worker
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name="span-file-exporter", daemon=True
+                    )
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            if not self.dropped:
+                logger.warning(f"Writing spans to '{self.path}' is behind, dropping.")
+            self.dropped += 1
+
+    def flush(self):
+        """Wait until the queued spans are written"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        try:
+            # unbuffered, so that every batch is a single append of whole lines
+            # and lines of several workers don't interleave
+            f = open(self.path, "ab", buffering=0)
+        except OSError:
+            # the spans are still taken off the queue, so that exporting never blocks
+            logger.exception(f"Opening '{self.path}' failed, dropping spans.")
+            f = None
+        while True:
+            spans = [self._queue.get()]
+            with contextlib.suppress(queue.Empty):
+                while len(spans) < FILE_EXPORTER_BATCH_SIZE and spans[-1] is not None:
+                    spans.append(self._queue.get_nowait())
+            try:
+                if f is not None:
+                    f.write(b"".join(self._line(span) for span in spans if span))
+            except OSError:
+                logger.exception(f"Writing spans to '{self.path}' failed")
+            finally:
+                for _ in spans:
+                    self._queue.task_done()
+            if spans[-1] is None:
+                break
+        if f is not None:
+            f.close()
+
+    def _line(self, span: Span) -> bytes:
+        line = json.dumps(
+            {
+                "resourceSpans": [
+                    {
+                        "resource": {
+                            "attributes": [
+                                {
+                                    "key": "service.name",
+                                    "value": {"stringValue": SERVICE_NAME},
+                                }
+                            ]
+                        },
+                        "scopeSpans": [
+                            {"scope": {"name": __name__}, "spans": [span.to_otlp()]}
+                        ],
+                    }
+                ]
+            }
+        )
+        return (line + "\n").encode()
+
+
+def make_exporter() -> Exporter | None:
+    if config.TRACING_EXPORTER == "memory":
+        return InMemoryExporter()
+    if config.TRACING_EXPORTER == "file":
+        return FileExporter(config.TRACING_FILE)
+    if config.TRACING_EXPORTER:
+        logger.warning(f"Unknown tracing exporter '{config.TRACING_EXPORTER}'")
+    return None
+
+
+exporter: Exporter | None = make_exporter()
+
+_current_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+def current_span() -> Span | None:
+    return _current_span.get()
+
+
+def _random_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+@contextlib.contextmanager
+def _record(span: Span) -> Iterator[Span]:
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.status = STATUS_ERROR
+        span.attributes["error.type"] = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end_ns = time.time_ns()
+        if span.sampled and exporter is not None:
+            try:
+                exporter.export(span)
+            except Exception:
+                logger.exception("Exporting span failed")
+
+
+@contextlib.contextmanager
+def request_span(
+    name: str, traceparent: str | None = None, **attributes
+) -> Iterator[Span | None]:
+    """Root span of a request, continuing the trace of the `traceparent` header"""
+    if exporter is None:
+        yield None
+        return
+
+    if traceparent and (parent := TRACEPARENT_PATTERN.fullmatch(traceparent.strip())):
+        trace_id = parent["trace_id"]
+        parent_span_id = parent["span_id"]
+        sampled = bool(int(parent["flags"], 16) & 1)
+    else:
+        trace_id = _random_id(128)
+        parent_span_id = ""
+        sampled = random.random() < config.TRACING_SAMPLE_RATIO
+
+    with _record(
+        Span(
+            name=name,
+            trace_id=trace_id,
+            span_id=_random_id(64),
+            parent_span_id=parent_span_id,
+            kind=KIND_SERVER,
+            sampled=sampled,
+            attributes=attributes,
+        )
+    ) as span:
+        yield span
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes) -> Iterator[Span | None]:
+    """Child span of the current span, nothing is recorded outside of requests"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    with _record(
+        Span(
+            name=name,
+            trace_id=parent.trace_id,
+            span_id=_random_id(64),
+            parent_span_id=parent.span_id,
+            sampled=parent.sampled,
+            attributes=attributes,
+        )
+    ) as child:
+        yield child
@@ -1,3 +1,4 @@
+import hashlib
 import re
 
 
@@ -28,3 +29,30 @@ def mask_private_key(key):
             rows[idx] = f"{'*' * len(row)}"
     masked = "\n".join(rows)
     return key.replace(content, masked)
+
+
+def make_etag(*parts: str) -> str:
+    """Strong ETag over the given parts, e.g. names and resourceVersions"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Weak comparison as required for If-None-Match (RFC 9110 13.1.2)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (
+        tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+    )
+
+
+def json_pointer(*tokens: str) -> str:
+    """JSON pointer (RFC 6901) to use as path in JSON patches"""
+    return "".join(
+        "/" + token.replace("~", "~0").replace("/", "~1") for token in tokens
+    )
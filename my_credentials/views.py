@@ -1,37 +1,151 @@
+import asyncio
 import base64
 import collections
+import contextlib
+import contextvars
+import functools
+import hashlib
 import http
 import json
 import logging
+import math
 import os
 import re
-from typing import Dict, cast
+import threading
+import time
+from pathlib import Path
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    Literal,
+    TypeVar,
+    cast,
+)
 
 import cachetools
+import jinja2
 import jwt
-import requests
-from fastapi import File, HTTPException, Request, Response, UploadFile
-from fastapi.responses import HTMLResponse
+from fastapi import HTTPException, Query, Request, Response
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from kubernetes import client as k8s_client
 from kubernetes import config as k8s_config
 from kubernetes.client.exceptions import ApiException
+from markupsafe import Markup
 from pydantic import BaseModel
 from starlette.responses import RedirectResponse
 
-from my_credentials import app
-from my_credentials.utils import mask_private_key
+from my_credentials import (
+    INFRASTRUCTURE_VIEWS,
+    app,
+    config,
+    k8s,
+    metrics,
+    timing,
+    tracing,
+)
+from my_credentials.informer import (
+    APP_ENV_ANNOTATION_PREFIX,
+    SecretInformer,
+    display_type,
+    env_apps,
+    get_informer,
+    is_cached,
+    start_informer,
+    stop_informers,
+)
+from my_credentials.intake import KeyUpload, read_form
+from my_credentials.jwks import JWKSClient
+from my_credentials.records import RecordPage, SecretLike, parse_secret_list
+from my_credentials.shared_cache import SharedSecretCache
+from my_credentials.utils import (
+    etag_matches,
+    json_pointer,
+    make_etag,
+    mask_private_key,
+)
 
 logger = logging.getLogger(__name__)
 
-templates = Jinja2Templates(directory="templates")
+T = TypeVar("T")
+
+
+class TimedTemplates(Jinja2Templates):
+    """Templates which record the rendering time of their responses"""
+
+    def TemplateResponse(self, *args, **kwargs):
+        template = kwargs.get("name", "unknown")
+        with timing.timed(
+            metrics.TEMPLATE_RENDER_DURATION, "render", template=template
+        ), tracing.span("render", template=template):
+            return super().TemplateResponse(*args, **kwargs)
+
+
+def template_bytecode_cache() -> jinja2.BytecodeCache | None:
+    if not config.TEMPLATE_BYTECODE_CACHE_DIR:
+        return None
+    try:
+        os.makedirs(config.TEMPLATE_BYTECODE_CACHE_DIR, exist_ok=True)
+    except OSError as e:
+        logger.warning(f"Not caching compiled templates: {e}")
+        return None
+    return jinja2.FileSystemBytecodeCache(config.TEMPLATE_BYTECODE_CACHE_DIR)
+
+
+templates = TimedTemplates(
+    env=jinja2.Environment(
+        loader=jinja2.FileSystemLoader("templates"),
+        autoescape=jinja2.select_autoescape(),
+        bytecode_cache=template_bytecode_cache(),
+    )
+)
+# part of the ETags of rendered pages, so that they change on template updates
+TEMPLATES_VERSION = make_etag(
+    *(path.read_text() for path in sorted(Path("templates").glob("*.html")))
+)
 
 MY_SECRETS_LABEL_KEY = "owner"
 MY_SECRETS_LABEL_VALUE = "edc-my-credentials"
+MY_SECRETS_LABEL_SELECTOR = f"{MY_SECRETS_LABEL_KEY}={MY_SECRETS_LABEL_VALUE}"
+
+
+# seconds spent per startup phase, reported by /ready
+startup_durations: dict[str, float] = {}
+
+
+@contextlib.contextmanager
+def startup_phase(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_durations[name] = round(time.perf_counter() - start, 4)
 
 
 @app.on_event("startup")
 async def startup_load_k8s_config():
+    check_tenant_config()
+    with startup_phase("k8s_config"):
+        load_k8s_config()
+
+    # in multi-tenant mode, the informers are started by the first request of a user
+    if config.SECRET_CACHE_ENABLED and not config.MULTI_TENANT:
+        start_informer(
+            current_namespace(),
+            MY_SECRETS_LABEL_SELECTOR,
+            # the watch runs in the publisher process then
+            SharedSecretCache if config.SHARED_SECRET_CACHE_DIR else SecretInformer,
+        )
+
+    with startup_phase("k8s_connection"):
+        await k8s.check_connection()
+
+
+def load_k8s_config():
     try:
         if os.getenv("KUBECONFIG"):
             k8s_config.load_kube_config(os.getenv("KUBECONFIG"))
@@ -40,57 +154,424 @@ async def startup_load_k8s_config():
     except Exception:
         # load_kube_config might throw anything :/
         k8s_config.load_incluster_config()
+    k8s.connect()
+
+
+@app.on_event("shutdown")
+async def shutdown_stop_informers():
+    stop_informers()
+    k8s.shutdown()
+
+
+def secret_cache() -> SecretInformer | None:
+    if not config.SECRET_CACHE_ENABLED:
+        return None
+    if config.MULTI_TENANT:
+        return start_informer(current_namespace(), MY_SECRETS_LABEL_SELECTOR)
+    return get_informer(current_namespace())
+
+
+async def synced_secret_cache() -> SecretInformer | None:
+    """Returns the secret cache if reads can be served from it"""
+    if informer := secret_cache():
+        if informer.synced:
+            return informer
+        if informer.forbidden:
+            # logged by the informer
+            return None
+        if not config.SECRET_CACHE_FALLBACK_TO_LIST:
+            if await asyncio.to_thread(
+                informer.wait_until_synced, config.SECRET_CACHE_SYNC_TIMEOUT
+            ):
+                return informer
+            raise HTTPException(
+                status_code=http.HTTPStatus.SERVICE_UNAVAILABLE,
+                detail="Secret cache is not ready yet",
+            )
+        logger.info("Secret cache is still warming up, listing directly.")
+    return None
 
 
-def get_secret_list() -> list:
-    secret_list: k8s_client.V1SecretList = (
-        k8s_client.CoreV1Api().list_namespaced_secret(
-            namespace=current_namespace(),
-            label_selector=f"{MY_SECRETS_LABEL_KEY}={MY_SECRETS_LABEL_VALUE}",
+async def list_my_secrets() -> list[SecretLike]:
+    if informer := await synced_secret_cache():
+        return informer.list_all()
+
+    namespace = current_namespace()
+
+    async def list_secrets() -> RecordPage:
+        body = await k8s.call_raw(
+            k8s.core_v1().list_namespaced_secret,
+            namespace=namespace,
+            label_selector=MY_SECRETS_LABEL_SELECTOR,
+        )
+        return parse_secret_list(body)
+
+    page = await k8s.coalesced(
+        ("list_namespaced_secret", namespace, MY_SECRETS_LABEL_SELECTOR), list_secrets
+    )
+    return page.items
+
+
+def update_secret_cache(event_type: str, secret: k8s_client.V1Secret):
+    # apply our own writes right away instead of waiting for the watch event,
+    # so that the redirect after a write already shows the change
+    informer = get_informer(current_namespace()) if config.SECRET_CACHE_ENABLED else None
+    if informer:
+        informer.apply_own_write(event_type, secret)
+
+
+async def list_app_secrets(app: str) -> list[SecretLike]:
+    """Secrets which are injected into the app as environment variables"""
+    if informer := await synced_secret_cache():
+        return informer.list_for_app(app)
+    return [secret for secret in await list_my_secrets() if app in env_apps(secret)]
+
+
+async def read_secret(name: str) -> SecretLike:
+    # secrets which aren't cached are read directly and might not be ours
+    return await ensure_secret_is_mine(name, use_cache=True)
+
+
+async def read_secret_directly(name: str) -> k8s_client.V1Secret:
+    """Read from the API server, concurrent reads of the secret share one call"""
+    namespace = current_namespace()
+    return await k8s.coalesced(
+        ("read_namespaced_secret", namespace, name),
+        functools.partial(
+            k8s.call,
+            k8s.core_v1().read_namespaced_secret,
+            name=name,
+            namespace=namespace,
+        ),
+    )
+
+
+def http_exception_from(e: ApiException) -> HTTPException:
+    if not e.status:
+        # the API server wasn't reached
+        return HTTPException(
+            status_code=http.HTTPStatus.BAD_GATEWAY,
+            detail=f"Kubernetes API error: {e.reason}",
         )
+    message = json.loads(e.body).get("message") if e.body else None
+    return HTTPException(
+        status_code=e.status,
+        detail=f"Status {e.status} - {str(e.reason).title()}: {message}",
     )
 
-    return [serialize_secret(secret) for secret in secret_list.items]
+
+async def list_secrets_page(
+    limit: int | None,
+    continue_token: str | None,
+    field_selector: str | None = None,
+) -> RecordPage:
+    """One chunk of the labelled secrets, always listed from the API server"""
+    namespace = current_namespace()
+
+    async def list_page() -> RecordPage:
+        body = await k8s.call_raw(
+            k8s.core_v1().list_namespaced_secret,
+            namespace=namespace,
+            label_selector=MY_SECRETS_LABEL_SELECTOR,
+            field_selector=field_selector,
+            limit=limit,
+            _continue=continue_token,
+        )
+        return parse_secret_list(body)
+
+    try:
+        return await k8s.coalesced(
+            (
+                "list_namespaced_secret",
+                namespace,
+                MY_SECRETS_LABEL_SELECTOR,
+                field_selector,
+                limit,
+                continue_token,
+            ),
+            list_page,
+        )
+    except ApiException as e:
+        # e.g. 410 if the continue token expired
+        raise http_exception_from(e)
+
+
+async def iter_secret_chunks(
+    informer: SecretInformer | None, field_selector: str | None = None
+) -> AsyncIterator[list[SecretLike]]:
+    if informer:
+        yield informer.list_all()
+        return
+
+    continue_token = None
+    while True:
+        page = await list_secrets_page(
+            config.LIST_PAGE_SIZE, continue_token, field_selector
+        )
+        yield page.items
+        if not (continue_token := page.continue_token):
+            return
+
+
+async def stream_secrets(
+    informer: SecretInformer | None,
+    include: Callable[[SecretLike], bool],
+    fields: Literal["all", "keys"],
+    field_selector: str | None = None,
+) -> AsyncIterator[bytes]:
+    """Serialized secrets as NDJSON, listed in chunks so that memory is bounded"""
+    async for secrets in iter_secret_chunks(informer, field_selector):
+        for secret in secrets:
+            if include(secret):
+                yield secret_json(secret, fields) + b"\n"
+
+
+def secrets_etag(secrets: list[SecretLike], *variant: str) -> str:
+    return make_etag(
+        TEMPLATES_VERSION,
+        *variant,
+        *(
+            f"{secret.metadata.name}@{secret.metadata.resource_version}"
+            for secret in secrets
+        ),
+    )
+
+
+def not_modified(request: Request, etag: str) -> Response | None:
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(
+            status_code=http.HTTPStatus.NOT_MODIFIED,
+            headers={"ETag": etag},
+        )
+    return None
 
 
 @app.get("/", response_class=HTMLResponse)
 async def list_credentials(request: Request):
-    check_token(request)
-    secrets_serialized = get_secret_list()
+    await check_token(request)
+    secrets = await list_my_secrets()
+    etag = secrets_etag(secrets, "credentials.html")
+    if response := not_modified(request, etag):
+        return response
 
     return templates.TemplateResponse(
         request=request,
         name="credentials.html",
         context={
             "request": request,
-            "secrets": secrets_serialized,
+            "cards": [credential_card(secret) for secret in secrets],
         },
+        headers={"ETag": etag},
     )
 
 
-@app.get("/get-credentials")  # ?app=
-async def list_credentials_api(request: Request, app=None):
-    check_token(request)
-    secret_list = get_secret_list()
-    opaque_secrets = [s for s in secret_list if s.get("type") == "key-value (Opaque)"]
-    if not app:
-        return opaque_secrets
-    return [s for s in opaque_secrets if s.get("annotations").get(f"eoxhub-env-{app}")]
+# keyed by namespace, name and resourceVersion, so changed secrets are rendered again
+card_cache: cachetools.LRUCache = cachetools.LRUCache(maxsize=config.FRAGMENT_CACHE_SIZE)
+
+
+def credential_card(secret: SecretLike) -> Markup:
+    """The rendered card of a secret on the list page"""
+    key = (current_namespace(), secret.metadata.name, secret.metadata.resource_version)
+    if key[2] is not None and (card := card_cache.get(key)) is not None:
+        metrics.FRAGMENT_CACHE_LOOKUPS.labels(fragment="card", result="hit").inc()
+        return card
+
+    metrics.FRAGMENT_CACHE_LOOKUPS.labels(fragment="card", result="miss").inc()
+    with timing.timed(
+        metrics.TEMPLATE_RENDER_DURATION, "render", template="credential_card.html"
+    ):
+        card = Markup(
+            templates.get_template("credential_card.html").render(
+                secret=serialize_secret(secret, fields="keys")
+            )
+        )
+    if key[2] is not None:
+        card_cache[key] = card
+    return card
+
+
+# keyed like the cards, and by the serialized fields
+json_cache: cachetools.LRUCache = cachetools.LRUCache(maxsize=config.FRAGMENT_CACHE_SIZE)
+
+
+def secret_json(secret: SecretLike, fields: Literal["all", "keys"]) -> bytes:
+    """The secret as serialized by `serialize_secret`, encoded as JSON"""
+    key = (
+        current_namespace(),
+        secret.metadata.name,
+        secret.metadata.resource_version,
+        fields,
+    )
+    if key[2] is not None and (fragment := json_cache.get(key)) is not None:
+        metrics.FRAGMENT_CACHE_LOOKUPS.labels(fragment="json", result="hit").inc()
+        return fragment
+
+    metrics.FRAGMENT_CACHE_LOOKUPS.labels(fragment="json", result="miss").inc()
+    # encoded like JSONResponse does, the decoded data is a UserDict
+    fragment = json.dumps(
+        serialize_secret(secret, fields),
+        default=dict,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode()
+    if key[2] is not None:
+        json_cache[key] = fragment
+    return fragment
+
+
+class JSONArrayResponse(Response):
+    """A JSON array spliced together from already encoded items"""
+
+    media_type = "application/json"
+
+    def __init__(self, items: Iterable[bytes], **kwargs):
+        super().__init__(b"[" + b",".join(items) + b"]", **kwargs)
+
+
+@app.get("/get-credentials")  # ?app=&fields=&limit=&continue=&format=
+async def list_credentials_api(
+    request: Request,
+    app=None,
+    fields: Literal["all", "keys"] = "all",
+    limit: int | None = Query(None, gt=0),
+    continue_token: str | None = Query(None, alias="continue"),
+    format: Literal["json", "ndjson"] = "json",
+):
+    await check_token(request)
+
+    def include(secret: SecretLike) -> bool:
+        return app in env_apps(secret) if app else secret.type == "Opaque"
+
+    if format == "ndjson":
+        return StreamingResponse(
+            stream_secrets(
+                await synced_secret_cache(),
+                include,
+                fields,
+                field_selector="type=Opaque",
+            ),
+            media_type="application/x-ndjson",
+        )
+
+    if limit or continue_token:
+        # the next page can be requested with ?continue=<X-Continue header>
+        page = await list_secrets_page(
+            limit, continue_token, field_selector="type=Opaque"
+        )
+        return JSONArrayResponse(
+            (secret_json(secret, fields) for secret in page.items if include(secret)),
+            headers=(
+                {"X-Continue": page.continue_token} if page.continue_token else None
+            ),
+        )
+
+    if app:
+        secrets = await list_app_secrets(app)
+    else:
+        secrets = [s for s in await list_my_secrets() if s.type == "Opaque"]
+
+    etag = secrets_etag(secrets, "get-credentials", app or "", fields)
+    if not_modified_response := not_modified(request, etag):
+        return not_modified_response
+    return JSONArrayResponse(
+        (secret_json(secret, fields) for secret in secrets), headers={"ETag": etag}
+    )
+
+
+@app.get("/get-credentials/env")  # ?app=
+async def app_env(request: Request, response: Response, app: str):
+    """Environment variables to inject into the app, named like in credentials.html"""
+    await check_token(request)
+    secrets = await list_app_secrets(app)
+
+    etag = secrets_etag(secrets, "get-credentials/env", app)
+    if not_modified_response := not_modified(request, etag):
+        return not_modified_response
+    response.headers["ETag"] = etag
+    return {
+        f"{secret.metadata.name}_{key}": value
+        for secret in secrets
+        for key, value in B64DecodedAccessDict(secret.data or {}).items()
+    }
+
+
+def sse_message(event: str, data: dict, id: str | None = None) -> bytes:
+    lines = [f"event: {event}", f"data: {json.dumps(data)}"]
+    if id:
+        lines.append(f"id: {id}")
+    return ("\n".join(lines) + "\n\n").encode()
+
+
+async def stream_changes(
+    informer: SecretInformer, last_event_id: str | None
+) -> AsyncIterator[bytes]:
+    """Changes of the cached secrets as server-sent events, until the cache is gone"""
+    metrics.EVENT_STREAMS.inc()
+    try:
+        # milliseconds the client waits before reconnecting
+        yield b"retry: 3000\n\n"
+        cursor = informer.last_event_id
+        if last_event_id:
+            if informer.events_after(last_event_id) is None:
+                # e.g. another worker or the cache restarted, the client has to refetch
+                yield sse_message("reset", {}, id=cursor)
+            else:
+                cursor = last_event_id
+
+        last_sent = time.monotonic()
+        # e.g. evicted in multi-tenant mode, the client reconnects to a new one
+        while is_cached(informer):
+            # checking reloads the snapshot of a shared cache
+            events = informer.events_after(cursor) if informer.synced else []
+            if events is None:
+                cursor = informer.last_event_id
+                yield sse_message("reset", {}, id=cursor)
+                last_sent = time.monotonic()
+            elif events:
+                for event in events:
+                    cursor = f"{informer.epoch}-{event.seq}"
+                    yield sse_message(event.type.lower(), event.to_dict(), id=cursor)
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= config.EVENTS_KEEPALIVE_INTERVAL:
+                yield b": keepalive\n\n"
+                last_sent = time.monotonic()
+            await asyncio.sleep(config.EVENTS_POLL_INTERVAL)
+    finally:
+        metrics.EVENT_STREAMS.dec()
+
+
+@app.get("/events")
+async def change_events(request: Request):
+    """Added, modified and deleted secrets as server-sent events, without values"""
+    await check_token(request)
+    informer = secret_cache()
+    if informer is None:
+        raise HTTPException(
+            status_code=http.HTTPStatus.NOT_IMPLEMENTED,
+            detail="Change events need the secret cache",
+        )
+    return StreamingResponse(
+        stream_changes(informer, request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.get("/credentials-detail/{credential_name}", response_class=HTMLResponse)
 @app.get("/credentials-detail/", response_class=HTMLResponse)
 async def credentials_detail(request: Request, credential_name: str = ""):
-    check_token(request)
+    await check_token(request)
     is_new_credential = not bool(credential_name)
+    headers = {}
 
     if is_new_credential:
         secret_data = {"name": "", "data": {}}
     else:
-        secret: k8s_client.V1Secret = k8s_client.CoreV1Api().read_namespaced_secret(
-            name=credential_name,
-            namespace=current_namespace(),
-        )
+        secret = await read_secret(credential_name)
+        etag = secrets_etag([secret], "credentials-detail")
+        if response := not_modified(request, etag):
+            return response
+        headers["ETag"] = etag
         secret_data = serialize_secret(secret)
 
     secret_type = secret_data.get("type")
@@ -129,6 +610,7 @@ async def credentials_detail(request: Request, credential_name: str = ""):
             context={"request": request,
                      "secret": secret_data,
                      "is_new_credential": False},
+            headers=headers,
         )
     else:
         return RedirectResponse(
@@ -148,18 +630,16 @@ class CredentialsPayload(BaseModel):
 async def create_or_update(
     request: Request, credentials_name: str = "", private_key_content: str | None = None
 ):
-    form_data = await request.form(max_files=0)
+    await check_token_for_write(request)
+    with tracing.span("parse_form"):
+        form_data = (await read_form(request)).form
 
     is_update = bool(credentials_name)
     credentials_name = (
         credentials_name or str(form_data.get("credentials_name")).strip()
     )
 
-    type = form_data.get("type", "")
-    secret_metadata = k8s_client.V1ObjectMeta(
-        name=credentials_name,
-        labels={MY_SECRETS_LABEL_KEY: MY_SECRETS_LABEL_VALUE},
-    )
+    type = str(form_data.get("type", ""))
     secret_data = {}
     if type == "kubernetes.io/ssh-auth":
         if isinstance(private_key_content, str):
@@ -201,39 +681,201 @@ async def create_or_update(
             for key, value in zip(data.secret_key, data.secret_value)
         }
 
-    new_secret = k8s_client.V1Secret(
-        metadata=secret_metadata, data=secret_data, type=type
-    )
-
     if is_update:
         logger.info(f"Update secret '{credentials_name}'.")
-        existing_secret = ensure_secret_is_mine(credentials_name)
-        # set keys to None for deletion
-        new_secret.data = {k: None for k in (existing_secret.data or {})} | (
-            new_secret.data or {}
-        )
-        k8s_client.CoreV1Api().patch_namespaced_secret(
-            name=credentials_name,
-            namespace=current_namespace(),
-            body=new_secret,
-        )
+        await update_secret(credentials_name, secret_data)
         return RedirectResponse(
             url="..",
             status_code=http.HTTPStatus.FOUND,
         )
     else:
+        logger.info(f"Create secret '{credentials_name}'.")
+        await create_secret(credentials_name, type, secret_data)
+
+
+def make_secret(name: str, type: str, data: dict[str, str]) -> k8s_client.V1Secret:
+    return k8s_client.V1Secret(
+        metadata=k8s_client.V1ObjectMeta(
+            name=name,
+            labels={MY_SECRETS_LABEL_KEY: MY_SECRETS_LABEL_VALUE},
+        ),
+        data=data,
+        type=type,
+    )
+
+
+async def create_secret(
+    name: str, type: str, data: dict[str, str]
+) -> k8s_client.V1Secret:
+    """Create a labelled secret, the values of `data` need to be base64 encoded"""
+    try:
+        created_secret = await k8s.call(
+            k8s.core_v1().create_namespaced_secret,
+            namespace=current_namespace(),
+            body=make_secret(name, type, data),
+        )
+    except ApiException as e:
+        raise http_exception_from(e)
+    update_secret_cache("ADDED", created_secret)
+    return created_secret
+
+
+# as first operation of a JSON patch, the patch is only applied to our secrets
+TEST_IS_MINE_OPERATION = {
+    "op": "test",
+    "path": json_pointer("metadata", "labels", MY_SECRETS_LABEL_KEY),
+    "value": MY_SECRETS_LABEL_VALUE,
+}
+
+
+def expect_resource_version(secret: SecretLike) -> dict:
+    # the API server rejects the patch with 409 if the secret changed since then
+    return {
+        "op": "replace",
+        "path": json_pointer("metadata", "resourceVersion"),
+        "value": secret.metadata.resource_version,
+    }
+
+
+async def patch_my_secret(name: str, operations: list[dict]) -> k8s_client.V1Secret:
+    """Apply a JSON patch to one of our secrets in a single round trip"""
+    try:
+        updated_secret = await k8s.call(
+            k8s.core_v1().patch_namespaced_secret,
+            name=name,
+            namespace=current_namespace(),
+            body=[TEST_IS_MINE_OPERATION, *operations],
+        )
+    except ApiException as e:
+        if e.status == http.HTTPStatus.UNPROCESSABLE_ENTITY:
+            # either a test operation failed or the patch is invalid
+            await ensure_secret_is_mine(name)
+        if e.status == http.HTTPStatus.CONFLICT:
+            raise
+        raise http_exception_from(e)
+    update_secret_cache("MODIFIED", updated_secret)
+    return updated_secret
+
+
+async def retry_on_conflict(write: Callable[[bool], Awaitable[T]]) -> T:
+    """Retries `write` if the secret was changed concurrently.
+
+    `write` gets whether it may use the secret cache, retries read from the API
+    server as the cache might be behind.
+    """
+    for attempt in range(config.K8S_CONFLICT_RETRIES):
         try:
-            logger.info(f"Create secret '{credentials_name}'.")
-            k8s_client.CoreV1Api().create_namespaced_secret(
-                namespace=current_namespace(),
-                body=new_secret,
-            )
+            return await write(attempt == 0)
         except ApiException as e:
-            raise HTTPException(
-                status_code=e.status,
-                detail=f"Status {e.status} - {e.reason.title()}: "
-                f"{json.loads(e.body).get('message')}",
-            )
+            if e.status != http.HTTPStatus.CONFLICT:
+                raise http_exception_from(e)
+            logger.info(f"Conflict on attempt {attempt + 1}, retrying: {e.reason}")
+    raise HTTPException(
+        status_code=http.HTTPStatus.CONFLICT,
+        detail="The secret was changed concurrently, please try again",
+    )
+
+
+def data_diff(current: dict[str, str], new: dict[str, str]) -> list[dict]:
+    """JSON patch operations changing only the keys which differ"""
+    if not current:
+        return [{"op": "add", "path": json_pointer("data"), "value": new}] if new else []
+    return [
+        {"op": "add", "path": json_pointer("data", key), "value": value}
+        for key, value in new.items()
+        if current.get(key) != value
+    ] + [
+        {"op": "remove", "path": json_pointer("data", key)}
+        for key in current
+        if key not in new
+    ]
+
+
+async def update_secret(name: str, data: dict[str, str]) -> k8s_client.V1Secret:
+    """Replace the data of one of our secrets, keys missing in `data` are removed.
+
+    Only the changed keys are sent, if nothing changed the secret isn't written.
+    """
+
+    async def write(use_cache: bool) -> k8s_client.V1Secret:
+        secret = await ensure_secret_is_mine(name, use_cache=use_cache)
+        operations = data_diff(secret.data or {}, data)
+        if not operations:
+            if use_cache:
+                # the cache might be behind a change which this write would undo
+                return await write(False)
+            logger.info(f"Secret '{name}' is unchanged, skipping update.")
+            metrics.SUPPRESSED_WRITES.labels(operation="update").inc()
+            return secret
+        return await patch_my_secret(
+            name, [expect_resource_version(secret), *operations]
+        )
+
+    return await retry_on_conflict(write)
+
+
+async def set_app_env(
+    name: str, app: str, enabled: bool | None = None
+) -> k8s_client.V1Secret:
+    """Inject the secret into the app as environment variables, toggles by default"""
+    key = f"{APP_ENV_ANNOTATION_PREFIX}{app}"
+
+    async def write(use_cache: bool) -> k8s_client.V1Secret:
+        secret = await ensure_secret_is_mine(name, use_cache=use_cache)
+        annotations = secret.metadata.annotations or {}
+        enable = not annotations.get(key) if enabled is None else enabled
+
+        operation: dict
+        if enable == bool(annotations.get(key)):
+            if use_cache:
+                # the cache might be behind a change which this write would undo
+                return await write(False)
+            metrics.SUPPRESSED_WRITES.labels(operation="annotate").inc()
+            return secret
+        if enable:
+            logger.info(f"Add annotation '{key}: \"True\"' to '{name}'.")
+            if annotations:
+                operation = {
+                    "op": "add",
+                    "path": json_pointer("metadata", "annotations", key),
+                    "value": "True",
+                }
+            else:
+                operation = {
+                    "op": "add",
+                    "path": json_pointer("metadata", "annotations"),
+                    "value": {key: "True"},
+                }
+        else:
+            logger.info(f"Remove annotation '{key}' from '{name}'.")
+            operation = {
+                "op": "remove",
+                "path": json_pointer("metadata", "annotations", key),
+            }
+        return await patch_my_secret(
+            name, [expect_resource_version(secret), operation]
+        )
+
+    return await retry_on_conflict(write)
+
+
+async def delete_secret(name: str):
+    async def write(use_cache: bool):
+        secret = await ensure_secret_is_mine(name, use_cache=use_cache)
+        # only delete the version of which we checked that it is ours
+        await k8s.call(
+            k8s.core_v1().delete_namespaced_secret,
+            name=name,
+            namespace=current_namespace(),
+            body=k8s_client.V1DeleteOptions(
+                preconditions=k8s_client.V1Preconditions(
+                    resource_version=secret.metadata.resource_version,
+                ),
+            ),
+        )
+        update_secret_cache("DELETED", secret)
+
+    await retry_on_conflict(write)
 
 
 @app.get("/create/", response_class=HTMLResponse)
@@ -246,14 +888,17 @@ async def create_form(request: Request):
 
 
 @app.post("/create/")
-async def handle_create(request: Request, ssh_file: UploadFile = File(None)):
-    form_data = await request.form(max_files=0)
+async def handle_create(request: Request):
+    await check_token_for_write(request)
+    with tracing.span("parse_form"):
+        intake = await read_form(request)
+    form_data = intake.form
     type = form_data.get("type")
     name = form_data.get("credentials_name")
     create = form_data.get("create")
 
     if name:
-        current_secrets = [s.get("name") for s in get_secret_list()]
+        current_secrets = [s.metadata.name for s in await list_my_secrets()]
         secret_already_exists = name in current_secrets
         if secret_already_exists:
             return templates.TemplateResponse(
@@ -270,14 +915,15 @@ async def handle_create(request: Request, ssh_file: UploadFile = File(None)):
     if create:
         private_key_content = None
         if type == "kubernetes.io/ssh-auth":
-            if ssh_file.filename:
+            ssh_file = intake.keys.get("ssh_file")
+            private_key = intake.keys.get("privatekey") or KeyUpload("privatekey")
+            if ssh_file and ssh_file.filename:
                 logger.info("Validate provided ssh-file.")
                 validate_private_key = await validate_and_read_key(ssh_file)
             else:
                 logger.info("Validate provided privatekey.")
-                private_key = (
-                    str(form_data.get("privatekey", "")).rstrip("\n").replace("\r", "")
-                    + "\n"
+                private_key.content = (
+                    private_key.content.rstrip("\n").replace("\r", "") + "\n"
                 )
                 validate_private_key = await validate_and_read_key(private_key)
 
@@ -291,7 +937,7 @@ async def handle_create(request: Request, ssh_file: UploadFile = File(None)):
                             "name": name,
                             "type": type,
                             "data": {
-                                "privatekey": form_data.get("privatekey", ""),
+                                "privatekey": private_key.content,
                             },
                         },
                         "is_new_credential": True,
@@ -329,104 +975,275 @@ async def handle_create(request: Request, ssh_file: UploadFile = File(None)):
     )
 
 
-def update_env_var_annotations(secret, key):
-    if isinstance(secret.metadata.annotations, dict):
-        secret.metadata.annotations[key] = (
-            None if secret.metadata.annotations.get(key) else "True"
-        )
-    else:
-        secret.metadata.annotations = {key: "True"}
-    logger.info(f"Add annotation '{key}: \"True\"' to '{secret}'.")
-    return secret
-
-
 @app.post("/credentials-detail/{credentials_name}/{app}")
-def add_credential_to_app_env(credentials_name: str, app: str):
-    secret = ensure_secret_is_mine(credentials_name)
-    secret = update_env_var_annotations(secret, f"eoxhub-env-{app}")
-    k8s_client.CoreV1Api().patch_namespaced_secret(
-        name=credentials_name,
-        namespace=current_namespace(),
-        body=secret,
-    )
+async def add_credential_to_app_env(request: Request, credentials_name: str, app: str):
+    await check_token_for_write(request)
+    await set_app_env(credentials_name, app)
     logger.info(f"Secret '{credentials_name}' added to '{app}' as environment variable.")
     return Response(status_code=http.HTTPStatus.NO_CONTENT)
 
 
 @app.delete("/credentials-detail/{credentials_name}")
-def delete_credentials(credentials_name: str):  # , response_class=PlainTextResponse
-    _ = ensure_secret_is_mine(credentials_name)
-    k8s_client.CoreV1Api().delete_namespaced_secret(
-        name=credentials_name,
-        namespace=current_namespace(),
-    )
+async def delete_credentials(request: Request, credentials_name: str):
+    await check_token_for_write(request)
+    await delete_secret(credentials_name)
     logger.info(f"Secret '{credentials_name}' deleted.")
     return Response(status_code=http.HTTPStatus.NO_CONTENT)
 
 
-def serialize_secret(secret: k8s_client.V1Secret) -> dict:
-    return {
+class BulkOperation(BaseModel):
+    op: Literal["create", "update", "delete", "annotate"]
+    name: str
+    type: Literal[
+        "Opaque", "kubernetes.io/dockerconfigjson", "kubernetes.io/ssh-auth"
+    ] = "Opaque"
+    # plain (not base64 encoded) values for create and update
+    data: dict[str, str] = {}
+    # app to (not) inject the secret into for annotate
+    app: str = ""
+    enabled: bool = True
+
+
+class BulkPayload(BaseModel):
+    operations: list[BulkOperation]
+
+
+async def run_bulk_operation(operation: BulkOperation) -> dict:
+    result: dict = {"op": operation.op, "name": operation.name}
+    try:
+        if operation.op in ("create", "update"):
+            if operation.type == "kubernetes.io/ssh-auth":
+                key = await validate_and_read_key(
+                    KeyUpload.from_bytes(
+                        "ssh-privatekey",
+                        operation.data.get("ssh-privatekey", "").encode(),
+                    )
+                )
+                if isinstance(key, str):
+                    raise HTTPException(
+                        status_code=http.HTTPStatus.UNPROCESSABLE_ENTITY, detail=key
+                    )
+            data = {
+                key: base64.b64encode(value.encode()).decode()
+                for key, value in operation.data.items()
+            }
+            if operation.op == "create":
+                await create_secret(operation.name, operation.type, data)
+            else:
+                await update_secret(operation.name, data)
+        elif operation.op == "annotate":
+            if not operation.app:
+                raise HTTPException(
+                    status_code=http.HTTPStatus.UNPROCESSABLE_ENTITY,
+                    detail="'app' is required for annotate",
+                )
+            await set_app_env(operation.name, operation.app, operation.enabled)
+        else:
+            await delete_secret(operation.name)
+    except HTTPException as e:
+        return result | {"status": e.status_code, "detail": e.detail}
+    except ApiException as e:
+        return result | {"status": e.status, "detail": e.reason}
+    except Exception as e:
+        logger.exception(f"Bulk {operation.op} of '{operation.name}' failed")
+        return result | {
+            "status": http.HTTPStatus.INTERNAL_SERVER_ERROR,
+            "detail": str(e),
+        }
+    return result | {"status": http.HTTPStatus.OK, "detail": None}
+
+
+@app.post("/bulk")
+async def bulk(request: Request, payload: BulkPayload):
+    """Runs the operations concurrently and returns one result per operation.
+
+    Operations on the same secret run in the given order, operations on
+    different secrets run concurrently (at most `BULK_CONCURRENCY` at a time).
+    """
+    await check_token(request)
+    if len(payload.operations) > config.BULK_MAX_OPERATIONS:
+        raise HTTPException(
+            status_code=http.HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {config.BULK_MAX_OPERATIONS} operations are allowed",
+        )
+
+    semaphore = asyncio.Semaphore(config.BULK_CONCURRENCY)
+    results: list[dict] = [{} for _ in payload.operations]
+    by_name: dict[str, list[int]] = collections.defaultdict(list)
+    for index, operation in enumerate(payload.operations):
+        by_name[operation.name].append(index)
+
+    async def run_in_order(indices: list[int]):
+        for index in indices:
+            async with semaphore:
+                results[index] = await run_bulk_operation(payload.operations[index])
+
+    await asyncio.gather(*(run_in_order(indices) for indices in by_name.values()))
+    logger.info(f"Ran {len(results)} bulk operations.")
+    return {"results": results}
+
+
+def serialize_secret(secret: SecretLike, fields: Literal["all", "keys"] = "all") -> dict:
+    serialized = {
         "name": secret.metadata.name,
-        "data": B64DecodedAccessDict(secret.data),
         "annotations": secret.metadata.annotations
         if secret.metadata.annotations
         else {},
-        "type": secret.type if secret.type != "Opaque" else "key-value (Opaque)",
+        "type": display_type(secret.type),
     }
+    if fields == "keys":
+        # the encoded value is empty iff the decoded value is, so nothing is decoded
+        serialized["keys"] = [k for k, v in (secret.data or {}).items() if v]
+    else:
+        serialized["data"] = B64DecodedAccessDict(secret.data)
+    return serialized
+
+
+# namespace of the user of the current request in multi-tenant mode
+request_namespace: contextvars.ContextVar[str | None] = contextvars.ContextVar(
+    "request_namespace", default=None
+)
+
+# RFC 1123 label, as required for namespace names
+NAMESPACE_PATTERN = re.compile(r"[a-z0-9]([-a-z0-9]{0,61}[a-z0-9])?")
+
+
+def check_tenant_config():
+    # otherwise every user could pick any namespace the service account can access
+    if config.MULTI_TENANT and not (
+        config.TENANT_NAMESPACE_PREFIX or config.TENANT_NAMESPACES
+    ):
+        raise RuntimeError(
+            "MULTI_TENANT requires TENANT_NAMESPACE_PREFIX or TENANT_NAMESPACES"
+        )
+
+
+@app.middleware("http")
+async def resolve_tenant_namespace(request: Request, call_next):
+    if config.MULTI_TENANT and request.url.path not in INFRASTRUCTURE_VIEWS:
+        try:
+            request_namespace.set(await tenant_namespace_of(request))
+        except HTTPException as e:
+            # raised outside of the routes, so it isn't handled by FastAPI
+            return JSONResponse({"detail": e.detail}, status_code=e.status_code)
+    return await call_next(request)
+
+
+async def tenant_namespace_of(request: Request) -> str | None:
+    header = request.headers.get(config.TENANT_HEADER)
+    if os.getenv("CRED_ENV") == "LOCAL":
+        identity = header
+    else:
+        claims = await check_token_content(bearer_token(request))
+        identity = claims.get(config.TENANT_CLAIM)
+        if header and header != identity:
+            raise HTTPException(
+                status_code=http.HTTPStatus.FORBIDDEN,
+                detail="User does not match the token",
+            )
+    if not identity:
+        return None
+    return f"{config.TENANT_NAMESPACE_PREFIX}{identity}"
 
 
-def current_namespace():
+@functools.cache
+def own_namespace() -> str:
     # getting the current namespace like this is documented, so it should be fine:
     # https://kubernetes.io/docs/tasks/access-application-cluster/access-cluster/
+    return open("/var/run/secrets/kubernetes.io/serviceaccount/namespace").read()
+
+
+def current_namespace() -> str:
+    if config.MULTI_TENANT:
+        namespace = request_namespace.get()
+        if namespace is None:
+            raise HTTPException(
+                status_code=http.HTTPStatus.UNAUTHORIZED, detail="User unknown"
+            )
+        if not NAMESPACE_PATTERN.fullmatch(namespace):
+            raise HTTPException(
+                status_code=http.HTTPStatus.BAD_REQUEST,
+                detail=f"Invalid namespace '{namespace}'",
+            )
+        if config.TENANT_NAMESPACES and namespace not in config.TENANT_NAMESPACES:
+            raise HTTPException(
+                status_code=http.HTTPStatus.FORBIDDEN,
+                detail=f"Namespace '{namespace}' is not served",
+            )
+        return namespace
     if os.getenv("CREDENTIALS_NAMESPACE"):
-        return os.getenv("CREDENTIALS_NAMESPACE")
-    else:
-        return open("/var/run/secrets/kubernetes.io/serviceaccount/namespace").read()
+        return os.getenv("CREDENTIALS_NAMESPACE", "")
+    return own_namespace()
 
 
 class B64DecodedAccessDict(collections.UserDict):
+    """Decodes the values on access, each value at most once"""
+
+    def __init__(self, *args, **kwargs):
+        self._decoded: dict[str, str] = {}
+        super().__init__(*args, **kwargs)
+
     def __getitem__(self, key) -> str:
-        value = super().__getitem__(key)
-        return base64.b64decode(value).decode()
+        if key not in self._decoded:
+            self._decoded[key] = base64.b64decode(super().__getitem__(key)).decode()
+        return self._decoded[key]
 
+    def __setitem__(self, key, value):
+        self._decoded.pop(key, None)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._decoded.pop(key, None)
+        super().__delitem__(key)
 
-def ensure_secret_is_mine(credential_name: str) -> k8s_client.V1Secret:
-    secret: k8s_client.V1Secret = k8s_client.CoreV1Api().read_namespaced_secret(
-        name=credential_name,
-        namespace=current_namespace(),
-    )
 
-    if secret.metadata.labels.get(MY_SECRETS_LABEL_KEY) != MY_SECRETS_LABEL_VALUE:
+async def ensure_secret_is_mine(
+    credential_name: str, use_cache: bool = False
+) -> SecretLike:
+    """Read the secret and check that it is labelled as ours.
+
+    With `use_cache`, a synced secret cache is used, which only contains our secrets.
+    """
+    if use_cache and (informer := await synced_secret_cache()):
+        if cached_secret := informer.get(credential_name):
+            return cached_secret
+
+    try:
+        secret = await read_secret_directly(credential_name)
+    except ApiException as e:
+        raise http_exception_from(e)
+
+    labels = secret.metadata.labels or {}
+    if labels.get(MY_SECRETS_LABEL_KEY) != MY_SECRETS_LABEL_VALUE:
         raise HTTPException(status_code=http.HTTPStatus.FORBIDDEN)
 
     return secret
 
 
-async def validate_and_read_key(input: UploadFile | str):
-    MAX_FILE_SIZE = 10 * 1024  # 10KB
+async def validate_and_read_key(input: KeyUpload):
+    with tracing.span("validate_ssh_key") as span:
+        result = await _validate_and_read_key(input)
+        if span and isinstance(result, str):
+            span.attributes["validation.error"] = result
+        return result
+
+
+async def _validate_and_read_key(input: KeyUpload):
     ALLOWED_EXTENSIONS = {".pem", ".txt", ""}  # Added empty string for no extension
     KEY_PATTERN = (
         r"-----BEGIN (?P<type>.*?) KEY-----[\s\S]*?-----END (?P=type) KEY-----"
     )
 
-    if isinstance(input, str):
-        content_bytes = input.encode()
-    else:
-        filename = str(input.filename).lower()
-        _, ext = os.path.splitext(filename)
+    if input.filename:
+        _, ext = os.path.splitext(input.filename.lower())
 
         if ext and ext not in ALLOWED_EXTENSIONS:
             return f"Unsupported file extension '{ext}'"
 
-        content_bytes = await input.read(MAX_FILE_SIZE + 1)
-
-    if len(content_bytes) > MAX_FILE_SIZE:
-        return "Content exceeds the 10KB size limit."
-
-    try:
-        text_content = content_bytes.decode("utf-8")
-    except UnicodeDecodeError:
-        return "Content is not valid UTF-8 text."
+    # size and encoding were checked while the key was received
+    if input.error:
+        return input.error
+    text_content = input.content
 
     match = re.search(KEY_PATTERN, text_content)
     if not match:
@@ -439,33 +1256,149 @@ async def validate_and_read_key(input: UploadFile | str):
     }
 
 
-@cachetools.cached(cache=cachetools.TTLCache(maxsize=1, ttl=900))
-def get_jwks_client():
-    well_known_url = (
-        f"{os.getenv('oidc-issuer-url', '')}/.well-known/openid-configuration"
+jwks_client = JWKSClient(config.OIDC_ISSUER_URL)
+
+
+@app.on_event("startup")
+async def startup_fetch_jwks():
+    if not os.getenv("CRED_ENV") == "LOCAL":
+        with startup_phase("jwks"):
+            await jwks_client.start()
+
+
+@app.on_event("startup")
+async def startup_compile_templates():
+    # instead of on the first request rendering each of them
+    with startup_phase("templates"):
+        for name in templates.env.list_templates():
+            templates.env.get_template(name)
+    logger.info(
+        "Startup: "
+        + ", ".join(f"{name} {took:.3f}s" for name, took in startup_durations.items())
     )
-    logger.info(f"{well_known_url=}")
-    jwks_uri = requests.get(well_known_url).json()["jwks_uri"]
-    return jwt.PyJWKClient(jwks_uri)
 
 
-def check_token(request: Request):
-    token = request.headers.get("authorization", "").replace("Bearer ", "")
+@app.on_event("shutdown")
+async def shutdown_stop_jwks_refresh():
+    await jwks_client.stop()
+
+
+@app.on_event("shutdown")
+async def shutdown_flush_traces():
+    # spans still queued for the file are written
+    if tracing.exporter is not None:
+        await asyncio.to_thread(tracing.exporter.close)
+
+
+def secret_cache_primed() -> bool:
+    # in multi-tenant mode, the caches are started by the requests
+    if not config.SECRET_CACHE_ENABLED or config.MULTI_TENANT:
+        return True
+    informer = get_informer(current_namespace())
+    # without the permission to watch, the secrets are read from the API server
+    return informer is not None and (informer.synced or informer.forbidden)
+
+
+def secret_cache_forbidden() -> bool:
+    if not config.SECRET_CACHE_ENABLED or config.MULTI_TENANT:
+        return False
+    informer = get_informer(current_namespace())
+    return informer is not None and informer.forbidden
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness, unlike /probe only once the first requests won't pay for warm-up"""
+    checks = {
+        "jwks": os.getenv("CRED_ENV") == "LOCAL" or jwks_client.ready,
+        "k8s": k8s.connected() or await k8s.check_connection(),
+        "secret_cache": secret_cache_primed(),
+    }
+    return JSONResponse(
+        {
+            "ready": all(checks.values()),
+            "checks": checks,
+            "secret_cache_forbidden": secret_cache_forbidden(),
+            "startup": startup_durations,
+        },
+        status_code=(
+            http.HTTPStatus.OK
+            if all(checks.values())
+            else http.HTTPStatus.SERVICE_UNAVAILABLE
+        ),
+    )
+
+
+def bearer_token(request: Request) -> str:
+    return request.headers.get("authorization", "").replace("Bearer ", "")
+
+
+async def check_token(request: Request):
+    token = bearer_token(request)
     if not os.getenv("CRED_ENV") == "LOCAL":
         logger.info("Checking token")
-        check_token_content(token)
+        await check_token_content(token)
+
+
+async def check_token_for_write(request: Request):
+    # in multi-tenant mode, a request must not reach other namespaces by its header
+    if config.MULTI_TENANT:
+        await check_token(request)
+
 
+def _token_cache_ttu(_key, result: dict | HTTPException, now: float) -> float:
+    if isinstance(result, HTTPException):
+        return now + config.TOKEN_CACHE_NEGATIVE_TTL
+    # never keep a token valid after it expired
+    return min(result.get("exp", math.inf), now + config.TOKEN_CACHE_MAX_TTL)
 
-@cachetools.cached(cache=cachetools.TTLCache(maxsize=1, ttl=300))
-def check_token_content(token):
-    jwks_client = get_jwks_client()
+
+# keyed by token hash, holds the claims of valid tokens and the error of invalid ones
+token_cache: cachetools.TLRUCache = cachetools.TLRUCache(
+    maxsize=config.TOKEN_CACHE_SIZE,
+    ttu=_token_cache_ttu,
+    timer=time.time,
+)
+token_cache_lock = threading.Lock()
+
+
+async def check_token_content(token) -> dict:
+    with timing.timed(metrics.TOKEN_CHECK_DURATION, "auth"), tracing.span(
+        "check_token"
+    ):
+        return await _check_token_content(token)
+
+
+async def _check_token_content(token) -> dict:
     if not token:
         logger.info("Token missing")
         raise HTTPException(status_code=401, detail="Token missing")
+
+    key = hashlib.sha256(token.encode()).hexdigest()
+    with token_cache_lock:
+        result = token_cache.get(key)
+
+    if result is None:
+        metrics.TOKEN_CACHE_LOOKUPS.labels(result="miss").inc()
+        try:
+            result = await verify_token(token)
+        except HTTPException as e:
+            result = e
+        with token_cache_lock:
+            token_cache[key] = result
+    else:
+        metrics.TOKEN_CACHE_LOOKUPS.labels(result="hit").inc()
+
+    if isinstance(result, HTTPException):
+        raise HTTPException(status_code=result.status_code, detail=result.detail)
+    return result
+
+
+async def verify_token(token: str) -> dict:
     try:
-        signing_key = jwks_client.get_signing_key_from_jwt(token)
+        signing_key = await jwks_client.get_signing_key(token)
         try:
-            jwt.decode(
+            data = jwt.decode(
                 token,
                 signing_key.key,
                 algorithms=["RS256"],
@@ -488,4 +1421,4 @@ def check_token_content(token):
         logger.info(f"Invalid token: {e}")
         raise HTTPException(status_code=401, detail=f"Invalid token: {e}")
     logger.info("Token valid")
-    return None
+    return data